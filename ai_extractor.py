@@ -1,105 +1,467 @@
 import requests
 import json
 import logging
-from config import MISTRAL_API_KEY, MISTRAL_API_URL
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+from config import MISTRAL_API_KEY, MISTRAL_API_URL, MISTRAL_MODEL
+from config import MISTRAL_MAX_CONCURRENCY, MISTRAL_RATE_LIMIT, MISTRAL_TIMEOUT, MISTRAL_MAX_RETRIES
+from config import MISTRAL_BATCH_TOKEN_BUDGET, MISTRAL_BATCH_MAX_EMAILS
+from config import MISTRAL_JSON_MODE, EXTRACTION_REPAIR_ROUNDS, EXTRACTION_MAX_TASKS, MISTRAL_REPLY_LOG
+from extraction_cache import extraction_cache
+from json_repair import parse_json
+from metrics import metrics
+from task_schema import validate_task, fix_fields, complete_task, response_tasks, response_emails
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def extract_task_from_email(email_content):
-    """
-    Extrait les informations de tâche d'un email en utilisant l'API Mistral
-    """
-    if not MISTRAL_API_KEY:
-        logger.error("Clé API Mistral non configurée")
-        return None
+# Statuts HTTP pour lesquels un nouvel essai a du sens
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+# À incrémenter à chaque changement de prompt : invalide le cache d'extraction
+PROMPT_VERSION = '2'
+
+# Tokens comptés par email dans un lot : en-tête "### EMAIL" + objet JSON de réponse
+BATCH_TOKENS_PER_EMAIL = 80
+
+EXTRACTION_RULES = f"""Règles d'extraction :
+- Une tâche par demande distincte (au plus {EXTRACTION_MAX_TASKS}), liste vide si l'email ne demande rien
+- La tâche doit être concise (max 10 mots)
+- Priorité : "haute" pour urgent/délai court, "moyenne" pour normal, "basse" pour non urgent
+- Deadline : extraire la date si mentionnée explicitement
+- Info : contexte supplémentaire utile
+"""
+
+INVALID_JSON_PROMPT = """
+Ta réponse n'est pas un JSON valide. Retourne UNIQUEMENT l'objet JSON demandé, sans aucun texte supplémentaire.
+"""
+
+# Compteurs de lecture des réponses, exposés par /api/extraction-stats
+extraction_stats = {'replies': 0, 'json_valid': 0, 'json_repaired': 0, 'json_failed': 0, 'reask_calls': 0,
+                    'fields_reasked': 0, 'fields_fixed': 0, 'fallback_tasks': 0, 'tasks': 0}
+_stats_lock = threading.Lock()
+_reply_log_lock = threading.Lock()
+
+class TokenBucket:
+    """Limiteur de débit partagé entre threads ; pause() applique un Retry-After à tous"""
+    
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
     
-    prompt = create_prompt(email_content)
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
     
+    def pause(self, seconds):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+_session = None
+_session_lock = threading.Lock()
+rate_limiter = TokenBucket(MISTRAL_RATE_LIMIT) if MISTRAL_RATE_LIMIT > 0 else None
+
+def get_session():
+    """Session HTTP keep-alive partagée, dimensionnée pour le parallélisme configuré"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(MISTRAL_MAX_CONCURRENCY, 1))
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+        return _session
+
+def retry_after_seconds(response):
+    """Lit l'en-tête Retry-After (secondes ou date HTTP)"""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+def call_mistral(payload):
+    """
+    POST vers l'API Mistral avec timeout, limitation de débit et reprises
+    (Retry-After sur 429, sinon backoff exponentiel avec jitter)
+    """
     headers = {
         "Authorization": f"Bearer {MISTRAL_API_KEY}",
         "Content-Type": "application/json"
     }
     
+    for attempt in range(MISTRAL_MAX_RETRIES + 1):
+        if rate_limiter:
+            rate_limiter.acquire()
+        
+        delay = None
+        try:
+            with metrics.timer('llm'):
+                response = get_session().post(MISTRAL_API_URL, headers=headers, json=payload, timeout=MISTRAL_TIMEOUT)
+            metrics.inc('llm_requests', status=response.status_code)
+            if response.status_code not in RETRYABLE_STATUSES:
+                response.raise_for_status()
+                result = response.json()
+                # Consommation déclarée par l'API
+                usage = result.get('usage') or {}
+                metrics.inc('llm_tokens', usage.get('prompt_tokens') or 0, type='prompt')
+                metrics.inc('llm_tokens', usage.get('completion_tokens') or 0, type='completion')
+                return result
+            
+            delay = retry_after_seconds(response)
+            if response.status_code == 429 and delay is not None and rate_limiter:
+                rate_limiter.pause(delay)
+            error = f"HTTP {response.status_code}"
+        except (requests.ConnectionError, requests.Timeout) as e:
+            metrics.inc('llm_requests', status='error')
+            error = str(e)
+        
+        if attempt == MISTRAL_MAX_RETRIES:
+            raise requests.HTTPError(f"Échec de l'appel Mistral après {attempt + 1} essais: {error}")
+        
+        if delay is None:
+            delay = min(30.0, 2 ** attempt) * random.uniform(0.5, 1.5)
+        logger.warning(f"⏳ Mistral indisponible ({error}), nouvel essai dans {delay:.1f}s")
+        time.sleep(delay)
+
+def request_json(messages):
+    """
+    Un appel chat-completions en mode JSON (response_format json_object) ;
+    retourne le texte brut de la réponse
+    """
     payload = {
-        "model": "mistral-small-latest",
-        "messages": [
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ],
+        "model": MISTRAL_MODEL,
+        "messages": messages,
         "temperature": 0.1
     }
+    if MISTRAL_JSON_MODE:
+        payload["response_format"] = {"type": "json_object"}
     
+    result = call_mistral(payload)
+    reply = result['choices'][0]['message']['content']
+    record_reply(reply)
+    return reply
+
+def record_reply(reply):
+    """Ajoute la réponse brute au corpus MISTRAL_REPLY_LOG (mesure du taux de lecture)"""
+    if not MISTRAL_REPLY_LOG:
+        return
+    with _reply_log_lock, open(MISTRAL_REPLY_LOG, 'a', encoding='utf-8') as log:
+        log.write(json.dumps({'model': MISTRAL_MODEL, 'reply': reply}, ensure_ascii=False) + '\n')
+
+def count(name, value=1):
+    with _stats_lock:
+        extraction_stats[name] += value
+
+def read_reply(reply):
+    """JSON strict si possible, sinon lecture tolérante (json_repair) ; None si illisible"""
+    count('replies')
     try:
-        response = requests.post(MISTRAL_API_URL, headers=headers, json=payload)
-        response.raise_for_status()
-        
-        result = response.json()
-        ai_response = result['choices'][0]['message']['content']
-        
-        # Nettoyer la réponse pour extraire le JSON
-        json_str = extract_json_from_response(ai_response)
-        
-        if json_str:
-            task_data = json.loads(json_str)
-            logger.info("Tâche extraite avec succès")
-            return task_data
-        else:
-            logger.error("Impossible d'extraire le JSON de la réponse")
-            return create_fallback_task(email_content)
-            
+        data = json.loads(reply)
+        count('json_valid')
+        return data
+    except ValueError:
+        pass
+    
+    data = parse_json(reply)
+    count('json_repaired' if data is not None else 'json_failed')
+    return data
+
+def run_extraction(prompt, batch=False):
+    """
+    Extraction structurée : appel en mode JSON, lecture tolérante de la réponse,
+    puis au plus EXTRACTION_REPAIR_ROUNDS relances qui ne redemandent que les
+    champs invalides (date non ISO, priorité hors énumération...).
+    Retourne {id de l'email (None hors lot): [tâches]}, ou None si la réponse reste illisible.
+    Les erreurs de l'API du premier appel sont propagées.
+    """
+    messages = [{"role": "user", "content": prompt}]
+    reply = request_json(messages)
+    data = read_reply(reply)
+    
+    if data is None and not batch:
+        # Réponse illisible même réparée : une seule relance sur le format
+        count('reask_calls')
+        messages += [{"role": "assistant", "content": reply}, {"role": "user", "content": INVALID_JSON_PROMPT}]
+        reply = request_json(messages)
+        data = read_reply(reply)
+    
+    if batch:
+        items = response_emails(data)
+    else:
+        tasks = response_tasks(data)
+        items = {None: tasks} if tasks is not None else {}
+    if not items:
+        return None
+    
+    # Brouillons [(champs valides, {champ invalide: raison})] par email
+    drafts = {email_id: [validate_task(item) for item in elements[:EXTRACTION_MAX_TASKS]]
+              for email_id, elements in items.items()}
+    
+    for _ in range(EXTRACTION_REPAIR_ROUNDS):
+        failures = [(email_id, position, field, reason)
+                    for email_id, tasks in drafts.items()
+                    for position, (_, errors) in enumerate(tasks)
+                    for field, reason in errors.items()]
+        if not failures:
+            break
+    
+        count('reask_calls')
+        count('fields_reasked', len(failures))
+        messages += [{"role": "assistant", "content": reply}, {"role": "user", "content": create_repair_prompt(failures)}]
+        try:
+            reply = request_json(messages)
+        except Exception as e:
+            logger.warning(f"Relance des champs invalides impossible: {e}")
+            break
+    
+        corrections = read_reply(reply)
+        corrections = corrections.get('corrections') if isinstance(corrections, dict) else corrections
+        for correction in corrections if isinstance(corrections, list) else []:
+            if not isinstance(correction, dict):
+                continue
+            email_id = str(correction.get('id', '')).strip() if batch else None
+            try:
+                task, errors = drafts[email_id][int(correction.get('index', 0))]
+            except (KeyError, IndexError, TypeError, ValueError):
+                continue
+            count('fields_fixed', len(fix_fields(task, errors, correction)))
+    
+    results = {}
+    for email_id, tasks in drafts.items():
+        results[email_id] = [task for task in (complete_task(task) for task, _ in tasks) if task]
+        count('tasks', len(results[email_id]))
+    return results
+
+def extract_tasks_from_email(email_content, use_cache=True):
+    """
+    Extrait les tâches d'un email (une par demande distincte, liste vide si l'email
+    ne demande rien) en utilisant l'API Mistral.
+    Retourne None si l'API n'a pas pu être appelée : l'email sera repris plus tard.
+    """
+    # Contenu déjà analysé (autre boîte, resynchronisation...) : pas d'appel réseau
+    if use_cache:
+        cached = extraction_cache.get(email_content, MISTRAL_MODEL, PROMPT_VERSION)
+        if cached:
+            logger.info("Tâches trouvées dans le cache d'extraction")
+            return cached['tasks']
+    
+    if not MISTRAL_API_KEY:
+        logger.error("Clé API Mistral non configurée")
+        return None
+    
+    try:
+        results = run_extraction(create_prompt(email_content))
     except Exception as e:
         logger.error(f"Erreur lors de l'appel à l'API Mistral: {e}")
-        return create_fallback_task(email_content)
+        return None
+    
+    if results is None:
+        logger.error("Impossible d'extraire le JSON de la réponse")
+        count('fallback_tasks')
+        metrics.inc('fallback_tasks')
+        return [create_fallback_task(email_content)]
+    
+    tasks = results[None]
+    logger.info(f"{len(tasks)} tâche(s) extraite(s) avec succès")
+    extraction_cache.put(email_content, MISTRAL_MODEL, PROMPT_VERSION, {'tasks': tasks})
+    return tasks
+
+def extract_tasks_concurrently(email_contents, on_result=None, max_workers=MISTRAL_MAX_CONCURRENCY,
+                               token_budget=MISTRAL_BATCH_TOKEN_BUDGET):
+    """
+    Extrait les tâches de plusieurs emails en parallèle (au plus max_workers appels en vol).
+    Avec token_budget > 0, les emails sont regroupés en prompts multi-emails.
+    on_result(index, tâches) est appelé dans le thread appelant, dans l'ordre d'arrivée.
+    Retourne les listes de tâches dans l'ordre des emails (None pour un appel en échec).
+    """
+    results = [None] * len(email_contents)
+    if not email_contents:
+        return results
+    
+    # Les emails déjà en cache ne partent pas chez Mistral
+    misses = []
+    for index, content in enumerate(email_contents):
+        cached = extraction_cache.get(content, MISTRAL_MODEL, PROMPT_VERSION)
+        if cached:
+            results[index] = cached['tasks']
+            if on_result:
+                on_result(index, cached['tasks'])
+        else:
+            misses.append(index)
+    extraction_cache.flush_usage()
+    
+    if token_budget > 0:
+        packed = pack_batches([email_contents[i] for i in misses], token_budget)
+        batches = [[misses[j] for j in batch] for batch in packed]
+    else:
+        batches = [[i] for i in misses]
+    
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='mistral') as executor:
+        futures = [executor.submit(extract_tasks_batch, email_contents, batch) for batch in batches]
+        for future in as_completed(futures):
+            for index, tasks in future.result().items():
+                results[index] = tasks
+                if on_result:
+                    on_result(index, tasks)
+    
+    return results
+
+def estimate_tokens(text):
+    """Estimation grossière (~4 caractères par token), suffisante pour remplir un budget"""
+    return len(text) // 4 + 1
+
+def pack_batches(email_contents, token_budget=MISTRAL_BATCH_TOKEN_BUDGET, max_emails=MISTRAL_BATCH_MAX_EMAILS):
+    """Regroupe les indices d'emails en lots dont le prompt tient dans token_budget"""
+    overhead = estimate_tokens(create_batch_prompt([]))
+    batches = []
+    current, used = [], overhead
+    for index, content in enumerate(email_contents):
+        # Contenu tronqué + en-tête de l'email + réponse attendue pour cet email
+        cost = estimate_tokens(content[:2000]) + BATCH_TOKENS_PER_EMAIL
+        if current and (used + cost > token_budget or len(current) >= max_emails):
+            batches.append(current)
+            current, used = [], overhead
+        current.append(index)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+def extract_tasks_batch(email_contents, indices):
+    """
+    Extrait les tâches d'un lot d'emails en un seul appel.
+    Les emails absents de la réponse (ou réponse illisible) sont repris un par un.
+    Retourne {index: tâches}.
+    """
+    if len(indices) == 1 or not MISTRAL_API_KEY:
+        return {index: extract_tasks_from_email(email_contents[index], use_cache=False) for index in indices}
+    
+    ids = {f"E{index}": index for index in indices}
+    results = {}
+    try:
+        extracted = run_extraction(create_batch_prompt([(email_id, email_contents[index])
+                                                        for email_id, index in ids.items()]), batch=True)
+        for email_id, tasks in (extracted or {}).items():
+            index = ids.get(email_id)
+            if index is not None:
+                results[index] = tasks
+                extraction_cache.put(email_contents[index], MISTRAL_MODEL, PROMPT_VERSION, {'tasks': tasks})
+        logger.info(f"Lot de {len(indices)} emails : {len(results)} emails analysés")
+    except Exception as e:
+        logger.error(f"Erreur lors de l'appel groupé à l'API Mistral: {e}")
+    
+    # Reprise individuelle des emails dont l'élément n'a pas pu être lu
+    for index in indices:
+        if index not in results:
+            logger.warning(f"Email E{index} absent ou invalide dans la réponse groupée, nouvel essai seul")
+            results[index] = extract_tasks_from_email(email_contents[index], use_cache=False)
+    
+    return results
+
+def get_extraction_stats():
+    """Compteurs de lecture des réponses (JSON valide, réparé, illisible), relances et tâches de secours"""
+    with _stats_lock:
+        stats = dict(extraction_stats)
+    parsed = stats['json_valid'] + stats['json_repaired']
+    stats['parse_success_rate'] = round(parsed / stats['replies'], 3) if stats['replies'] else 0.0
+    return stats
 
 def create_prompt(email_content):
     """
     Crée le prompt optimisé pour l'extraction de tâches
     """
     return f"""
-Analyse le contenu de cet email et extrais les informations de tâche. 
+Analyse le contenu de cet email et extrais les tâches demandées.
 Retourne UNIQUEMENT un objet JSON valide sans aucun texte supplémentaire.
 
 Format JSON requis :
 {{
-    "tache": "description courte et précise de la tâche",
-    "priorite": "basse, moyenne ou haute",
-    "deadline": "date au format YYYY-MM-DD si présente, sinon null",
-    "info": "informations complémentaires importantes"
+    "tasks": [
+        {{
+            "tache": "description courte et précise de la tâche",
+            "priorite": "basse, moyenne ou haute",
+            "deadline": "date au format YYYY-MM-DD si présente, sinon null",
+            "info": "informations complémentaires importantes"
+        }}
+    ]
 }}
 
-Règles d'extraction :
-- La tâche doit être concise (max 10 mots)
-- Priorité : "haute" pour urgent/délai court, "moyenne" pour normal, "basse" pour non urgent
-- Deadline : extraire la date si mentionnée explicitement
-- Info : contexte supplémentaire utile
-
+{EXTRACTION_RULES}
 Contenu de l'email :
 {email_content[:2000]}  # Limite pour éviter les tokens excessifs
 
 Réponse JSON :
 """
 
-def extract_json_from_response(text):
+def create_batch_prompt(items):
     """
-    Extrait le JSON de la réponse texte de l'IA
+    Crée un prompt unique pour plusieurs emails ; items = [(id, contenu), ...]
     """
-    try:
-        # Chercher le début et la fin du JSON
-        start = text.find('{')
-        end = text.rfind('}') + 1
-        
-        if start != -1 and end != 0:
-            json_str = text[start:end]
-            # Valider que c'est du JSON valide
-            json.loads(json_str)
-            return json_str
-    except:
-        pass
-    
-    return None
+    emails = "\n".join(f"### EMAIL {email_id}\n{content[:2000]}\n" for email_id, content in items)
+    return f"""
+Analyse chacun des emails ci-dessous et extrais pour chacun les tâches demandées.
+Retourne UNIQUEMENT un objet JSON valide, avec exactement une entrée par email, sans aucun texte supplémentaire.
+
+Format JSON requis :
+{{
+    "emails": [
+        {{
+            "id": "identifiant de l'email (ex: E12)",
+            "tasks": [
+                {{
+                    "tache": "description courte et précise de la tâche",
+                    "priorite": "basse, moyenne ou haute",
+                    "deadline": "date au format YYYY-MM-DD si présente, sinon null",
+                    "info": "informations complémentaires importantes"
+                }}
+            ]
+        }}
+    ]
+}}
+
+{EXTRACTION_RULES}
+Emails :
+{emails}
+Réponse JSON :
+"""
+
+def create_repair_prompt(failures):
+    """
+    Relance limitée aux champs invalides ; failures = [(id de l'email ou None, position de la tâche, champ, raison)]
+    """
+    lines = "\n".join(f"- {f'email {email_id}, ' if email_id else ''}tâche {position}, champ \"{field}\" : {reason}"
+                      for email_id, position, field, reason in failures)
+    example = '{"id": "E12", "index": 0, "deadline": "2025-03-14"}' if failures[0][0] else '{"index": 0, "deadline": "2025-03-14"}'
+    return f"""
+Certains champs de ta réponse sont invalides :
+{lines}
+
+Retourne UNIQUEMENT un objet JSON contenant la valeur corrigée de ces seuls champs, par exemple :
+{{"corrections": [{example}]}}
+"priorite" vaut basse, moyenne ou haute ; "deadline" est une date YYYY-MM-DD ou null.
+"""
 
 def create_fallback_task(email_content):
     """
@@ -114,4 +476,4 @@ def create_fallback_task(email_content):
         "priorite": "moyenne",
         "deadline": None,
         "info": "Extraction automatique (mode fallback)"
-    }
\ No newline at end of file
+    }
@@ -1,82 +1,188 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import Blueprint, Flask, render_template, request, redirect, url_for, flash, jsonify, Response
+from flask import stream_with_context
+import csv
+import io
 import json
-from datetime import datetime
+import os
+import sqlite3
+from datetime import datetime, timezone
 
-from email_reader import EmailReader
-from ai_extractor import extract_task_from_email
-from database import init_db, add_task, get_tasks, mark_task_done, delete_task, task_exists
-from database import is_email_processed, mark_email_processed, clear_processed_emails, get_processed_emails_count
-from config import KEYWORDS
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup, escape
+from werkzeug.http import is_resource_modified
+from database import ensure_db, add_task, mark_task_done, delete_task, search_tasks, SNIPPET_START, SNIPPET_END
+from database import list_tasks, count_tasks, get_table_version, get_last_task_change, TASK_SORTS
+from database import iter_tasks, import_tasks, TASK_EXPORT_FIELDS
+from database import get_accounts, add_account
+from database import clear_processed_emails, get_processed_emails_count, get_sync_job, get_sync_runs
+from sync_jobs import get_job_runner, job_events, dashboard_events
+from extraction_cache import extraction_cache
+from dashboard_cache import dashboard_cache
+from metrics import metrics
+from config import KEYWORDS, IMAP_IDLE_ENABLED, TEMPLATE_BYTECODE_CACHE, TEMPLATE_CACHE_DIR
+from mail2tasks import configure_logging
 
-app = Flask(__name__)
-app.secret_key = 'mail2tasks_secret_key_2024'
+# Routes de l'application, enregistrées par create_app()
+bp = Blueprint('main', __name__)
 
-# Initialisation de la base de données au démarrage
-init_db()
+def create_app(idle=False):
+    """
+    Fabrique de l'application : rien n'est ouvert à l'import, la base est initialisée
+    à la première requête et le pipeline (IMAP, IA) à la première synchronisation.
+    idle=True démarre aussi l'écoute IMAP IDLE : à réserver à un seul processus
+    (sinon une session IDLE et une synchronisation par worker)
+    """
+    configure_logging()
+    app = Flask(__name__)
+    app.secret_key = 'mail2tasks_secret_key_2024'
+    if TEMPLATE_BYTECODE_CACHE:
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(TEMPLATE_CACHE_DIR)
+    app.register_blueprint(bp)
+    if idle:
+        start_idle_listener()
+    return app
 
-@app.route('/')
+def start_idle_listener():
+    """IDLE : synchronisation en arrière-plan dès que le serveur annonce un nouvel email"""
+    from sync_pipeline import get_reader
+    get_reader().start_idle(sync_on_new_mail)
+
+def sync_on_new_mail():
+    ensure_db()
+    get_job_runner().submit()
+
+@bp.before_app_request
+def prepare_database():
+    ensure_db()
+
+def parse_task_query(args):
+    """Filtres, tri et curseur (?after=<valeur de tri>,<id>) communs à / et /api/tasks"""
+    sort = args.get('sort', 'created')
+    if sort not in TASK_SORTS:
+        raise ValueError(f"Tri inconnu: {sort}")
+    after = args.get('after')
+    if after:
+        value, _, task_id = after.rpartition(',')
+        if not value:
+            raise ValueError("Curseur invalide")
+        after = (value, int(task_id))
+    return {
+        'status': args.get('status', 'open'),
+        'priorities': [p for p in args.get('priorite', '').split(',') if p] or None,
+        'deadline_from': args.get('deadline_from') or None,
+        'deadline_to': args.get('deadline_to') or None,
+        'sort': sort,
+        'after': after,
+        'limit': min(max(int(args.get('limit', 50)), 1), 500),
+        'account_id': int(args['account']) if args.get('account') else None,
+    }
+
+def next_page_url(endpoint, next_cursor):
+    """URL de la page suivante (mêmes filtres, curseur après la dernière tâche)"""
+    if next_cursor is None:
+        return None
+    args = request.args.to_dict()
+    args['after'] = f"{next_cursor[0]},{next_cursor[1]}"
+    return url_for(endpoint, **args)
+
+@bp.route('/')
 def index():
     """Page principale - liste des tâches"""
-    tasks = get_tasks(include_done=False)
-    processed_count = get_processed_emails_count()
-    return render_template('index.html', tasks=tasks, keywords=KEYWORDS, processed_count=processed_count)
+    try:
+        query = parse_task_query(request.args)
+    except ValueError:
+        query = parse_task_query({})
+    # Tant que la version des données ne bouge pas, la vue est servie depuis la mémoire
+    view = dashboard_cache.get(query, lambda: build_dashboard_view(query))
+    # Insertion en direct des nouvelles tâches seulement sur la première page de la vue par défaut
+    live_insert = not query['after'] and query['sort'] == 'created' and not any(
+        query[key] for key in ('priorities', 'deadline_from', 'deadline_to', 'account_id'))
+    return render_template('index.html', tasks=view['tasks'], task_cards=view['task_cards'], keywords=KEYWORDS,
+                           processed_count=view['processed_count'], task_count=view['task_count'],
+                           next_url=next_page_url('main.index', view['next_cursor']), status=query['status'],
+                           last_change=view['last_change'], live_insert=live_insert)
+
+def build_dashboard_view(query):
+    """Données et cartes rendues d'une page du tableau de bord (mises en cache par dashboard_cache)"""
+    # Lu avant les tâches : les modifications concurrentes sont rejouées par /events
+    last_change = get_last_task_change()
+    tasks, next_cursor = list_tasks(**query)
+    return {
+        'tasks': tasks,
+        'next_cursor': next_cursor,
+        'task_cards': Markup(render_template('task_cards.html', tasks=tasks)),
+        'task_count': count_tasks(query['status']),
+        'processed_count': get_processed_emails_count(),
+        'last_change': last_change,
+    }
+
+def render_task_card(task):
+    """Carte HTML d'une tâche, identique à celle du rendu complet de la page"""
+    return render_template('task_card.html', task=task)
 
-@app.route('/sync')
+@bp.route('/events')
+def dashboard_event_stream():
+    """
+    Deltas des tâches (ajout, modification, terminée, suppression) et avancement de la
+    synchronisation en server-sent events, à partir de ?after=<numéro> ou de Last-Event-ID ;
+    ?job=<id> suit aussi ce job s'il est déjà terminé
+    """
+    after = request.headers.get('Last-Event-ID', type=int)
+    if after is None:
+        after = request.args.get('after', type=int)
+    if after is None:
+        after = get_last_task_change()
+    job_id = request.args.get('job', type=int)
+    return Response(stream_with_context(dashboard_events(after, job_id=job_id, render_task=render_task_card)),
+                    mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@bp.route('/sync')
 def sync_emails():
-    """Synchronisation avec les emails"""
+    """Synchronisation avec les emails (lancée en arrière-plan)"""
     try:
-        # Créer une instance de EmailReader
-        reader = EmailReader()
-        emails = reader.search_emails(mark_as_read=True)
-        
-        tasks_added = 0
-        emails_processed = 0
-        emails_skipped = 0
-        
-        for email_msg in emails:
-            # Vérifier si cet email a déjà été traité
-            if is_email_processed(email_msg['subject'], email_msg['body']):
-                emails_skipped += 1
-                continue
-            
-            # Combiner sujet et corps pour l'analyse
-            email_content = f"Sujet: {email_msg['subject']}\n\nCorps: {email_msg['body']}"
-            
-            # Extraire la tâche avec l'IA
-            task_data = extract_task_from_email(email_content)
-            
-            if task_data:
-                # Vérifier si la tâche existe déjà (basé sur le texte)
-                if not task_exists(task_data['tache'], task_data['deadline']):
-                    add_task(
-                        tache=task_data['tache'],
-                        priorite=task_data['priorite'],
-                        deadline=task_data['deadline'],
-                        info=task_data['info']
-                    )
-                    tasks_added += 1
-                
-                # Marquer l'email comme traité (même si la tâche existait déjà)
-                mark_email_processed(email_msg['subject'], email_msg['body'])
-                emails_processed += 1
-        
-        # Messages selon le résultat
-        if tasks_added > 0:
-            flash(f'✅ {tasks_added} nouvelles tâches ajoutées! ({emails_processed} emails traités)', 'success')
-        else:
-            if emails_processed > 0:
-                flash(f'ℹ️ Aucune nouvelle tâche trouvée ({emails_processed} emails analysés)', 'info')
-            elif emails_skipped > 0:
-                flash(f'🔁 Tous les emails ont déjà été traités ({emails_skipped} emails ignorés)', 'info')
-            else:
-                flash('📭 Aucun email à traiter', 'info')
-            
+        job_id = get_job_runner().submit()
+        flash('🔄 Synchronisation lancée en arrière-plan...', 'info')
+        return redirect(url_for('main.index', job=job_id))
     except Exception as e:
         flash(f'❌ Erreur lors de la synchronisation: {str(e)}', 'error')
     
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
+
+@bp.route('/api/sync', methods=['POST'])
+def api_start_sync():
+    """Lance une synchronisation et retourne l'id du job"""
+    job_id = get_job_runner().submit()
+    return jsonify({
+        'job_id': job_id,
+        'status_url': url_for('main.api_sync_status', job_id=job_id),
+        'events_url': url_for('main.api_sync_events', job_id=job_id)
+    }), 202
+
+@bp.route('/api/sync/<int:job_id>')
+def api_sync_status(job_id):
+    """Avancement, compteurs et erreurs d'une synchronisation"""
+    job = get_sync_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Synchronisation introuvable'}), 404
+    return jsonify(job)
 
-@app.route('/add', methods=['GET', 'POST'])
+@bp.route('/api/sync/<int:job_id>/events')
+def api_sync_events(job_id):
+    """Avancement d'une synchronisation en server-sent events"""
+    return Response(stream_with_context(job_events(job_id)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@bp.route('/api/sync/runs')
+def api_sync_runs():
+    """Résumés des dernières synchronisations : compteurs, tokens et durée de chaque étape"""
+    return jsonify(get_sync_runs(min(max(request.args.get('limit', 50, type=int), 1), 500)))
+
+@bp.route('/metrics')
+def prometheus_metrics():
+    """Métriques du pipeline au format texte Prometheus"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@bp.route('/add', methods=['GET', 'POST'])
 def add_task_manual():
     """Ajout manuel d'une tâche"""
     if request.method == 'POST':
@@ -92,13 +198,13 @@ def add_task_manual():
         try:
             add_task(tache, priorite, deadline, info)
             flash('Tâche ajoutée avec succès!', 'success')
-            return redirect(url_for('index'))
+            return redirect(url_for('main.index'))
         except Exception as e:
             flash(f'Erreur lors de l\'ajout: {str(e)}', 'error')
     
     return render_template('add_task.html')
 
-@app.route('/delete/<int:task_id>')
+@bp.route('/delete/<int:task_id>')
 def delete_task_route(task_id):
     """Suppression d'une tâche"""
     try:
@@ -107,9 +213,9 @@ def delete_task_route(task_id):
     except Exception as e:
         flash(f'Erreur lors de la suppression: {str(e)}', 'error')
     
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
-@app.route('/done/<int:task_id>')
+@bp.route('/done/<int:task_id>')
 def mark_task_done_route(task_id):
     """Marquer une tâche comme terminée"""
     try:
@@ -118,15 +224,185 @@ def mark_task_done_route(task_id):
     except Exception as e:
         flash(f'Erreur: {str(e)}', 'error')
     
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
+
+@bp.route('/api/tasks/<int:task_id>/done', methods=['POST'])
+def api_mark_task_done(task_id):
+    """Marque une tâche comme terminée (le tableau de bord retire la carte sans recharger)"""
+    if not mark_task_done(task_id):
+        return jsonify({'error': 'Tâche introuvable'}), 404
+    return jsonify({'id': task_id, 'status': 1})
+
+@bp.route('/api/tasks/<int:task_id>', methods=['DELETE'])
+def api_delete_task(task_id):
+    """Supprime une tâche"""
+    if not delete_task(task_id):
+        return jsonify({'error': 'Tâche introuvable'}), 404
+    return jsonify({'id': task_id, 'deleted': True})
 
-@app.route('/api/tasks')
+@bp.route('/api/tasks')
 def api_tasks():
-    """API pour récupérer les tâches (format JSON)"""
-    tasks = get_tasks(include_done=False)
-    return jsonify(tasks)
+    """
+    API pour récupérer les tâches (format JSON), paginée par curseur :
+    ?status=open|done|all&priorite=haute,moyenne&deadline_from=&deadline_to=&account=<id>
+    &sort=created|deadline&after=<curseur>&limit=. Page suivante dans l'en-tête Link.
+    """
+    try:
+        query = parse_task_query(request.args)
+    except ValueError as e:
+        return jsonify({'error': f"Paramètre invalide: {e}"}), 400
+    
+    # ETag / Last-Modified issus du compteur de modifications : 304 sans lire les tâches.
+    # Si le client envoie If-None-Match, seul l'ETag compte (RFC 9110 §13.1.3) : la date,
+    # à la seconde près, manquerait une écriture survenue dans la même seconde.
+    version, updated_at = get_table_version('tasks')
+    etag = f"tasks-{version}"
+    last_modified = datetime.fromtimestamp(updated_at, timezone.utc)
+    compare_date = None if 'If-None-Match' in request.headers else last_modified
+    
+    if not is_resource_modified(request.environ, etag=etag, last_modified=compare_date):
+        response = Response(status=304)
+    else:
+        tasks, next_cursor = list_tasks(**query)
+        response = jsonify(tasks)
+        next_url = next_page_url('main.api_tasks', next_cursor)
+        if next_url:
+            response.headers['Link'] = f'<{next_url}>; rel="next"'
+            response.headers['X-Next-Cursor'] = f"{next_cursor[0]},{next_cursor[1]}"
+    
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response
+
+@bp.route('/api/tasks/search')
+def api_search_tasks():
+    """Recherche plein texte (préfixes, classement BM25, extraits surlignés)"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Paramètre q obligatoire'}), 400
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    include_done = request.args.get('include_done', '').lower() in ('1', 'true', 'yes')
+    
+    results = search_tasks(query, limit=limit, include_done=include_done)
+    for result in results:
+        # Extrait échappé, seuls les termes trouvés sont entourés de <mark>
+        snippet = str(escape(result['snippet'] or ''))
+        result['snippet'] = snippet.replace(SNIPPET_START, '<mark>').replace(SNIPPET_END, '</mark>')
+    return jsonify({'query': query, 'count': len(results), 'results': results})
+
+EXPORT_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+def export_lines(export_format, tasks):
+    """Lignes NDJSON ou CSV produites au fil de l'itération (rien n'est accumulé)"""
+    if export_format == 'ndjson':
+        for task in tasks:
+            yield json.dumps(task, ensure_ascii=False) + '\n'
+        return
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=TASK_EXPORT_FIELDS)
+    writer.writeheader()
+    for count, task in enumerate(tasks, start=1):
+        writer.writerow(task)
+        if count % 500 == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+# Caractère de remplacement des octets non décodables
+UNDECODABLE = '\ufffd'
+
+def import_rows(import_format, stream):
+    """
+    Dictionnaires lus ligne à ligne dans le flux envoyé (NDJSON ou CSV). Les octets
+    qui ne sont pas de l'UTF-8 (export Latin-1...) rendent seulement leur ligne
+    invalide : None, compté comme erreur par import_tasks, sans arrêter l'import.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', errors='replace', newline='')
+    if import_format == 'csv':
+        for row in csv.DictReader(text):
+            yield None if any(UNDECODABLE in str(value) for value in row.values()) else row
+        return
+    for line in text:
+        if not line.strip():
+            continue
+        if UNDECODABLE in line:
+            yield None
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            # Ligne invalide : comptée comme erreur par import_tasks
+            yield None
+
+@bp.route('/api/tasks/export')
+def api_export_tasks():
+    """Export en flux de toutes les tâches : ?format=ndjson|csv&status=all|open|done"""
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f"Format inconnu: {export_format}"}), 400
+    tasks = iter_tasks(request.args.get('status', 'all'))
+    filename = f"tasks-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{export_format}"
+    return Response(stream_with_context(export_lines(export_format, tasks)), mimetype=EXPORT_FORMATS[export_format],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+@bp.route('/api/tasks/import', methods=['POST'])
+def api_import_tasks():
+    """
+    Import de tâches (?format=ndjson|csv), en fichier multipart (champ file) ou
+    en corps brut. Lu et inséré par paquets ; les tâches déjà présentes sont ignorées.
+    """
+    import_format = request.args.get('format', 'ndjson')
+    if import_format not in EXPORT_FORMATS:
+        return jsonify({'error': f"Format inconnu: {import_format}"}), 400
+    upload = request.files.get('file')
+    stream = upload.stream if upload else request.stream
+    stats = import_tasks(import_rows(import_format, stream))
+    return jsonify(stats)
+
+@bp.route('/api/accounts', methods=['GET', 'POST'])
+def api_accounts():
+    """
+    Comptes IMAP synchronisés. POST {name, imap_server, imap_port, email_address,
+    password_env, use_ssl, folders, max_connections} ; le mot de passe est lu dans
+    la variable d'environnement password_env, jamais transmis ni stocké
+    """
+    if request.method == 'POST':
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Corps JSON attendu : un objet {name, imap_server, ...}'}), 400
+        name = str(data.pop('name', '')).strip()
+        if not name:
+            return jsonify({'error': 'Paramètre name obligatoire'}), 400
+        if 'password' in data:
+            return jsonify({'error': 'Le mot de passe se configure par variable d\'environnement (password_env)'}), 400
+        try:
+            account_id = add_account(name, **data)
+        except sqlite3.IntegrityError:
+            return jsonify({'error': f"Le compte {name} existe déjà"}), 409
+        except ValueError as e:
+            return jsonify({'error': f"Paramètre invalide: {e}"}), 400
+        return jsonify({'id': account_id}), 201
+    return jsonify(get_accounts())
+
+@bp.route('/api/extraction-cache')
+def api_extraction_cache():
+    """Compteurs du cache d'extraction IA (hits mémoire/SQLite, misses, tailles)"""
+    return jsonify(extraction_cache.get_stats())
+
+@bp.route('/api/dashboard-cache')
+def api_dashboard_cache():
+    """Compteurs du cache du tableau de bord (hits, misses, invalidations, version des données)"""
+    return jsonify(dashboard_cache.get_stats())
 
-@app.route('/debug-email')
+@bp.route('/api/extraction-stats')
+def api_extraction_stats():
+    """Lecture des réponses IA : JSON valide, réparé ou illisible, relances et tâches de secours"""
+    from ai_extractor import get_extraction_stats
+    return jsonify(get_extraction_stats())
+
+@bp.route('/debug-email')
 def debug_email():
     """Route pour debugger la connexion email"""
     from email_reader import debug_email_connection_imaplib
@@ -140,9 +416,9 @@ def debug_email():
     except Exception as e:
         flash(f'💥 Erreur lors du debug: {str(e)}', 'error')
     
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
-@app.route('/reset-processed')
+@bp.route('/reset-processed')
 def reset_processed_emails():
     """Réinitialise la liste des emails traités"""
     try:
@@ -151,17 +427,24 @@ def reset_processed_emails():
     except Exception as e:
         flash(f'❌ Erreur lors de la réinitialisation: {str(e)}', 'error')
     
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
-@app.errorhandler(404)
+@bp.app_errorhandler(404)
 def not_found(error):
     flash('Page non trouvée', 'error')
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
-@app.errorhandler(500)
+@bp.app_errorhandler(500)
 def internal_error(error):
     flash('Erreur interne du serveur', 'error')
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
+
+# Application par défaut (flask run, gunicorn app:app) ; sa création ne touche ni à la
+# base ni à IMAP. En production, IDLE tourne dans un processus dédié : python -m mail2tasks idle
+app = create_app()
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    # IDLE dans le seul processus enfant du rechargement automatique, qui sert les requêtes
+    if IMAP_IDLE_ENABLED and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_idle_listener()
+    app.run(debug=True, host='0.0.0.0', port=5000)
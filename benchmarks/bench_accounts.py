@@ -0,0 +1,88 @@
+"""
+Benchmark de la relève multi-comptes : plusieurs serveurs IMAP locaux avec
+latence réseau simulée, des boîtes de tailles inégales et plusieurs dossiers
+par compte. Compare une relève séquentielle (un worker, comme l'ancienne boîte
+unique répétée) au SyncScheduler parallèle, et à la seule boîte la plus chargée.
+
+    python benchmarks/bench_accounts.py --accounts 12 --folders 3 --emails 40 --latency 0.02
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_imap import FakeIMAPServer
+
+
+def make_email(account, folder, index):
+    return (f"Subject: Rapport urgent {account}-{folder}-{index}\r\nFrom: equipe@example.com\r\n"
+            f"Message-ID: <a{account}.{folder}.{index}@example.com>\r\n\r\n"
+            f"Merci de preparer le rapport {index} avant vendredi, c'est urgent.\r\n").encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--accounts', type=int, default=12)
+    parser.add_argument('--folders', type=int, default=3, help="dossiers par compte")
+    parser.add_argument('--emails', type=int, default=40, help="emails par dossier du compte le plus chargé")
+    parser.add_argument('--latency', type=float, default=0.02, help="délai par commande IMAP (s)")
+    parser.add_argument('--max-connections', type=int, default=2, help="sessions IMAP par compte")
+    args = parser.parse_args()
+
+    os.environ.update(BENCH_IMAP_PASSWORD='secret', INITIAL_SYNC_LIMIT='1000000', SYNC_MAX_EMAILS='0')
+    import database
+    import sync_pipeline
+    from sync_scheduler import SyncScheduler
+
+    rng = random.Random(42)
+    folders = ['INBOX'] + [f'Projets{i}' for i in range(1, args.folders)]
+    servers = []
+    for account in range(args.accounts):
+        server = FakeIMAPServer(latency=args.latency).start()
+        # Un compte chargé, les autres avec 10 à 50 % de son volume
+        count = args.emails if account == 0 else max(1, int(args.emails * rng.uniform(0.1, 0.5)))
+        for folder in folders:
+            for index in range(count):
+                server.append(make_email(account, folder, index), mailbox=folder)
+        servers.append(server)
+
+    def setup(selection):
+        database.DATABASE_NAME = os.path.join(tempfile.mkdtemp(), 'accounts.db')
+        database.init_db()
+        ids = [database.add_account(f'compte{i}', imap_server='127.0.0.1', imap_port=servers[i].port,
+                                    email_address='test@example.com', password_env='BENCH_IMAP_PASSWORD',
+                                    use_ssl=False, folders=folders, max_connections=args.max_connections)
+               for i in selection]
+        return [database.get_account(account_id) for account_id in ids]
+
+    def run(selection, workers):
+        # Base neuve : pas de watermark, chaque relève reprend toutes les boîtes
+        accounts = setup(selection)
+        start = time.perf_counter()
+        emails, _ = sync_pipeline.fetch_accounts(accounts, scheduler=SyncScheduler(workers))
+        return {'fetch_s': round(time.perf_counter() - start, 2), 'emails': len(emails)}
+
+    sequential = run(range(args.accounts), workers=1)
+    parallel = run(range(args.accounts), workers=args.accounts * args.max_connections)
+    busiest = run([0], workers=args.max_connections)
+
+    print(json.dumps({
+        'accounts': args.accounts,
+        'folders_per_account': args.folders,
+        'latency_s': args.latency,
+        'sequential': sequential,
+        'parallel': parallel,
+        'busiest_account_alone': busiest,
+        'speedup': round(sequential['fetch_s'] / parallel['fetch_s'], 1),
+        'parallel_vs_busiest': round(parallel['fetch_s'] / busiest['fetch_s'], 2),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark des prompts multi-emails contre le mock Mistral local :
+nombre de requêtes, tokens consommés et temps total, un email par appel
+contre des lots remplis jusqu'au budget de tokens.
+
+    python benchmarks/bench_batch.py --emails 200 --latency 0.5 --budget 6000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_mistral import MockMistralServer
+from bench_extraction import make_emails
+
+
+def run(ai_extractor, server, emails, concurrency, budget):
+    before = dict(server.stats)
+    start = time.perf_counter()
+    results = ai_extractor.extract_tasks_concurrently(emails, max_workers=concurrency, token_budget=budget)
+    elapsed = time.perf_counter() - start
+    delta = {key: server.stats[key] - before[key] for key in before}
+    return {
+        'wall_s': round(elapsed, 3),
+        'requests': delta['requests'],
+        'prompt_tokens': delta['prompt_tokens'],
+        'completion_tokens': delta['completion_tokens'],
+        'missing_results': sum(1 for r in results if r is None),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--emails', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.5)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--budget', type=int, default=6000)
+    parser.add_argument('--drop-rate', type=float, default=0.0, help="part des éléments omis par le mock dans un lot")
+    args = parser.parse_args()
+
+    server = MockMistralServer(latency=args.latency, drop_rate=args.drop_rate).start()
+    os.environ.update({
+        'MISTRAL_API_URL': server.url,
+        'MISTRAL_API_KEY': 'bench',
+        'MISTRAL_RATE_LIMIT': '0',
+        # Chaque passe mesure de vrais appels : pas de réponse servie par le cache d'extraction
+        'EXTRACTION_CACHE_ENABLED': 'false',
+    })
+    import ai_extractor
+    import database
+
+    # Base jetable, jamais la tasks.db du dépôt
+    database.DATABASE_NAME = os.path.join(tempfile.mkdtemp(), 'extraction.db')
+    database.init_db()
+
+    emails = make_emails(args.emails)
+    single = run(ai_extractor, server, emails, args.concurrency, 0)
+    batch = run(ai_extractor, server, emails, args.concurrency, args.budget)
+
+    total = lambda r: r['prompt_tokens'] + r['completion_tokens']
+    print(json.dumps({
+        'emails': args.emails,
+        'latency': args.latency,
+        'budget': args.budget,
+        'single': single,
+        'batch': batch,
+        'request_reduction': round(1 - batch['requests'] / single['requests'], 3),
+        'token_reduction': round(1 - total(batch) / total(single), 3),
+        'speedup': round(single['wall_s'] / batch['wall_s'], 2),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
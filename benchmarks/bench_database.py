@@ -0,0 +1,132 @@
+"""
+Benchmark de la couche SQLite : une connexion par appel en journal
+"rollback" (comportement historique) contre les connexions par thread
+en WAL avec pragmas et requêtes préparées en cache.
+
+Écritures : le chemin d'une synchronisation (is_email_processed, task_exists,
+add_task, mark_email_processed par email), puis ingest_batch (un lot par
+transaction) pour la couche partagée. Lectures : des threads "tableau
+de bord" appellent get_tasks pendant qu'une synchronisation écrit.
+
+    python benchmarks/bench_database.py --emails 2000 --readers 4
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+
+def legacy_connection():
+    """Une connexion neuve à chaque appel, fermée quand la fonction la relâche"""
+    return sqlite3.connect(database.DATABASE_NAME)
+
+
+def sync_writes(count, offset=0):
+    for i in range(offset, offset + count):
+        subject, body = f"Devis {i}", f"Merci de valider le devis numéro {i} avant vendredi."
+        if database.is_email_processed(subject, body):
+            continue
+        if not database.task_exists(f"Valider le devis {i}", '2025-01-31'):
+            database.add_task(f"Valider le devis {i}", 'haute', '2025-01-31', body)
+        database.mark_email_processed(subject, body)
+
+
+def bulk_writes(count, batch_size, offset):
+    for start in range(offset, offset + count, batch_size):
+        database.ingest_batch([
+            {'subject': f"Devis {i}", 'body': f"Merci de valider le devis numéro {i} avant vendredi.",
+             'tasks': [{'tache': f"Valider le devis {i}", 'priorite': 'haute', 'deadline': '2025-01-31', 'info': ''}]}
+            for i in range(start, min(start + batch_size, offset + count))
+        ])
+
+
+def run(mode, emails, readers, duration_s, batch_size):
+    directory = tempfile.mkdtemp()
+    database.DATABASE_NAME = os.path.join(directory, 'bench.db')
+    database.close_connection()
+    if mode == 'legacy':
+        database.get_connection = legacy_connection
+        sqlite3.connect(database.DATABASE_NAME).execute('PRAGMA journal_mode = DELETE').close()
+    database.init_db()
+
+    start = time.perf_counter()
+    sync_writes(emails)
+    write_s = time.perf_counter() - start
+
+    # Lectures concurrentes pendant une seconde synchronisation
+    stop = threading.Event()
+    reads, errors = [0] * readers, [0] * readers
+
+    def reader(slot):
+        while not stop.is_set():
+            try:
+                database.get_tasks()
+                reads[slot] += 1
+            except sqlite3.OperationalError:
+                errors[slot] += 1
+
+    threads = [threading.Thread(target=reader, args=(slot,)) for slot in range(readers)]
+    for thread in threads:
+        thread.start()
+    start = time.perf_counter()
+    sync_writes(emails // 4, offset=emails)
+    mixed_write_s = time.perf_counter() - start
+    time.sleep(max(0.0, duration_s - mixed_write_s))
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = max(duration_s, mixed_write_s)
+
+    result = {
+        'sync_write_s': round(write_s, 3),
+        'sync_emails_per_s': round(emails / write_s),
+        'mixed_write_s': round(mixed_write_s, 3),
+        'dashboard_reads_per_s': round(sum(reads) / elapsed, 1),
+        'locked_errors': sum(errors),
+    }
+    if mode == 'pooled':
+        # Base neuve pour comparer avec sync_write_s à volume égal
+        database.DATABASE_NAME = os.path.join(directory, 'bulk.db')
+        database.init_db()
+        start = time.perf_counter()
+        bulk_writes(emails, batch_size, offset=0)
+        bulk_s = time.perf_counter() - start
+        result['bulk_write_s'] = round(bulk_s, 3)
+        result['bulk_emails_per_s'] = round(emails / bulk_s)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--emails', type=int, default=2000)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=3.0, help="durée minimale de la phase mixte (s)")
+    parser.add_argument('--batch-size', type=int, default=25, help="emails par appel à ingest_batch")
+    args = parser.parse_args()
+
+    pooled_connection = database.get_connection
+    pooled = run('pooled', args.emails, args.readers, args.duration, args.batch_size)
+    legacy = run('legacy', args.emails, args.readers, args.duration, args.batch_size)
+    database.get_connection = pooled_connection
+
+    print(json.dumps({
+        'emails': args.emails,
+        'readers': args.readers,
+        'legacy': legacy,
+        'pooled': pooled,
+        'write_speedup': round(legacy['sync_write_s'] / pooled['sync_write_s'], 2),
+        'bulk_speedup': round(legacy['sync_write_s'] / pooled['bulk_write_s'], 2),
+        'read_speedup': round(pooled['dashboard_reads_per_s'] / max(legacy['dashboard_reads_per_s'], 0.1), 2),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
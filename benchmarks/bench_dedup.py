@@ -0,0 +1,94 @@
+"""
+Benchmark de la déduplication des emails traités sur une grosse table :
+ancienne recherche (sujet + hash du corps, sans index, une requête par email)
+contre la clé Message-ID indexée et filter_unprocessed (une requête par lot).
+Mesure aussi la durée de la migration des lignes existantes.
+
+    python benchmarks/bench_dedup.py --rows 1000000 --batch 200
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+
+def legacy_is_processed(conn, subject, body):
+    body_hash = hashlib.md5(body.encode('utf-8')).hexdigest()
+    cursor = conn.execute('''
+        SELECT COUNT(*) FROM processed_emails WHERE email_subject = ? AND email_body_hash = ?
+    ''', (subject, body_hash))
+    return cursor.fetchone()[0] > 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--batch', type=int, default=200, help="emails par synchronisation")
+    parser.add_argument('--legacy-lookups', type=int, default=20, help="requêtes de l'ancien schéma à chronométrer")
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'dedup.db')
+    emails = [(f"Sujet {i}", f"Corps de l'email {i}") for i in range(args.rows)]
+
+    # Table au format historique, remplie en une transaction
+    start = time.perf_counter()
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE processed_emails (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email_subject TEXT NOT NULL,
+            email_body_hash TEXT NOT NULL,
+            processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.executemany('INSERT INTO processed_emails (email_subject, email_body_hash) VALUES (?, ?)',
+                     ((s, hashlib.md5(b.encode('utf-8')).hexdigest()) for s, b in emails))
+    conn.commit()
+    fill_s = time.perf_counter() - start
+
+    rng = random.Random(42)
+    # Moitié d'emails connus, moitié de nouveaux
+    sample = [rng.choice(emails) for _ in range(args.batch // 2)]
+    sample += [(f"Nouveau {i}", f"Corps inédit {i}") for i in range(args.batch - len(sample))]
+
+    start = time.perf_counter()
+    for subject, body in sample[:args.legacy_lookups]:
+        legacy_is_processed(conn, subject, body)
+    legacy_lookup_ms = (time.perf_counter() - start) * 1000 / args.legacy_lookups
+    conn.close()
+
+    database.DATABASE_NAME = path
+    start = time.perf_counter()
+    database.init_db()
+    migrate_s = time.perf_counter() - start
+
+    ids = [k for subject, body in sample for k in database.email_keys({'subject': subject, 'body': body})]
+    start = time.perf_counter()
+    unprocessed = set(database.filter_unprocessed(ids))
+    batch_ms = (time.perf_counter() - start) * 1000
+    new_emails = sum(1 for key, legacy in zip(ids[::2], ids[1::2]) if key in unprocessed and legacy in unprocessed)
+
+    print(json.dumps({
+        'rows': args.rows,
+        'batch': args.batch,
+        'fill_s': round(fill_s, 2),
+        'migration_s': round(migrate_s, 2),
+        'legacy_lookup_ms': round(legacy_lookup_ms, 2),
+        'legacy_batch_ms_estimate': round(legacy_lookup_ms * args.batch, 1),
+        'filter_unprocessed_batch_ms': round(batch_ms, 2),
+        'unprocessed_emails': new_emails,
+        'speedup': round(legacy_lookup_ms * args.batch / batch_ms, 1),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+"""
+Benchmark de bout en bout, hors ligne et reproductible : serveur IMAP local
+chargé d'un corpus généré (corpus.py : langues, formes MIME, tailles, pièces
+jointes, fils) et mock de l'API Mistral (latence, erreurs 5xx, 429). Pour
+chaque taille, une synchronisation complète tourne dans un processus à part
+(base neuve) afin que le pic de RSS ne mesure que mail2tasks.
+
+Rapporte le débit (emails/s), les latences p50/p99 par appel de chaque étape
+(connect, search, fetch, parse, filter, llm, dedup, insert, relevées par
+metrics.py), les compteurs du pipeline et le pic de RSS, en JSON. --baseline
+compare à un résultat précédent (autre commit) : rapport > 1 = plus lent ou
+plus lourd (sauf le débit, où < 1 est une régression).
+
+    python benchmarks/bench_e2e.py --sizes 1000,10000,100000 --output e2e.json
+    python benchmarks/bench_e2e.py --sizes 1000 --baseline e2e.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from corpus import generate
+from fake_imap import FakeIMAPServer
+from mock_mistral import MockMistralServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def worker(args):
+    """Processus de mesure : une synchronisation contre le serveur IMAP du parent"""
+    import logging
+    logging.disable(logging.INFO)
+    import database
+    import sync_pipeline
+    from metrics import metrics
+
+    # Durées brutes de chaque étape, en plus des histogrammes de metrics.py
+    samples = defaultdict(list)
+    observe = metrics.observe
+
+    def record(stage, seconds):
+        samples[stage].append(seconds)
+        observe(stage, seconds)
+
+    metrics.observe = record
+
+    database.init_db()
+    account_id = database.add_account('bench', imap_server='127.0.0.1', imap_port=args.imap_port,
+                                      email_address='test@example.com', password_env='BENCH_IMAP_PASSWORD',
+                                      use_ssl=False)
+    start = time.perf_counter()
+    stats = sync_pipeline.run_sync(accounts=[database.get_account(account_id)])
+    elapsed = time.perf_counter() - start
+
+    run = database.get_sync_runs(1)[0]
+    conn = database.get_connection()
+    print(json.dumps({
+        'emails': args.emails,
+        'wall_s': round(elapsed, 2),
+        'emails_per_s': round(args.emails / elapsed, 1),
+        'relevant': stats['total'],
+        'extracted': run['extracted'],
+        'tasks': conn.execute('SELECT COUNT(*) FROM tasks').fetchone()[0],
+        'fallback_tasks': run['fallback_tasks'],
+        'errors': stats['errors'],
+        'llm_requests': run['llm_requests'],
+        'prompt_tokens': run['prompt_tokens'],
+        'stage_s': run['stage_seconds'],
+        'latency_ms': {stage: {'count': len(values),
+                               'p50': round(percentile(values, 0.5) * 1000, 2),
+                               'p99': round(percentile(values, 0.99) * 1000, 2)}
+                       for stage, values in samples.items()},
+        # ru_maxrss : kilo-octets sous Linux
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }))
+
+
+def run_size(count, args, mistral):
+    start = time.perf_counter()
+    imap = FakeIMAPServer(latency=args.imap_latency).start()
+    corpus_bytes = 0
+    for raw, _ in generate(count, args.seed, args.attachment_rate, args.attachment_kb):
+        imap.append(raw)
+        corpus_bytes += len(raw)
+    generated_s = time.perf_counter() - start
+
+    before = dict(mistral.stats)
+    env = dict(os.environ, MISTRAL_API_URL=mistral.url, MISTRAL_API_KEY='bench', BENCH_IMAP_PASSWORD='secret',
+               DATABASE_NAME=os.path.join(tempfile.mkdtemp(), 'e2e.db'), METRICS_ENABLED='true',
+               MISTRAL_RATE_LIMIT=str(args.rate_limit), INITIAL_SYNC_LIMIT=str(count), SYNC_MAX_EMAILS='0')
+    process = subprocess.run([sys.executable, os.path.abspath(__file__), '--worker', '--emails', str(count),
+                              '--imap-port', str(imap.port)],
+                             env=env, cwd=ROOT, capture_output=True, text=True)
+    imap.shutdown()
+    imap.server_close()
+    if process.returncode:
+        sys.exit(f"Échec de la synchronisation ({count} emails) :\n{process.stderr[-4000:]}")
+
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+    result['corpus_mb'] = round(corpus_bytes / 1e6, 1)
+    result['corpus_generation_s'] = round(generated_s, 1)
+    result['mock'] = {key: mistral.stats[key] - before[key] for key in ('requests', '429', '5xx', 'malformed')}
+    return result
+
+
+def compare(runs, baseline):
+    """Rapports courant / référence par taille commune (> 1 : régression sauf pour le débit)"""
+    previous = {run['emails']: run for run in baseline['runs']}
+    ratios = {}
+    for run in runs:
+        old = previous.get(run['emails'])
+        if not old:
+            continue
+        entry = {
+            'emails_per_s': round(run['emails_per_s'] / old['emails_per_s'], 3),
+            'peak_rss_mb': round(run['peak_rss_mb'] / old['peak_rss_mb'], 3),
+        }
+        for stage, latency in run['latency_ms'].items():
+            if old['latency_ms'].get(stage, {}).get('p99'):
+                entry[f'{stage}_p99'] = round(latency['p99'] / old['latency_ms'][stage]['p99'], 3)
+        ratios[str(run['emails'])] = entry
+    return {'commit': baseline.get('commit'), 'ratios': ratios}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1000,10000,100000', help="tailles de corpus, séparées par des virgules")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--attachment-rate', type=float, default=0.1)
+    parser.add_argument('--attachment-kb', type=int, default=32)
+    parser.add_argument('--imap-latency', type=float, default=0.0, help="délai par commande IMAP (s)")
+    parser.add_argument('--latency', type=float, default=0.05, help="latence du mock Mistral (s)")
+    parser.add_argument('--jitter', type=float, default=0.02)
+    parser.add_argument('--error-rate', type=float, default=0.005, help="part de réponses 5xx")
+    parser.add_argument('--rate-429', type=float, default=0.005)
+    parser.add_argument('--malformed-rate', type=float, default=0.05)
+    parser.add_argument('--rate-limit', type=float, default=0, help="MISTRAL_RATE_LIMIT du client (0 = sans)")
+    parser.add_argument('--output', help="fichier JSON où écrire le résultat")
+    parser.add_argument('--baseline', help="résultat précédent à comparer")
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--emails', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--imap-port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args)
+        return
+
+    mistral = MockMistralServer(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                                rate_429=args.rate_429, malformed_rate=args.malformed_rate).start()
+    runs = [run_size(int(size), args, mistral) for size in args.sizes.split(',')]
+    result = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'params': {key: value for key, value in vars(args).items()
+                   if key not in ('worker', 'emails', 'imap_port', 'output', 'baseline')},
+        'runs': runs,
+    }
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as baseline_file:
+            result['baseline'] = compare(runs, json.load(baseline_file))
+
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            output.write(text + '\n')
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
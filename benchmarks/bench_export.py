@@ -0,0 +1,129 @@
+"""
+Benchmark de l'export / import en flux des tâches : export NDJSON ou CSV via
+/api/tasks/export vers un fichier, puis réimport via /api/tasks/import dans une
+base vide, et réimport du même fichier (tout doit être ignoré comme doublon).
+Mesure les durées et le pic de mémoire anonyme du processus (RssAnon, hors
+pages de la base projetées par mmap) pendant chaque étape : il doit rester du
+même ordre quel que soit le nombre de tâches.
+
+    python benchmarks/bench_export.py --tasks 1000000 --format ndjson
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+VERBS = ['Envoyer', 'Préparer', 'Valider', 'Relire', 'Organiser', 'Payer', 'Appeler', 'Planifier']
+OBJECTS = ['rapport', 'présentation', 'devis', 'contrat', 'réunion', 'facture', 'budget', 'planning']
+
+
+def fill(conn, count):
+    rng = random.Random(42)
+    # Dates de création étalées comme après des mois de synchronisations
+    created = datetime(2020, 1, 1)
+    batch = []
+    for i in range(count):
+        created += timedelta(seconds=rng.randint(0, 300))
+        batch.append((f"{rng.choice(VERBS)} {rng.choice(OBJECTS)} {i}", rng.choice(['basse', 'moyenne', 'haute']),
+                      f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}" if rng.random() < 0.5 else None,
+                      f"Détails de la tâche {i}", int(rng.random() < 0.3), f"Re: dossier {i}", "client@example.com",
+                      created.strftime('%Y-%m-%d %H:%M:%S')))
+        if len(batch) == 10000 or i == count - 1:
+            conn.executemany('''
+                INSERT INTO tasks (tache, priorite, deadline, info, status, source_subject, source_sender, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', batch)
+            conn.commit()
+            batch = []
+
+
+def rss_anon_mb():
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('RssAnon:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def measure(step):
+    """Durée de l'étape et pic de RssAnon relevé toutes les 10 ms pendant son exécution"""
+    peak, done = [rss_anon_mb()], threading.Event()
+
+    def sample():
+        while not done.wait(0.01):
+            peak[0] = max(peak[0], rss_anon_mb())
+
+    sampler = threading.Thread(target=sample)
+    sampler.start()
+    start = time.perf_counter()
+    result = step()
+    elapsed = time.perf_counter() - start
+    done.set()
+    sampler.join()
+    return result, {'s': round(elapsed, 2), 'peak_rss_anon_mb': round(max(peak[0], rss_anon_mb()), 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tasks', type=int, default=1000000)
+    parser.add_argument('--format', choices=['ndjson', 'csv'], default='ndjson')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    database.DATABASE_NAME = os.path.join(directory, 'source.db')
+    import app
+    client = app.app.test_client()
+    database.init_db()
+    start = time.perf_counter()
+    fill(database.get_connection(), args.tasks)
+    load_s = time.perf_counter() - start
+
+    export_path = os.path.join(directory, f'tasks.{args.format}')
+
+    def export():
+        response = client.get(f'/api/tasks/export?format={args.format}', buffered=False)
+        with open(export_path, 'wb') as output:
+            for chunk in response.response:
+                output.write(chunk)
+        response.close()
+        return os.path.getsize(export_path)
+
+    def upload():
+        with open(export_path, 'rb') as upload_file:
+            return client.post(f'/api/tasks/import?format={args.format}', input_stream=upload_file,
+                               content_type='application/octet-stream').get_json()
+
+    rss_before = round(rss_anon_mb(), 1)
+    size, export_stats = measure(export)
+    database.DATABASE_NAME = os.path.join(directory, 'target.db')
+    database.init_db()
+    imported, import_stats = measure(upload)
+    reimported, reimport_stats = measure(upload)
+
+    print(json.dumps({
+        'tasks': args.tasks,
+        'format': args.format,
+        'load_s': round(load_s, 1),
+        'rss_anon_before_mb': rss_before,
+        'export_mb': round(size / 1e6, 1),
+        'export': export_stats,
+        'import': dict(import_stats, imported=imported['imported'], errors=imported['errors']),
+        'reimport': dict(reimport_stats, skipped=reimported['skipped'], imported=reimported['imported']),
+        'rows_per_s': {
+            'export': round(args.tasks / export_stats['s']),
+            'import': round(args.tasks / import_stats['s']),
+        },
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Benchmark de l'extraction IA contre le mock Mistral local : appels
+séquentiels (ancien comportement) contre extraction concurrente.
+
+    python benchmarks/bench_extraction.py --emails 100 --latency 0.5 --concurrency 8
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_mistral import MockMistralServer
+
+
+def make_emails(count):
+    return [f"Sujet: Réunion projet {i} urgent\n\nCorps: Merci de préparer le rapport {i} avant vendredi."
+            for i in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--emails', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.5)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--rate-limit', type=float, default=0, help="requêtes/s côté client (0 = illimité)")
+    parser.add_argument('--rate-429', type=float, default=0.0)
+    parser.add_argument('--skip-sequential', action='store_true')
+    args = parser.parse_args()
+
+    server = MockMistralServer(latency=args.latency, rate_429=args.rate_429, retry_after=0.2).start()
+    os.environ.update({
+        'MISTRAL_API_URL': server.url,
+        'MISTRAL_API_KEY': 'bench',
+        'MISTRAL_RATE_LIMIT': str(args.rate_limit),
+        'MISTRAL_MAX_CONCURRENCY': str(args.concurrency),
+        # Chaque passe mesure de vrais appels : pas de réponse servie par le cache d'extraction
+        'EXTRACTION_CACHE_ENABLED': 'false',
+    })
+    import ai_extractor
+    import database
+
+    # Base jetable, jamais la tasks.db du dépôt
+    database.DATABASE_NAME = os.path.join(tempfile.mkdtemp(), 'extraction.db')
+    database.init_db()
+
+    emails = make_emails(args.emails)
+    report = {'emails': args.emails, 'latency': args.latency, 'concurrency': args.concurrency}
+
+    if not args.skip_sequential:
+        start = time.perf_counter()
+        for content in emails:
+            ai_extractor.extract_tasks_from_email(content)
+        report['sequential_s'] = round(time.perf_counter() - start, 3)
+
+    start = time.perf_counter()
+    results = ai_extractor.extract_tasks_concurrently(emails, max_workers=args.concurrency, token_budget=0)
+    report['concurrent_s'] = round(time.perf_counter() - start, 3)
+    report['fallback_tasks'] = sum(1 for tasks in results for task in tasks or [] if 'fallback' in task['info'])
+    if 'sequential_s' in report:
+        report['speedup'] = round(report['sequential_s'] / report['concurrent_s'], 2)
+    report['server'] = server.stats
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Micro-benchmark du filtre de pertinence sur un corpus synthétique :
+ancienne boucle "kw.lower() in texte" contre le KeywordMatcher compilé.
+
+    python benchmarks/bench_keywords.py --emails 100000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import KEYWORDS
+from keyword_matcher import KeywordMatcher
+
+FILLER = ("bonjour merci pour votre retour concernant la planète les chiffres du trimestre "
+          "renew subscription newsletter offre spéciale voyage équipe semaine prochaine "
+          "hello regards attached please find below information client commande livraison").split()
+
+
+def make_corpus(count, words_per_email=120, keyword_rate=0.02, seed=42):
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(count):
+        words = [rng.choice(KEYWORDS) if rng.random() < keyword_rate else rng.choice(FILLER)
+                 for _ in range(words_per_email)]
+        corpus.append((' '.join(words[:8]).capitalize(), ' '.join(words[8:])))
+    return corpus
+
+
+def legacy_filter(subject, body):
+    full_text = f"{subject} {body}".lower()
+    return [kw for kw in KEYWORDS if kw.lower() in full_text]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--emails', type=int, default=100000)
+    parser.add_argument('--words', type=int, default=120)
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.emails, args.words)
+
+    start = time.perf_counter()
+    matcher = KeywordMatcher()
+    build_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    legacy_hits = sum(1 for subject, body in corpus if legacy_filter(subject, body))
+    legacy_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = [matcher.analyze(f"{subject} {body}") for subject, body in corpus]
+    matcher_s = time.perf_counter() - start
+
+    print(json.dumps({
+        'emails': args.emails,
+        'keywords': len(matcher.keywords),
+        'build_ms': round(build_s * 1000, 2),
+        'legacy_s': round(legacy_s, 3),
+        'legacy_emails_per_s': round(args.emails / legacy_s),
+        'matcher_s': round(matcher_s, 3),
+        'matcher_emails_per_s': round(args.emails / matcher_s),
+        'speedup': round(legacy_s / matcher_s, 2),
+        'legacy_matches': legacy_hits,
+        'matcher_any_keyword': sum(1 for hits, _ in results if hits),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
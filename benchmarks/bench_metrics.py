@@ -0,0 +1,98 @@
+"""
+Coût de l'instrumentation (metrics.py) : durée d'un timer et d'un compteur,
+activés et désactivés, puis synchronisation complète (serveur IMAP local +
+mock Mistral sans latence) avec et sans métriques, pour vérifier que le
+surcoût reste négligeable devant le pipeline.
+
+    python benchmarks/bench_metrics.py --emails 500 --rounds 5
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_imap import FakeIMAPServer
+from mock_mistral import MockMistralServer
+
+
+def micro(enabled, number=200000):
+    from metrics import Metrics
+
+    registry = Metrics(enabled=enabled)
+
+    def timed():
+        with registry.timer('fetch'):
+            pass
+
+    def counted():
+        registry.inc('emails_seen', 3, reason='keywords')
+
+    return {
+        'timer_ns': round(timeit.timeit(timed, number=number) / number * 1e9),
+        'inc_ns': round(timeit.timeit(counted, number=number) / number * 1e9),
+    }
+
+
+def sync_once(emails, enabled):
+    import database
+    import sync_pipeline
+    from metrics import metrics
+
+    database.DATABASE_NAME = os.path.join(tempfile.mkdtemp(), 'metrics.db')
+    database.init_db()
+    imap = FakeIMAPServer().start()
+    for i in range(emails):
+        imap.append(f"Subject: Urgent : rapport {i}\r\nFrom: a@example.com\r\nMessage-ID: <m{i}@example.com>\r\n\r\n"
+                    f"Merci de préparer le rapport {i} avant vendredi.\r\n".encode('utf-8'))
+    account_id = database.add_account('bench', imap_server='127.0.0.1', imap_port=imap.port,
+                                      email_address='test@example.com', password_env='BENCH_IMAP_PASSWORD',
+                                      use_ssl=False)
+    metrics.enabled = enabled
+    start = time.perf_counter()
+    sync_pipeline.run_sync(accounts=[database.get_account(account_id)])
+    elapsed = time.perf_counter() - start
+    imap.shutdown()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--emails', type=int, default=500)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    mistral = MockMistralServer(latency=0.0).start()
+    os.environ.update(MISTRAL_API_URL=mistral.url, MISTRAL_API_KEY='bench', MISTRAL_RATE_LIMIT='0',
+                      BENCH_IMAP_PASSWORD='secret', INITIAL_SYNC_LIMIT='1000000', SYNC_MAX_EMAILS='0',
+                      EXTRACTION_CACHE_ENABLED='false', PRECLASSIFIER_ENABLED='false')
+    import logging
+    logging.disable(logging.INFO)
+
+    # Passages alternés pour répartir les variations de la machine
+    timings = {True: [], False: []}
+    for _ in range(args.rounds):
+        for enabled in (False, True):
+            timings[enabled].append(sync_once(args.emails, enabled))
+    enabled_s = statistics.median(timings[True])
+    disabled_s = statistics.median(timings[False])
+
+    print(json.dumps({
+        'micro': {'enabled': micro(True), 'disabled': micro(False)},
+        'sync': {
+            'emails': args.emails,
+            'disabled_s': round(disabled_s, 3),
+            'enabled_s': round(enabled_s, 3),
+            'overhead_pct': round((enabled_s / disabled_s - 1) * 100, 2),
+        },
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
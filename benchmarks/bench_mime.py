@@ -0,0 +1,128 @@
+"""
+Benchmark de l'extraction du corps sur des emails multipart volumineux
+(texte + HTML + pièces jointes, emails HTML seul, réponses avec historique) :
+ancienne extraction (message_from_bytes policy=default, text/plain seul,
+décodage UTF-8) contre mime_body.extract_body (BytesFeedParser incrémental,
+arrêt à la première pièce jointe, repli HTML, citations retirées).
+Mesure le temps par message, le pic de mémoire Python (tracemalloc) et la part
+d'emails dont un texte exploitable est extrait.
+
+    python benchmarks/bench_mime.py --emails 200 --attachment-kb 2048
+"""
+import argparse
+import email
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.policy import default
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mime_body import extract_body
+
+SENTENCES = [
+    "Merci de préparer le rapport trimestriel avant vendredi.",
+    "Peux-tu valider le devis du client avant la réunion de lundi ?",
+    "La facture 1042 doit être payée avant la fin du mois.",
+    "Il faudrait organiser la présentation au comité de direction.",
+]
+HISTORY = "\n".join(f"> Ligne citée numéro {i} de l'échange précédent, sans rapport." for i in range(200))
+
+
+def make_email(rng, attachment_kb):
+    request = " ".join(rng.sample(SENTENCES, 2))
+    kind = rng.choice(['mixed', 'html_only', 'reply'])
+    charset = rng.choice(['utf-8', 'iso-8859-1'])
+
+    if kind == 'reply':
+        text = f"{request}\n\nCordialement,\nMarie\n\nLe lun. 3 juin 2024 à 10:00, Paul <paul@example.com> a écrit :\n{HISTORY}"
+        body = MIMEText(text, 'plain', charset)
+    else:
+        body = MIMEMultipart('alternative')
+        html = (f"<html><head><style>{'td {{ padding: 0 }} ' * 300}</style></head>"
+                f"<body><table><tr><td><p>{request}</p></td></tr></table>"
+                f"<div class=\"gmail_quote\"><blockquote>{HISTORY}</blockquote></div></body></html>")
+        if kind == 'mixed':
+            body.attach(MIMEText(request, 'plain', charset))
+        body.attach(MIMEText(html, 'html', charset))
+
+    message = MIMEMultipart('mixed')
+    message['Subject'] = "Demande"
+    message.attach(body)
+    for index in range(rng.randint(1, 3)):
+        message.attach(MIMEApplication(rng.randbytes(attachment_kb * 1024), Name=f"piece{index}.pdf"))
+    return message.as_bytes()
+
+
+def legacy_extract(raw):
+    """Extraction historique : message complet analysé, text/plain décodé en UTF-8"""
+    msg = email.message_from_bytes(raw, policy=default)
+    body = ""
+    for part in msg.walk():
+        if part.get_content_type() == "text/plain" and "attachment" not in str(part.get('Content-Disposition', '')):
+            payload = part.get_payload(decode=True)
+            if payload:
+                body = payload.decode('utf-8', errors='ignore')
+                break
+    return ' '.join(body.split())[:5000]
+
+
+def run(extract, corpus, trace_memory):
+    peaks, timings, useful = [], [], 0
+    for raw in corpus:
+        if trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        text = extract(raw)
+        timings.append((time.perf_counter() - start) * 1000)
+        if trace_memory:
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        # Texte exploitable : la demande figure dans le corps extrait
+        useful += any(sentence[:30] in text for sentence in SENTENCES)
+    timings.sort()
+    result = {
+        'avg_ms': round(sum(timings) / len(timings), 2),
+        'p50_ms': round(timings[len(timings) // 2], 2),
+        'p99_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.99))], 2),
+        'useful_text_rate': round(useful / len(corpus), 3),
+    }
+    if trace_memory:
+        result['peak_mb_max'] = round(max(peaks) / 1e6, 2)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--emails', type=int, default=200)
+    parser.add_argument('--attachment-kb', type=int, default=2048, help="taille de chaque pièce jointe")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    corpus = [make_email(rng, args.attachment_kb) for _ in range(args.emails)]
+    sizes = sorted(len(raw) for raw in corpus)
+
+    # Durées sans tracemalloc (qui ralentit les allocations), puis pics mémoire sur un échantillon
+    legacy = run(legacy_extract, corpus, trace_memory=False)
+    streaming = run(extract_body, corpus, trace_memory=False)
+    sample = corpus[:20]
+    legacy['peak_mb_max'] = run(legacy_extract, sample, trace_memory=True)['peak_mb_max']
+    streaming['peak_mb_max'] = run(extract_body, sample, trace_memory=True)['peak_mb_max']
+
+    print(json.dumps({
+        'emails': args.emails,
+        'message_mb_p50': round(sizes[len(sizes) // 2] / 1e6, 2),
+        'legacy': legacy,
+        'streaming': streaming,
+        'speedup': round(legacy['avg_ms'] / streaming['avg_ms'], 1),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
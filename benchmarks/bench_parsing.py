@@ -0,0 +1,162 @@
+"""
+Taux de lecture des réponses d'extraction sur un corpus de réponses brutes :
+ancienne lecture (texte du premier "{" au dernier "}" puis json.loads, sinon
+tâche de secours) contre json_repair + task_schema (réparation, validation
+champ par champ, champs à redemander). Le corpus est un fichier JSONL
+enregistré avec MISTRAL_REPLY_LOG ({"reply": ...} par ligne) ou, à défaut,
+généré par le mock avec une part de réponses dégradées.
+
+Puis extraction complète contre le mock (mêmes défauts injectés) : requêtes,
+relances, tâches de secours et tâches par email, avec et sans relance des
+champs invalides.
+
+    python benchmarks/bench_parsing.py --corpus replies.jsonl
+    python benchmarks/bench_parsing.py --emails 1000 --malformed-rate 0.2
+"""
+import argparse
+import copy
+import json
+import os
+import random
+import re
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_mistral import MockMistralServer, MALFORMATIONS, fake_tasks, malform
+from json_repair import parse_json
+from task_schema import PRIORITIES, validate_task, response_tasks
+
+REQUESTS = ["Préparer le rapport trimestriel", "Valider le devis client", "Réserver la salle du comité",
+            "Relancer le fournisseur", "Envoyer la facture 1042", "Mettre à jour le planning"]
+
+
+def make_emails(count, rng):
+    """Emails d'une à trois demandes (lignes "- ..." au-delà d'une)"""
+    emails = []
+    for i in range(count):
+        requests_ = rng.sample(REQUESTS, rng.choice([1, 1, 2, 3]))
+        body = (f"Merci de {requests_[0].lower()} avant vendredi." if len(requests_) == 1 else
+                "Bonjour, pour la semaine prochaine :\n" + "\n".join(f"- {r} {i}" for r in requests_))
+        emails.append(f"Sujet: {'Urgent : ' if rng.random() < 0.3 else ''}{requests_[0]} {i}\n\nCorps: {body}")
+    return emails
+
+
+def generate_corpus(emails, malformed_rate, rng):
+    corpus = []
+    for content in emails:
+        data = {'tasks': fake_tasks(content)}
+        kind = rng.choice(MALFORMATIONS) if rng.random() < malformed_rate else None
+        corpus.append((malform(copy.deepcopy(data), kind) if kind else json.dumps(data, ensure_ascii=False), kind))
+    return corpus
+
+
+def legacy_read(reply):
+    """Ancienne lecture : None (tâche de secours) ou les éléments tels que renvoyés"""
+    try:
+        data = json.loads(reply[reply.find('{'):reply.rfind('}') + 1])
+    except ValueError:
+        return None
+    return response_tasks(data)
+
+
+def strictly_valid(item):
+    """Élément directement exploitable sans normalisation (ce que l'ancienne lecture enregistrait tel quel)"""
+    return (isinstance(item, dict) and isinstance(item.get('tache'), str) and item['tache'].strip()
+            and item.get('priorite') in PRIORITIES
+            and (item.get('deadline') is None or re.fullmatch(r'\d{4}-\d{2}-\d{2}', str(item['deadline']))))
+
+
+def measure_corpus(corpus):
+    legacy = Counter()
+    repaired = Counter()
+    for reply, kind in corpus:
+        items = legacy_read(reply)
+        if items is None:
+            legacy['fallback'] += 1
+        else:
+            legacy['parsed'] += 1
+            legacy['invalid_fields_stored'] += sum(not strictly_valid(item) for item in items)
+
+        try:
+            data = json.loads(reply)
+        except ValueError:
+            data = parse_json(reply)
+            repaired['repaired' if data is not None else 'unreadable'] += 1
+        items = response_tasks(data)
+        if items is None:
+            repaired['reask_reply'] += 1
+            continue
+        repaired['parsed'] += 1
+        for item in items:
+            _, errors = validate_task(item)
+            repaired['fields_to_reask'] += len(errors)
+            repaired['tasks_complete'] += not errors
+
+    total = len(corpus)
+    legacy['parse_success_rate'] = round(legacy['parsed'] / total, 3)
+    repaired['parse_success_rate'] = round(repaired['parsed'] / total, 3)
+    return dict(legacy), dict(repaired)
+
+
+def run_pipeline(ai_extractor, server, emails, budget, repair_rounds):
+    ai_extractor.EXTRACTION_REPAIR_ROUNDS = repair_rounds
+    random.seed(42)
+    for key in ai_extractor.extraction_stats:
+        ai_extractor.extraction_stats[key] = 0
+    before = dict(server.stats)
+    start = time.perf_counter()
+    results = ai_extractor.extract_tasks_concurrently(emails, token_budget=budget)
+    elapsed = time.perf_counter() - start
+    tasks = [task for result in results for task in result or []]
+    stats = ai_extractor.get_extraction_stats()
+    return {
+        'wall_s': round(elapsed, 2),
+        'requests': server.stats['requests'] - before['requests'],
+        'reask_calls': stats['reask_calls'],
+        'fields_fixed': stats['fields_fixed'],
+        'parse_success_rate': stats['parse_success_rate'],
+        'fallback_tasks': sum('fallback' in task['info'] for task in tasks),
+        'tasks_per_email': round(len(tasks) / len(emails), 2),
+        'missing_results': sum(result is None for result in results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', help="fichier JSONL de réponses enregistrées (MISTRAL_REPLY_LOG)")
+    parser.add_argument('--emails', type=int, default=1000)
+    parser.add_argument('--malformed-rate', type=float, default=0.2)
+    parser.add_argument('--budget', type=int, default=6000, help="budget de tokens des lots (0 = un email par appel)")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    random.seed(42)
+    emails = make_emails(args.emails, rng)
+    if args.corpus:
+        with open(args.corpus, encoding='utf-8') as corpus_file:
+            corpus = [(json.loads(line)['reply'], None) for line in corpus_file if line.strip()]
+    else:
+        corpus = generate_corpus(emails, args.malformed_rate, rng)
+    legacy, repaired = measure_corpus(corpus)
+
+    server = MockMistralServer(latency=0.0, malformed_rate=args.malformed_rate).start()
+    os.environ.update(MISTRAL_API_URL=server.url, MISTRAL_API_KEY='bench', MISTRAL_RATE_LIMIT='0',
+                      EXTRACTION_CACHE_ENABLED='false')
+    import ai_extractor
+
+    print(json.dumps({
+        'corpus': {'replies': len(corpus), 'source': args.corpus or f"mock, {args.malformed_rate:.0%} dégradées",
+                   'legacy': legacy, 'repair': repaired},
+        'pipeline': {
+            'emails': args.emails,
+            'without_reask': run_pipeline(ai_extractor, server, emails, args.budget, repair_rounds=0),
+            'with_reask': run_pipeline(ai_extractor, server, emails, args.budget, repair_rounds=1),
+        },
+    }, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Benchmark de la recherche plein texte (FTS5) sur une grosse table de tâches :
+latence p50/p99 de search_tasks pour des mots rares, fréquents, des préfixes
+(saisie en cours) et des requêtes à plusieurs mots, comparée à un LIKE '%...%' sur les colonnes.
+
+    python benchmarks/bench_search.py --tasks 1000000 --queries 50
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+VERBS = ['Envoyer', 'Préparer', 'Valider', 'Relire', 'Organiser', 'Payer', 'Appeler', 'Répondre à', 'Planifier']
+OBJECTS = ['rapport', 'présentation', 'devis', 'contrat', 'réunion', 'facture', 'budget', 'planning', 'commande']
+SENDERS = ['direction', 'comptabilite', 'support', 'client', 'rh', 'achats']
+
+
+def make_word(rng):
+    return ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(5, 9)))
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tasks', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=50, help="requêtes par catégorie")
+    parser.add_argument('--like-queries', type=int, default=5)
+    args = parser.parse_args()
+
+    database.DATABASE_NAME = os.path.join(tempfile.mkdtemp(), 'search.db')
+    database.init_db()
+    conn = database.get_connection()
+
+    rng = random.Random(42)
+    # Vocabulaire de noms propres : une partie rare, une partie fréquente
+    names = [make_word(rng) for _ in range(50000)]
+    start = time.perf_counter()
+    batch = []
+    for i in range(args.tasks):
+        # Moitié de noms fréquents, moitié tirés dans tout le vocabulaire
+        name = names[rng.randrange(50)] if rng.random() < 0.5 else rng.choice(names)
+        batch.append((f"{rng.choice(VERBS)} {rng.choice(OBJECTS)} {name.capitalize()}", 'moyenne',
+                      f"Dossier {make_word(rng)} {i}", f"Re: {rng.choice(OBJECTS)} {name}",
+                      f"{rng.choice(SENDERS)}@example.com"))
+        if len(batch) == 10000 or i == args.tasks - 1:
+            conn.executemany('''
+                INSERT INTO tasks (tache, priorite, info, source_subject, source_sender, status)
+                VALUES (?, ?, ?, ?, ?, 0)
+            ''', batch)
+            conn.commit()
+            batch = []
+    load_s = time.perf_counter() - start
+    conn.execute("INSERT INTO tasks_fts (tasks_fts) VALUES ('optimize')")
+    conn.commit()
+
+    categories = {
+        'rare_word': lambda: names[rng.randrange(50, len(names))] + ' ',
+        'frequent_word': lambda: rng.choice(OBJECTS) + ' ',
+        'frequent_prefix': lambda: rng.choice(OBJECTS),
+        'prefix': lambda: names[rng.randrange(len(names))][:3],
+        'multi_word': lambda: f"{rng.choice(OBJECTS)} {names[rng.randrange(50)]} ",
+        'sender': lambda: rng.choice(SENDERS) + ' ',
+    }
+    results = {}
+    for category, make_query in categories.items():
+        timings, hits = [], 0
+        for _ in range(args.queries):
+            query = make_query()
+            start = time.perf_counter()
+            hits += len(database.search_tasks(query, limit=20))
+            timings.append((time.perf_counter() - start) * 1000)
+        results[category] = {
+            'p50_ms': round(percentile(timings, 0.5), 2),
+            'p99_ms': round(percentile(timings, 0.99), 2),
+            'avg_hits': round(hits / args.queries, 1),
+        }
+
+    timings = []
+    for _ in range(args.like_queries):
+        pattern = f"%{names[rng.randrange(50, len(names))]}%"
+        start = time.perf_counter()
+        conn.execute('''
+            SELECT id FROM tasks WHERE status = 0 AND (tache LIKE ? OR info LIKE ? OR source_subject LIKE ?)
+            LIMIT 20
+        ''', (pattern, pattern, pattern)).fetchall()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    print(json.dumps({
+        'tasks': args.tasks,
+        'load_s': round(load_s, 1),
+        'fts': results,
+        'like_scan_p50_ms': round(percentile(timings, 0.5), 1),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Benchmark de la détection de tâches en double sur une grosse table :
+ancien task_exists (LIKE '%...%', parcours complet) contre l'index MinHash/LSH
+(find_similar_task). Mesure aussi les doublons reformulés retrouvés et les
+faux positifs sur des tâches distinctes.
+
+    python benchmarks/bench_similarity.py --tasks 100000 --queries 200
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+# (forme de référence, reformulation) : les reformulations doivent être détectées
+VERBS = [('Envoyer le', 'Envoi du'), ('Préparer la', 'Préparation de la'), ('Valider le', 'Validation du'),
+         ('Relire le', 'Relecture du'), ('Organiser la', 'Organisation de la'), ('Payer la', 'Paiement de la')]
+OBJECTS = ['rapport', 'présentation', 'devis', 'contrat', 'réunion', 'facture', 'budget', 'planning']
+
+
+def make_name(rng):
+    return ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(5, 9))).capitalize()
+
+
+def make_task(rng):
+    verb, reworded = rng.choice(VERBS)
+    words = f"{rng.choice(OBJECTS)} {make_name(rng)} {make_name(rng)}"
+    return f"{verb} {words}", f"{reworded} {words}"
+
+
+def legacy_task_exists(cursor, tache):
+    cursor.execute('SELECT COUNT(*) FROM tasks WHERE tache LIKE ? AND status = 0', (f'%{tache}%',))
+    return cursor.fetchone()[0] > 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tasks', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    database.DATABASE_NAME = os.path.join(tempfile.mkdtemp(), 'similarity.db')
+    database.init_db()
+    conn = database.get_connection()
+    cursor = conn.cursor()
+
+    rng = random.Random(42)
+    pairs = [make_task(rng) for _ in range(args.tasks)]
+    start = time.perf_counter()
+    for tache, _ in pairs:
+        cursor.execute("INSERT INTO tasks (tache, priorite, status) VALUES (?, 'moyenne', 0)", (tache,))
+        database.index_task(cursor, cursor.lastrowid, tache)
+    conn.commit()
+    index_s = time.perf_counter() - start
+
+    sample = rng.sample(pairs, args.queries)
+    # Même structure, autres noms : ne doit pas être un doublon
+    distinct = [make_task(rng)[0] for _ in range(args.queries)]
+
+    start = time.perf_counter()
+    legacy_hits = sum(legacy_task_exists(cursor, reworded) for _, reworded in sample)
+    legacy_ms = (time.perf_counter() - start) * 1000 / args.queries
+
+    start = time.perf_counter()
+    found = [database.find_similar_task(reworded) for _, reworded in sample]
+    lsh_ms = (time.perf_counter() - start) * 1000 / args.queries
+    false_positives = sum(database.find_similar_task(tache) is not None for tache in distinct)
+
+    print(json.dumps({
+        'tasks': args.tasks,
+        'queries': args.queries,
+        'index_build_s': round(index_s, 2),
+        'legacy_lookup_ms': round(legacy_ms, 3),
+        'lsh_lookup_ms': round(lsh_ms, 3),
+        'speedup': round(legacy_ms / lsh_ms, 1),
+        'legacy_reworded_found': round(legacy_hits / args.queries, 3),
+        'lsh_reworded_found': round(sum(f is not None for f in found) / args.queries, 3),
+        'lsh_false_positive_rate': round(false_positives / args.queries, 3),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
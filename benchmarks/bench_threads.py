@@ -0,0 +1,109 @@
+"""
+Benchmark du regroupement par conversation sur une liste de diffusion simulée
+(serveur IMAP local + mock Mistral) : des fils de plusieurs réponses arrivent
+au fil de plusieurs synchronisations. Compare les appels IA, les tokens et les
+tâches créées avec les en-têtes In-Reply-To / References (une tâche par fil,
+mise à jour) et sans (chaque réponse traitée seule, comme avant).
+
+    python benchmarks/bench_threads.py --threads 100 --replies 8 --syncs 3
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_imap import FakeIMAPServer
+from mock_mistral import MockMistralServer
+
+TOPICS = ['rapport trimestriel', 'devis client', 'budget marketing', 'planning de livraison', 'contrat fournisseur']
+REPLIES = ["Je m'en occupe.", "Peux-tu ajouter les chiffres de mars ?", "La deadline est avancée à jeudi.",
+           "Merci, c'est urgent pour la direction.", "J'ai mis à jour le document partagé."]
+
+
+def make_messages(threads, replies, rng):
+    """Messages (bruts, avec et sans en-têtes de fil) dans l'ordre d'arrivée"""
+    messages = []
+    for thread in range(threads):
+        topic = f"{rng.choice(TOPICS)} {thread}"
+        for reply in range(replies + 1):
+            ids = [f"<t{thread}.{i}@liste.example.com>" for i in range(reply)]
+            subject = f"{'Re: ' if reply else ''}Urgent : {topic}"
+            body = (f"Merci de préparer le {topic} avant vendredi." if reply == 0 else
+                    f"{rng.choice(REPLIES)}\n\nLe lun. 3 juin 2024, Paul a écrit :\n> Merci de préparer le {topic}")
+            headers = (f"Subject: {subject}\r\nFrom: membre{reply}@liste.example.com\r\n"
+                       f"Message-ID: <t{thread}.{reply}@liste.example.com>\r\n")
+            thread_headers = f"In-Reply-To: {ids[-1]}\r\nReferences: {' '.join(ids)}\r\n" if ids else ''
+            messages.append((rng.random(), headers, thread_headers, body))
+    # Les fils s'entremêlent dans la boîte, chaque fil restant dans l'ordre
+    messages.sort(key=lambda m: m[0])
+    return messages
+
+
+def run(messages, syncs, with_threads, mistral):
+    import database
+    import sync_pipeline
+
+    database.DATABASE_NAME = os.path.join(tempfile.mkdtemp(), 'threads.db')
+    database.init_db()
+    imap = FakeIMAPServer().start()
+    account_id = database.add_account('bench', imap_server='127.0.0.1', imap_port=imap.port,
+                                      email_address='test@example.com', password_env='BENCH_IMAP_PASSWORD',
+                                      use_ssl=False)
+    accounts = [database.get_account(account_id)]
+
+    before = dict(mistral.stats)
+    per_sync = -(-len(messages) // syncs)
+    start = time.perf_counter()
+    for batch in range(syncs):
+        for _, headers, thread_headers, body in messages[batch * per_sync:(batch + 1) * per_sync]:
+            imap.append(f"{headers}{thread_headers if with_threads else ''}\r\n{body}\r\n".encode('utf-8'))
+        sync_pipeline.run_sync(accounts=accounts)
+    elapsed = time.perf_counter() - start
+    imap.shutdown()
+
+    conn = database.get_connection()
+    return {
+        'sync_s': round(elapsed, 2),
+        'llm_requests': mistral.stats['requests'] - before['requests'],
+        'prompt_tokens': mistral.stats['prompt_tokens'] - before['prompt_tokens'],
+        'tasks': conn.execute('SELECT COUNT(*) FROM tasks').fetchone()[0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=100)
+    parser.add_argument('--replies', type=int, default=8, help="réponses par fil")
+    parser.add_argument('--syncs', type=int, default=3)
+    parser.add_argument('--batch-max-emails', type=int, default=1, help="emails par prompt (1 = un appel par contenu)")
+    args = parser.parse_args()
+
+    mistral = MockMistralServer(latency=0.0).start()
+    os.environ.update(MISTRAL_API_URL=mistral.url, MISTRAL_API_KEY='bench', MISTRAL_RATE_LIMIT='0',
+                      BENCH_IMAP_PASSWORD='secret',
+                      MISTRAL_BATCH_MAX_EMAILS=str(args.batch_max_emails), INITIAL_SYNC_LIMIT='1000000',
+                      SYNC_MAX_EMAILS='0', EXTRACTION_CACHE_ENABLED='false', PRECLASSIFIER_ENABLED='false')
+
+    messages = make_messages(args.threads, args.replies, random.Random(42))
+    per_email = run(messages, args.syncs, with_threads=False, mistral=mistral)
+    threaded = run(messages, args.syncs, with_threads=True, mistral=mistral)
+
+    print(json.dumps({
+        'emails': len(messages),
+        'threads': args.threads,
+        'syncs': args.syncs,
+        'per_email': per_email,
+        'threaded': threaded,
+        'llm_request_reduction': round(1 - threaded['llm_requests'] / per_email['llm_requests'], 3),
+        'task_reduction': round(1 - threaded['tasks'] / per_email['tasks'], 3),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+"""
+Générateur de corpus d'emails reproductible pour les benchmarks hors ligne.
+
+Chaque message est tiré d'une graine et de son rang : langue (fr, en, de, es),
+forme MIME (texte seul, texte + HTML, HTML seul, réponse avec historique
+cité), pièces jointes, taille du corps (distribution log-normale), jeu de caractères
+et part d'emails sans demande (newsletters, notifications). Une partie des
+réponses reprend le Message-ID d'un email précédent (In-Reply-To / References)
+pour exercer le regroupement par conversation.
+
+    python benchmarks/corpus.py --emails 1000 --output corpus.mbox
+"""
+import argparse
+import json
+import random
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from email.header import Header
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.policy import compat32
+from email.utils import format_datetime, formataddr
+
+SHAPES = {'plain': 40, 'alternative': 30, 'html_only': 12, 'reply': 18}
+LANGUAGES = {'fr': 55, 'en': 30, 'de': 8, 'es': 7}
+ACTIONABLE_RATE = 0.7
+START = datetime(2024, 6, 3, 8, 0, tzinfo=timezone.utc)
+CRLF = compat32.clone(linesep='\r\n')
+
+TEXTS = {
+    'fr': {
+        'charsets': ['utf-8', 'iso-8859-1'],
+        'subjects': ["Urgent : rapport trimestriel", "Réunion de lancement du projet", "Devis client à valider",
+                     "Échéance de la facture", "Préparation du comité", "Mise à jour du planning"],
+        'requests': ["Merci de préparer le rapport trimestriel avant vendredi.",
+                     "Peux-tu valider le devis du client avant la réunion de lundi ?",
+                     "Il faut envoyer la facture au service comptable d'ici la fin du mois.",
+                     "Pourrais-tu organiser la réunion avec l'équipe projet la semaine prochaine ?",
+                     "Merci de mettre à jour le planning de livraison avant jeudi."],
+        'info': ["Lettre d'information de juin", "Votre relevé mensuel est disponible", "Nouveautés de la boutique"],
+        'filler': ["Le point d'hier a permis de faire le tour des sujets en cours.",
+                   "Les chiffres du mois dernier sont en ligne sur l'intranet.",
+                   "L'équipe commerciale a rencontré deux nouveaux clients cette semaine.",
+                   "Le prestataire a confirmé la date d'intervention sur le site."],
+        'greeting': "Bonjour,", 'closing': "Cordialement,", 'quote': "Le {date}, {name} a écrit :",
+    },
+    'en': {
+        'charsets': ['us-ascii', 'utf-8'],
+        'subjects': ["Action required: quarterly report", "Project kickoff meeting", "Client quote to approve",
+                     "Invoice due date", "Board meeting preparation", "Schedule update"],
+        'requests': ["Please prepare the quarterly report before Friday.",
+                     "Could you approve the client quote before Monday's meeting?",
+                     "The invoice must be sent to accounting by the end of the month.",
+                     "Can you schedule the project meeting for next week?",
+                     "Please update the delivery schedule before Thursday."],
+        'info': ["June newsletter", "Your monthly statement is ready", "New arrivals in the store"],
+        'filler': ["Yesterday's sync covered all the ongoing topics.",
+                   "Last month's figures are available on the intranet.",
+                   "The sales team met two new customers this week.",
+                   "The contractor confirmed the on-site visit date."],
+        'greeting': "Hi,", 'closing': "Best regards,", 'quote': "On {date}, {name} wrote:",
+    },
+    'de': {
+        'charsets': ['utf-8', 'iso-8859-1'],
+        'subjects': ["Dringend: Quartalsbericht", "Projektbesprechung", "Angebot prüfen",
+                     "Fälligkeit der Rechnung", "Vorbereitung der Vorstandssitzung"],
+        'requests': ["Bitte bereite den Quartalsbericht bis Freitag vor.",
+                     "Kannst du das Angebot vor dem Meeting am Montag prüfen?",
+                     "Die Rechnung muss bis Monatsende an die Buchhaltung gehen."],
+        'info': ["Newsletter Juni", "Ihr Kontoauszug ist verfügbar"],
+        'filler': ["Die Zahlen des letzten Monats sind im Intranet.",
+                   "Das Vertriebsteam hat diese Woche zwei neue Kunden getroffen."],
+        'greeting': "Hallo,", 'closing': "Viele Grüße,", 'quote': "Am {date} schrieb {name}:",
+    },
+    'es': {
+        'charsets': ['utf-8', 'iso-8859-1'],
+        'subjects': ["Urgente: informe trimestral", "Reunión del proyecto", "Presupuesto para validar",
+                     "Vencimiento de la factura"],
+        'requests': ["Por favor, prepara el informe trimestral antes del viernes.",
+                     "¿Puedes validar el presupuesto antes de la reunión del lunes?",
+                     "Hay que enviar la factura a contabilidad antes de fin de mes."],
+        'info': ["Boletín de junio", "Su extracto mensual está disponible"],
+        'filler': ["Las cifras del mes pasado están en la intranet.",
+                   "El equipo comercial se reunió con dos clientes nuevos esta semana."],
+        'greeting': "Hola,", 'closing': "Saludos,", 'quote': "El {date}, {name} escribió:",
+    },
+}
+NAMES = ["Marie Durand", "Paul Martin", "Anna Schmidt", "John Carter", "Lucía García", "Sophie Leroy"]
+
+
+def _pick(rng, weights):
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+
+def _paragraphs(rng, texts):
+    # Corps majoritairement courts, quelques emails très longs
+    count = min(60, int(rng.lognormvariate(0.8, 0.9)) + 1)
+    return [" ".join(rng.choices(texts['filler'], k=rng.randint(1, 4))) for _ in range(count)]
+
+
+def _html(paragraphs):
+    rows = "".join(f"<tr><td><p>{p}</p></td></tr>" for p in paragraphs)
+    return (f"<html><head><style>{'td {{ padding: 0 }} ' * 20}</style></head>"
+            f"<body><table>{rows}</table></body></html>")
+
+
+def make_email(rng, index, attachment_rate=0.1, attachment_kb=32):
+    """Message brut (octets, CRLF) du rang index ; les réponses citent un message de rang inférieur"""
+    language = _pick(rng, LANGUAGES)
+    texts = TEXTS[language]
+    shape = _pick(rng, SHAPES)
+    if shape == 'reply' and index == 0:
+        shape = 'plain'
+    actionable = rng.random() < ACTIONABLE_RATE
+    attached = shape != 'reply' and rng.random() < attachment_rate
+
+    subject = f"{rng.choice(texts['subjects'] if actionable else texts['info'])} {index}"
+    paragraphs = _paragraphs(rng, texts)
+    if actionable:
+        paragraphs.insert(rng.randint(0, min(2, len(paragraphs))), " ".join(rng.sample(texts['requests'], rng.randint(1, 2))))
+    sender = rng.choice(NAMES)
+    text = "\n\n".join([texts['greeting'], *paragraphs, f"{texts['closing']}\n{sender}"])
+
+    if shape == 'reply':
+        parent = rng.randrange(index)
+        quoted = "\n".join(f"> {line}" for line in " ".join(rng.choices(texts['filler'], k=20)).split(". "))
+        header = texts['quote'].format(date=format_datetime(START + timedelta(minutes=parent)), name=rng.choice(NAMES))
+        text = f"{text}\n\n{header}\n{quoted}\n"
+        subject = f"Re: {subject}"
+    charset = rng.choice(texts['charsets'])
+    try:
+        text.encode(charset)
+    except UnicodeEncodeError:
+        charset = 'utf-8'
+
+    if shape == 'html_only':
+        message = MIMEText(_html(paragraphs), 'html', 'utf-8')
+    elif shape == 'alternative':
+        message = MIMEMultipart('alternative')
+        message.attach(MIMEText(text, 'plain', charset))
+        message.attach(MIMEText(_html(paragraphs), 'html', 'utf-8'))
+    else:
+        message = MIMEText(text, 'plain', charset)
+    if attached:
+        body, message = message, MIMEMultipart('mixed')
+        message.attach(body)
+        for number in range(rng.randint(1, 2)):
+            message.attach(MIMEApplication(rng.randbytes(rng.randint(4, attachment_kb) * 1024), 'pdf',
+                                           Name=f"document{number}.pdf"))
+
+    message['Subject'] = Header(subject, 'utf-8') if not subject.isascii() else subject
+    login = sender.split()[0].lower().encode('ascii', errors='ignore').decode()
+    message['From'] = formataddr((sender, f"{login}@example.com"), 'utf-8')
+    message['To'] = "test@example.com"
+    message['Date'] = format_datetime(START + timedelta(minutes=index))
+    message['Message-ID'] = f"<m{index}@corpus.example.com>"
+    if shape == 'reply':
+        message['In-Reply-To'] = f"<m{parent}@corpus.example.com>"
+        message['References'] = f"<m{parent}@corpus.example.com>"
+    info = {'language': language, 'shape': shape + ('+attachment' if attached else ''), 'actionable': actionable}
+    return message.as_bytes(policy=CRLF), info
+
+
+def generate(count, seed=42, attachment_rate=0.1, attachment_kb=32):
+    """Itère sur (octets, description) ; même graine, même corpus"""
+    rng = random.Random(seed)
+    for index in range(count):
+        yield make_email(rng, index, attachment_rate, attachment_kb)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--emails', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--attachment-rate', type=float, default=0.1)
+    parser.add_argument('--attachment-kb', type=int, default=32, help="taille maximale d'une pièce jointe")
+    parser.add_argument('--output', help="fichier mbox où écrire le corpus")
+    args = parser.parse_args()
+
+    shapes, languages, sizes = Counter(), Counter(), []
+    output = open(args.output, 'wb') if args.output else None
+    for index, (raw, info) in enumerate(generate(args.emails, args.seed, args.attachment_rate, args.attachment_kb)):
+        shapes[info['shape']] += 1
+        languages[info['language']] += 1
+        sizes.append(len(raw))
+        if output:
+            output.write(f"From corpus@example.com {START + timedelta(minutes=index):%a %b %d %H:%M:%S %Y}\r\n".encode())
+            output.write(raw.replace(b'\r\nFrom ', b'\r\n>From ') + b'\r\n')
+    if output:
+        output.close()
+
+    sizes.sort()
+    print(json.dumps({
+        'emails': args.emails,
+        'shapes': dict(shapes),
+        'languages': dict(languages),
+        'size_bytes': {'p50': sizes[len(sizes) // 2], 'p99': sizes[int(len(sizes) * 0.99)],
+                       'max': sizes[-1], 'total': sum(sizes)},
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
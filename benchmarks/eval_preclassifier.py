@@ -0,0 +1,99 @@
+"""
+Évaluation hors ligne du pré-classifieur (validation croisée en k plis) :
+précision / rappel de la classe "actionnable" et part des appels IA évités
+pour plusieurs seuils. Utilise les exemples de la base (tâches conservées
+contre tâches supprimées) ou un jeu synthétique.
+
+    python benchmarks/eval_preclassifier.py --folds 5
+    python benchmarks/eval_preclassifier.py --synthetic 2000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import KEYWORDS
+from preclassifier import NaiveBayesClassifier
+
+ACTION = ("merci de valider le devis avant vendredi peux-tu relire la présentation réunion demain "
+          "please review the contract deadline next week urgent rappel facture à payer").split()
+NOISE = ("newsletter offre spéciale promotion voyage soldes unsubscribe webinar notification "
+         "votre colis a été livré nouvelle connexion détectée hebdomadaire résumé").split()
+COMMON = "bonjour cordialement merci hello regards équipe semaine information".split()
+
+
+def make_samples(count, seed=42):
+    """Emails synthétiques étiquetés : 1 = tâche conservée, 0 = tâche supprimée"""
+    rng = random.Random(seed)
+    samples = []
+    for _ in range(count):
+        label = 1 if rng.random() < 0.4 else 0
+        vocabulary = ACTION + KEYWORDS if label else NOISE
+        # Mélange volontaire pour que les classes se recouvrent
+        words = [rng.choice(vocabulary) if rng.random() < 0.08 else rng.choice(COMMON + ACTION + NOISE)
+                 for _ in range(rng.randint(10, 40))]
+        samples.append((f"Sujet: {' '.join(words[:6])}\n\nCorps: {' '.join(words[6:])}", label))
+    return samples
+
+
+def cross_validate(samples, folds, seed=42):
+    """Retourne [(score, étiquette)] prédits hors échantillon"""
+    samples = list(samples)
+    random.Random(seed).shuffle(samples)
+    predictions = []
+    for fold in range(folds):
+        train = [s for i, s in enumerate(samples) if i % folds != fold]
+        test = [s for i, s in enumerate(samples) if i % folds == fold]
+        model = NaiveBayesClassifier().fit([t for t, _ in train], [l for _, l in train])
+        predictions.extend((model.predict_proba(text), label) for text, label in test)
+    return predictions
+
+
+def evaluate(predictions, threshold):
+    sent = [(s, l) for s, l in predictions if s >= threshold]
+    true_positives = sum(l for _, l in sent)
+    positives = sum(l for _, l in predictions)
+    return {
+        'threshold': threshold,
+        'precision': round(true_positives / len(sent), 3) if sent else 0.0,
+        'recall': round(true_positives / positives, 3) if positives else 0.0,
+        'llm_call_reduction': round(1 - len(sent) / len(predictions), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--synthetic', type=int, default=0, help="nombre d'emails synthétiques (0 = base de données)")
+    parser.add_argument('--thresholds', default='0.1,0.2,0.3,0.5,0.7')
+    args = parser.parse_args()
+
+    if args.synthetic:
+        samples = make_samples(args.synthetic)
+    else:
+        from database import get_classifier_samples
+        samples = get_classifier_samples()
+    labels = {l for _, l in samples}
+    if len(samples) < args.folds or labels != {0, 1}:
+        sys.exit("Pas assez d'exemples (il faut des tâches conservées et supprimées), essayez --synthetic 2000")
+
+    start = time.perf_counter()
+    predictions = cross_validate(samples, args.folds)
+    elapsed = time.perf_counter() - start
+
+    print(json.dumps({
+        'samples': len(samples),
+        'positives': sum(l for _, l in samples),
+        'folds': args.folds,
+        'train_and_score_s': round(elapsed, 3),
+        'baseline_precision': round(sum(l for _, l in samples) / len(samples), 3),
+        'thresholds': [evaluate(predictions, float(t)) for t in args.thresholds.split(',')],
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
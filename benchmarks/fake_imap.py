@@ -0,0 +1,391 @@
+"""
+Serveur IMAP local (sans TLS) pour tester et mesurer la synchronisation hors ligne.
+
+Sous-ensemble suffisant pour email_reader : LOGIN, SELECT/EXAMINE, STATUS,
+UID SEARCH, UID FETCH (BODYSTRUCTURE, BODY.PEEK[...], RFC822), UID STORE,
+NOOP, IDLE, CLOSE, LOGOUT.
+
+    python benchmarks/fake_imap.py --port 1143 --emails 1000
+    python benchmarks/fake_imap.py --port 1143 --emails 10000 --corpus
+"""
+import argparse
+import email
+import re
+import socketserver
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+
+_SET_RE = re.compile(r'^(\d+|\*)(?::(\d+|\*))?$')
+_SECTION_RE = re.compile(r'^(BODY(?:\.PEEK)?)\[([^\]]*)\](?:<(\d+)\.(\d+)>)?$', re.IGNORECASE)
+
+
+class Mailbox:
+    def __init__(self, uidvalidity=1):
+        self.uidvalidity = uidvalidity
+        self.next_uid = 1
+        self.messages = OrderedDict()  # uid -> octets bruts
+        self.flags = {}
+
+
+class FakeIMAPServer(socketserver.ThreadingTCPServer):
+    """Serveur IMAP en mémoire ; append() notifie les sessions en IDLE"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0, user='test@example.com', password='secret', latency=0.0):
+        super().__init__((host, port), _Session)
+        self.user = user
+        self.password = password
+        self.latency = latency
+        self.mailboxes = {'INBOX': Mailbox()}
+        self.lock = threading.Lock()
+        self.sessions = set()
+        self.logins = 0
+        self.commands = 0
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def append(self, raw, mailbox='INBOX'):
+        """Ajoute un message et pousse * n EXISTS aux clients en IDLE"""
+        with self.lock:
+            box = self.mailboxes.setdefault(mailbox, Mailbox())
+            uid = box.next_uid
+            box.next_uid += 1
+            box.messages[uid] = raw
+            box.flags[uid] = set()
+            count = len(box.messages)
+            sessions = list(self.sessions)
+        for session in sessions:
+            if session.idling and session.selected == mailbox:
+                session.send(f'* {count} EXISTS\r\n'.encode())
+        return uid
+
+    def reset_uidvalidity(self, mailbox='INBOX'):
+        with self.lock:
+            self.mailboxes[mailbox].uidvalidity += 1
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+
+class _Session(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.selected = None
+        self.idling = False
+        self.write_lock = threading.Lock()
+        self.server.sessions.add(self)
+
+    def finish(self):
+        self.server.sessions.discard(self)
+        super().finish()
+
+    def send(self, data):
+        with self.write_lock:
+            try:
+                self.wfile.write(data)
+                self.wfile.flush()
+            except OSError:
+                pass
+
+    def handle(self):
+        self.send(b'* OK [CAPABILITY IMAP4rev1 IDLE UIDPLUS] Fake IMAP pret\r\n')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            line = line.decode('utf-8', errors='replace').rstrip('\r\n')
+            if not line:
+                continue
+            parts = line.split(' ', 2)
+            tag = parts[0]
+            command = parts[1].upper() if len(parts) > 1 else ''
+            args = parts[2] if len(parts) > 2 else ''
+            self.server.commands += 1
+            if self.server.latency:
+                time.sleep(self.server.latency)
+
+            handler = getattr(self, f'cmd_{command.lower()}', None)
+            if handler is None:
+                self.send(f'{tag} BAD commande inconnue\r\n'.encode())
+                continue
+            try:
+                if handler(tag, args) is False:
+                    return
+            except Exception as e:
+                self.send(f'{tag} BAD {e}\r\n'.encode())
+
+    # --- Commandes ---
+
+    def cmd_capability(self, tag, args):
+        self.send(f'* CAPABILITY IMAP4rev1 IDLE UIDPLUS\r\n{tag} OK CAPABILITY\r\n'.encode())
+
+    def cmd_login(self, tag, args):
+        user, password = [a.strip('"') for a in args.split(' ', 1)]
+        if user == self.server.user and password == self.server.password:
+            self.server.logins += 1
+            self.send(f'{tag} OK LOGIN completed\r\n'.encode())
+        else:
+            self.send(f'{tag} NO [AUTHENTICATIONFAILED] identifiants invalides\r\n'.encode())
+
+    def cmd_noop(self, tag, args):
+        self.send(f'{tag} OK NOOP\r\n'.encode())
+
+    def cmd_logout(self, tag, args):
+        self.send(f'* BYE\r\n{tag} OK LOGOUT\r\n'.encode())
+        return False
+
+    def cmd_select(self, tag, args, readonly=False):
+        name = args.strip().strip('"')
+        box = self.server.mailboxes.get(name)
+        if box is None:
+            self.send(f'{tag} NO boite inconnue\r\n'.encode())
+            return
+        self.selected = name
+        mode = 'READ-ONLY' if readonly else 'READ-WRITE'
+        self.send((f'* {len(box.messages)} EXISTS\r\n* 0 RECENT\r\n'
+                   f'* OK [UIDVALIDITY {box.uidvalidity}] UIDs valid\r\n'
+                   f'* OK [UIDNEXT {box.next_uid}] Predicted next UID\r\n'
+                   f'{tag} OK [{mode}] SELECT completed\r\n').encode())
+
+    def cmd_examine(self, tag, args):
+        return self.cmd_select(tag, args, readonly=True)
+
+    def cmd_status(self, tag, args):
+        name = args.split(' ', 1)[0].strip('"')
+        box = self.server.mailboxes.get(name)
+        if box is None:
+            self.send(f'{tag} NO boite inconnue\r\n'.encode())
+            return
+        self.send((f'* STATUS {name} (MESSAGES {len(box.messages)} UIDNEXT {box.next_uid} '
+                   f'UIDVALIDITY {box.uidvalidity})\r\n{tag} OK STATUS\r\n').encode())
+
+    def cmd_close(self, tag, args):
+        self.selected = None
+        self.send(f'{tag} OK CLOSE\r\n'.encode())
+
+    def cmd_idle(self, tag, args):
+        self.idling = True
+        self.send(b'+ idling\r\n')
+        while True:
+            line = self.rfile.readline()
+            if not line or line.strip().upper() == b'DONE':
+                break
+        self.idling = False
+        self.send(f'{tag} OK IDLE terminated\r\n'.encode())
+
+    def cmd_uid(self, tag, args):
+        sub, _, rest = args.partition(' ')
+        sub = sub.upper()
+        box = self.server.mailboxes.get(self.selected)
+        if box is None:
+            self.send(f'{tag} BAD aucune boite selectionnee\r\n'.encode())
+            return
+        if sub == 'SEARCH':
+            self._search(tag, box, rest)
+        elif sub == 'FETCH':
+            uids, _, items = rest.partition(' ')
+            self._fetch(tag, box, uids, items)
+        elif sub == 'STORE':
+            uids, _, rest = rest.partition(' ')
+            for uid in self._resolve(box, uids):
+                box.flags[uid].update(re.findall(r'\\\w+', rest))
+            self.send(f'{tag} OK STORE\r\n'.encode())
+        else:
+            self.send(f'{tag} BAD UID {sub}\r\n'.encode())
+
+    # --- Outils ---
+
+    def _resolve(self, box, spec):
+        """Résout un ensemble d'UID ("1:5,8,10:*") sur les messages présents"""
+        # UID croissants (ordre d'ajout) : chaque intervalle est localisé par dichotomie,
+        # un ensemble de milliers d'intervalles ne reparcourt pas toute la boîte
+        uids = list(box.messages)
+        if not uids:
+            return []
+        highest = uids[-1]
+        wanted = set()
+        for chunk in spec.split(','):
+            match = _SET_RE.match(chunk)
+            if not match:
+                raise ValueError(f'ensemble invalide {chunk}')
+            low = highest if match.group(1) == '*' else int(match.group(1))
+            high = match.group(2)
+            high = low if high is None else (highest if high == '*' else int(high))
+            low, high = min(low, high), max(low, high)
+            wanted.update(uids[bisect_left(uids, low):bisect_right(uids, high)])
+        return sorted(wanted)
+
+    def _search(self, tag, box, criteria):
+        criteria = criteria.strip()
+        if criteria.upper().startswith('CHARSET'):
+            criteria = criteria.split(' ', 2)[2]
+        if criteria.upper() == 'ALL':
+            uids = list(box.messages)
+        elif criteria.upper().startswith('UID '):
+            uids = self._resolve(box, criteria[4:].strip())
+        else:
+            self.send(f'{tag} BAD critere non supporte\r\n'.encode())
+            return
+        self.send(f'* SEARCH {" ".join(map(str, uids))}\r\n{tag} OK SEARCH\r\n'.encode())
+
+    def _fetch(self, tag, box, spec, items):
+        items = items.strip()
+        if items.startswith('(') and items.endswith(')'):
+            items = items[1:-1]
+        attributes = re.findall(r'BODY(?:\.PEEK)?\[[^\]]*\](?:<\d+\.\d+>)?|[A-Z0-9.]+', items, re.IGNORECASE)
+        positions = {uid: i + 1 for i, uid in enumerate(box.messages)}
+
+        for uid in self._resolve(box, spec):
+            raw = box.messages[uid]
+            out = [f'UID {uid}'.encode()]
+            for attribute in attributes:
+                upper = attribute.upper()
+                if upper == 'UID':
+                    continue
+                if upper == 'FLAGS':
+                    out.append(f'FLAGS ({" ".join(sorted(box.flags[uid]))})'.encode())
+                elif upper == 'RFC822':
+                    out.append(_literal(b'RFC822', raw))
+                    box.flags[uid].add('\\Seen')
+                elif upper == 'RFC822.SIZE':
+                    out.append(f'RFC822.SIZE {len(raw)}'.encode())
+                elif upper == 'BODYSTRUCTURE':
+                    out.append(b'BODYSTRUCTURE ' + bodystructure(email.message_from_bytes(raw)))
+                else:
+                    match = _SECTION_RE.match(attribute)
+                    if not match:
+                        raise ValueError(f'attribut non supporte {attribute}')
+                    kind, section, origin, length = match.groups()
+                    content = _section(raw, section)
+                    key = f'BODY[{section}]'
+                    if origin is not None:
+                        content = content[int(origin):int(origin) + int(length)]
+                        key += f'<{origin}>'
+                    out.append(_literal(key.encode(), content))
+                    if kind.upper() == 'BODY':
+                        box.flags[uid].add('\\Seen')
+            self.send(b'* %d FETCH (' % positions[uid] + b' '.join(out) + b')\r\n')
+        self.send(f'{tag} OK FETCH\r\n'.encode())
+
+
+def _literal(key, content):
+    return key + b' {%d}\r\n' % len(content) + content
+
+
+def _quote(value):
+    if value is None:
+        return b'NIL'
+    value = str(value).replace('\\', '\\\\').replace('"', '\\"')
+    return b'"' + value.encode('utf-8') + b'"'
+
+
+def bodystructure(part):
+    """Calcule le BODYSTRUCTURE IMAP d'un message (compat32)"""
+    if part.is_multipart():
+        children = b''.join(bodystructure(child) for child in part.get_payload())
+        return b'(' + children + b' ' + _quote(part.get_content_subtype().upper()) + b')'
+
+    maintype = part.get_content_maintype().upper()
+    subtype = part.get_content_subtype().upper()
+    params = [(k, v) for k, v in part.get_params()[1:]] if part.get_params() else []
+    params_bytes = b'(' + b' '.join(_quote(k.upper()) + b' ' + _quote(v) for k, v in params) + b')' if params else b'NIL'
+    encoding = part.get('Content-Transfer-Encoding', '7BIT').upper()
+    payload = part.get_payload()
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8', errors='surrogateescape')
+    else:
+        payload = b''
+    disposition = part.get_content_disposition()
+    if disposition:
+        filename = part.get_filename()
+        disp_params = b'(' + _quote('FILENAME') + b' ' + _quote(filename) + b')' if filename else b'NIL'
+        disposition_bytes = b'(' + _quote(disposition.upper()) + b' ' + disp_params + b')'
+    else:
+        disposition_bytes = b'NIL'
+
+    fields = [_quote(maintype), _quote(subtype), params_bytes, b'NIL', b'NIL', _quote(encoding), str(len(payload)).encode()]
+    if maintype == 'TEXT':
+        fields.append(str(payload.count(b'\n') + 1).encode())
+    fields += [b'NIL', disposition_bytes, b'NIL']
+    return b'(' + b' '.join(fields) + b')'
+
+
+def _split_raw(raw):
+    separator = raw.find(b'\r\n\r\n')
+    if separator == -1:
+        separator = raw.find(b'\n\n')
+        return raw[:separator + 1], raw[separator + 2:]
+    return raw[:separator + 2], raw[separator + 4:]
+
+
+def _section(raw, section):
+    """Contenu brut d'une section (HEADER, HEADER.FIELDS (...), TEXT, 1, 1.2, ...)"""
+    header, body = _split_raw(raw)
+    upper = section.upper()
+    if upper == '':
+        return raw
+    if upper == 'HEADER':
+        return header + b'\r\n'
+    if upper == 'TEXT':
+        return body
+    if upper.startswith('HEADER.FIELDS'):
+        wanted = {f.upper() for f in re.findall(r'[\w-]+', upper[len('HEADER.FIELDS'):])}
+        wanted.discard('NOT')
+        lines = []
+        keep = False
+        for line in header.splitlines(keepends=True):
+            if line[:1] in (b' ', b'\t'):
+                if keep:
+                    lines.append(line)
+                continue
+            name = line.split(b':', 1)[0].decode('ascii', errors='replace').upper()
+            keep = name in wanted
+            if keep:
+                lines.append(line)
+        return b''.join(lines) + b'\r\n'
+
+    part = email.message_from_bytes(raw)
+    for index in section.split('.'):
+        if part.is_multipart():
+            part = part.get_payload()[int(index) - 1]
+        elif index != '1':
+            return b''
+    payload = part.get_payload()
+    if isinstance(payload, str):
+        return payload.encode('utf-8', errors='surrogateescape')
+    return part.as_bytes()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serveur IMAP local pour mail2tasks")
+    parser.add_argument('--port', type=int, default=1143)
+    parser.add_argument('--emails', type=int, default=100)
+    parser.add_argument('--user', default='test@example.com')
+    parser.add_argument('--password', default='secret')
+    parser.add_argument('--latency', type=float, default=0.0, help="délai par commande (s)")
+    parser.add_argument('--corpus', action='store_true', help="corpus varié (corpus.py) au lieu d'emails minimaux")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    server = FakeIMAPServer(port=args.port, user=args.user, password=args.password, latency=args.latency)
+    if args.corpus:
+        from corpus import generate
+        for raw, _ in generate(args.emails, args.seed):
+            server.append(raw)
+    else:
+        for i in range(args.emails):
+            server.append((f'Subject: Email {i}\r\nFrom: test@example.com\r\nMessage-ID: <{i}@fake>\r\n\r\n'
+                           f'Merci de preparer le rapport {i}.\r\n').encode())
+    print(f"Fake IMAP sur 127.0.0.1:{server.port} ({args.emails} emails)")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+"""
+Imitation locale de l'endpoint chat-completions de Mistral.
+
+Latence, taux d'erreurs 5xx et de 429 (avec Retry-After) configurables.
+La réponse est un objet JSON {"tasks": [...]} déduit du prompt ({"emails": [...]}
+pour les prompts multi-emails), avec un champ usage. Une part des réponses peut
+être dégradée comme celles d'un vrai modèle (texte autour du JSON, virgule en
+trop, réponse tronquée, date ou priorité hors format...) ; les relances sur les
+champs invalides reçoivent des corrections.
+
+    python benchmarks/mock_mistral.py --port 8089 --latency 0.5 --rate-429 0.05 --malformed-rate 0.2
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockMistralServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.2, jitter=0.0, error_rate=0.0,
+                 rate_429=0.0, retry_after=1, max_concurrency=0, drop_rate=0.0, malformed_rate=0.0):
+        super().__init__((host, port), _Handler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        # Au-delà de max_concurrency requêtes simultanées, le mock répond 429
+        self.max_concurrency = max_concurrency
+        self.drop_rate = drop_rate
+        self.malformed_rate = malformed_rate
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.stats = {'requests': 0, 'ok': 0, '429': 0, '5xx': 0, 'malformed': 0, 'reasks': 0,
+                      'prompt_tokens': 0, 'completion_tokens': 0}
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}/v1/chat/completions"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+def fake_task(subject):
+    return {
+        'tache': (subject or 'Tâche')[:60],
+        'priorite': 'haute' if 'urgent' in subject.lower() else 'moyenne',
+        'deadline': None,
+        'info': 'Réponse simulée',
+    }
+
+
+def fake_tasks(content):
+    """Une tâche par élément "- ..." du corps (email aux demandes multiples), sinon une tâche d'après le sujet"""
+    subject = re.search(r'Sujet: (.*)', content)
+    subject = subject.group(1) if subject else ''
+    # Les corps arrivent aux espaces normalisés : "intro - demande 1 - demande 2"
+    body = content.split('Corps:', 1)[-1].split('Conversation:', 1)[-1]
+    bullets = [b.strip() for b in re.findall(r'(?:^|\s)- (.+?)(?=\s+- |\s*\n|$)', body, re.MULTILINE)]
+    if bullets:
+        return [dict(fake_task(subject), tache=bullet[:60]) for bullet in bullets]
+    return [fake_task(subject)]
+
+
+def fake_corrections(request):
+    """Valeurs valides pour chaque champ cité dans une relance ("email E3, tâche 0, champ "deadline" : ...")"""
+    values = {'tache': 'Tâche précisée', 'priorite': 'moyenne', 'deadline': '2025-06-30', 'info': ''}
+    corrections = []
+    for email_id, index, field in re.findall(r'^- (?:email (\S+), )?tâche (\d+), champ "(\w+)"', request, re.MULTILINE):
+        correction = {'id': email_id} if email_id else {}
+        corrections.append(dict(correction, index=int(index), **{field: values.get(field)}))
+    return {'corrections': corrections}
+
+
+# Défauts observés dans les réponses de modèles, appliqués au JSON (kind, texte) ou aux valeurs
+MALFORMATIONS = ['prose', 'trailing_comma', 'truncated', 'single_quotes', 'bad_deadline', 'bad_priority',
+                 'missing_tache', 'no_json']
+
+
+def malform(data, kind):
+    """Réponse dégradée selon kind à partir d'une réponse valide {"tasks"} ou {"emails"}"""
+    tasks = data['emails'][0]['tasks'] if 'emails' in data else data['tasks']
+    if kind == 'bad_deadline':
+        tasks[0]['deadline'] = 'vendredi prochain'
+    elif kind == 'bad_priority':
+        tasks[0]['priorite'] = 'critique'
+    elif kind == 'missing_tache':
+        del tasks[0]['tache']
+    text = json.dumps(data, ensure_ascii=False, indent=2)
+    if kind == 'prose':
+        return f"Voici les tâches extraites :\n```json\n{text}\n```"
+    if kind == 'trailing_comma':
+        # Virgule après la dernière valeur du premier objet refermé
+        return re.sub(r'(\S)(\n\s*\})', r'\1,\2', text, count=1)
+    if kind == 'truncated':
+        return text[:int(len(text) * 0.85)]
+    if kind == 'single_quotes':
+        return repr(data)
+    if kind == 'no_json':
+        return "Je n'ai pas pu identifier de tâche précise dans cet email."
+    return text
+
+
+def fake_completion(messages, drop_rate=0.0, malformed_rate=0.0):
+    """
+    Réponse plausible : les tâches déduites du sujet (et des lignes "- ...") présents
+    dans le prompt, ou un objet par bloc "### EMAIL <id>" pour les prompts groupés
+    (drop_rate : part des éléments omis pour exercer la reprise individuelle).
+    Une relance reçoit les corrections demandées (ou la réponse complète, sans défaut).
+    """
+    request = messages[-1].get('content', '') if messages else ''
+    if len(messages) > 1 and 'champs de ta réponse sont invalides' in request:
+        return json.dumps(fake_corrections(request), ensure_ascii=False), None
+    prompt = messages[0].get('content', '') if messages else ''
+
+    blocks = re.findall(r'^### EMAIL (\S+)\n(.*?)(?=^### EMAIL |^Réponse JSON)', prompt, re.MULTILINE | re.DOTALL)
+    if blocks:
+        data = {'emails': [{'id': email_id, 'tasks': fake_tasks(content)}
+                           for email_id, content in blocks if random.random() >= drop_rate]}
+        if not data['emails']:
+            return json.dumps(data), None
+    else:
+        content = prompt.split("Contenu de l'email :")[-1].split('# Limite pour')[0]
+        data = {'tasks': fake_tasks(content)}
+
+    if len(messages) == 1 and random.random() < malformed_rate:
+        kind = random.choice(MALFORMATIONS)
+        return malform(data, kind), kind
+    return json.dumps(data, ensure_ascii=False), None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        server = self.server
+        payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        with server.lock:
+            server.stats['requests'] += 1
+            server.in_flight += 1
+            overloaded = server.max_concurrency and server.in_flight > server.max_concurrency
+        try:
+            if overloaded or random.random() < server.rate_429:
+                with server.lock:
+                    server.stats['429'] += 1
+                self._reply(429, {'message': 'Requests rate limit exceeded'}, {'Retry-After': str(server.retry_after)})
+                return
+
+            time.sleep(max(0.0, server.latency + random.uniform(-server.jitter, server.jitter)))
+
+            if random.random() < server.error_rate:
+                with server.lock:
+                    server.stats['5xx'] += 1
+                self._reply(503, {'message': 'Service unavailable'})
+                return
+
+            messages = payload.get('messages', [])
+            prompt = ''.join(m.get('content', '') for m in messages)
+            content, malformation = fake_completion(messages, server.drop_rate, server.malformed_rate)
+            usage = {'prompt_tokens': estimate_tokens(prompt), 'completion_tokens': estimate_tokens(content)}
+            usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+            with server.lock:
+                server.stats['ok'] += 1
+                server.stats['malformed'] += malformation is not None
+                server.stats['reasks'] += len(messages) > 1
+                server.stats['prompt_tokens'] += usage['prompt_tokens']
+                server.stats['completion_tokens'] += usage['completion_tokens']
+            self._reply(200, {
+                'id': 'mock',
+                'object': 'chat.completion',
+                'model': payload.get('model'),
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+                'usage': usage,
+            })
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock local de l'API Mistral")
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', type=float, default=0.5)
+    parser.add_argument('--jitter', type=float, default=0.1)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-429', type=float, default=0.0)
+    parser.add_argument('--retry-after', type=float, default=1)
+    parser.add_argument('--max-concurrency', type=int, default=0)
+    parser.add_argument('--drop-rate', type=float, default=0.0)
+    parser.add_argument('--malformed-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = MockMistralServer(port=args.port, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                               rate_429=args.rate_429, retry_after=args.retry_after,
+                               max_concurrency=args.max_concurrency, drop_rate=args.drop_rate,
+                               malformed_rate=args.malformed_rate)
+    print(f"Mock Mistral sur {server.url}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
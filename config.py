@@ -3,15 +3,63 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+# Journalisation (configurée une fois par le point d'entrée : application web ou commande)
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+# Templates Jinja compilés gardés sur disque : un processus neuf ne les recompile pas (vide = dossier temporaire)
+TEMPLATE_BYTECODE_CACHE = os.getenv('TEMPLATE_BYTECODE_CACHE', 'true').lower() in ('1', 'true', 'yes')
+TEMPLATE_CACHE_DIR = os.getenv('TEMPLATE_CACHE_DIR') or None
+
 # Configuration IMAP
 IMAP_SERVER = os.getenv('IMAP_SERVER', 'imap.gmail.com')
 IMAP_PORT = int(os.getenv('IMAP_PORT', 993))
 EMAIL_ADDRESS = os.getenv('EMAIL_ADDRESS')
 EMAIL_PASSWORD = os.getenv('EMAIL_PASSWORD')
+IMAP_USE_SSL = os.getenv('IMAP_USE_SSL', 'true').lower() in ('1', 'true', 'yes')
+IMAP_TIMEOUT = int(os.getenv('IMAP_TIMEOUT', 30))
+
+# Sessions IMAP persistantes et IDLE
+IMAP_POOL_SIZE = int(os.getenv('IMAP_POOL_SIZE', 2))
+IMAP_NOOP_INTERVAL = int(os.getenv('IMAP_NOOP_INTERVAL', 60))  # NOOP de contrôle au-delà de ce délai d'inactivité
+IMAP_RECONNECT_ATTEMPTS = int(os.getenv('IMAP_RECONNECT_ATTEMPTS', 5))
+IMAP_RECONNECT_MAX_DELAY = int(os.getenv('IMAP_RECONNECT_MAX_DELAY', 60))
+IMAP_IDLE_ENABLED = os.getenv('IMAP_IDLE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+IMAP_IDLE_TIMEOUT = int(os.getenv('IMAP_IDLE_TIMEOUT', 600))  # IDLE renouvelé avant la coupure serveur (~29 min)
+
+# Synchronisation incrémentale (watermarks UIDVALIDITY/UID)
+SYNC_MAILBOX = os.getenv('SYNC_MAILBOX', 'INBOX')
+INITIAL_SYNC_LIMIT = int(os.getenv('INITIAL_SYNC_LIMIT', 10))  # emails repris lors d'une resync complète
+SYNC_MAX_EMAILS = int(os.getenv('SYNC_MAX_EMAILS', 200))  # plafond par synchronisation, le reste suit au prochain passage
+SYNC_INGEST_BATCH_SIZE = int(os.getenv('SYNC_INGEST_BATCH_SIZE', 25))  # résultats enregistrés par transaction
+SYNC_ACCOUNT_WORKERS = int(os.getenv('SYNC_ACCOUNT_WORKERS', 8))  # dossiers synchronisés en parallèle, tous comptes confondus
+SYNC_JOB_HEARTBEAT_INTERVAL = float(os.getenv('SYNC_JOB_HEARTBEAT_INTERVAL', 10))  # signe de vie d'un job en cours (s)
+SYNC_JOB_STALE_AFTER = float(os.getenv('SYNC_JOB_STALE_AFTER', 60))  # sans signe de vie depuis ce délai : job abandonné
 
 # Configuration Mistral AI
 MISTRAL_API_KEY = os.getenv('MISTRAL_API_KEY')
-MISTRAL_API_URL = "https://api.mistral.ai/v1/chat/completions"
+MISTRAL_API_URL = os.getenv('MISTRAL_API_URL', "https://api.mistral.ai/v1/chat/completions")
+MISTRAL_MODEL = os.getenv('MISTRAL_MODEL', 'mistral-small-latest')
+
+# Extraction concurrente : parallélisme borné, débit limité, reprises
+MISTRAL_MAX_CONCURRENCY = int(os.getenv('MISTRAL_MAX_CONCURRENCY', 4))
+MISTRAL_RATE_LIMIT = float(os.getenv('MISTRAL_RATE_LIMIT', 5))  # requêtes par seconde (token bucket)
+MISTRAL_TIMEOUT = float(os.getenv('MISTRAL_TIMEOUT', 30))
+MISTRAL_MAX_RETRIES = int(os.getenv('MISTRAL_MAX_RETRIES', 3))
+
+# Prompts multi-emails : plusieurs emails par appel dans la limite d'un budget de tokens (0 = désactivé)
+MISTRAL_BATCH_TOKEN_BUDGET = int(os.getenv('MISTRAL_BATCH_TOKEN_BUDGET', 6000))
+MISTRAL_BATCH_MAX_EMAILS = int(os.getenv('MISTRAL_BATCH_MAX_EMAILS', 10))
+
+# Sortie structurée : mode JSON de l'API, relances limitées aux champs invalides
+MISTRAL_JSON_MODE = os.getenv('MISTRAL_JSON_MODE', 'true').lower() in ('1', 'true', 'yes')
+EXTRACTION_REPAIR_ROUNDS = int(os.getenv('EXTRACTION_REPAIR_ROUNDS', 1))
+EXTRACTION_MAX_TASKS = int(os.getenv('EXTRACTION_MAX_TASKS', 5))  # tâches retenues par email
+MISTRAL_REPLY_LOG = os.getenv('MISTRAL_REPLY_LOG')  # fichier JSONL où enregistrer les réponses brutes (corpus de mesure)
+
+# Cache des extractions : LRU en mémoire devant la table SQLite extraction_cache
+EXTRACTION_CACHE_ENABLED = os.getenv('EXTRACTION_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+EXTRACTION_CACHE_TTL_DAYS = float(os.getenv('EXTRACTION_CACHE_TTL_DAYS', 30))
+EXTRACTION_CACHE_MAX_ENTRIES = int(os.getenv('EXTRACTION_CACHE_MAX_ENTRIES', 20000))
+EXTRACTION_CACHE_MEMORY_SIZE = int(os.getenv('EXTRACTION_CACHE_MEMORY_SIZE', 512))
 
 # 🔥 LISTE ÉTENDUE DES MOTS-CLÉS
 KEYWORDS = [
@@ -43,5 +91,49 @@ KEYWORDS = [
     'correction', 'correctif', 'hotfix', 'patch', 'correct'
 ]
 
+# Poids des mots-clés pour le score de pertinence (défaut : KEYWORD_DEFAULT_WEIGHT).
+# Les mots très génériques pèsent peu : seuls, ils ne suffisent pas à rendre un email pertinent.
+KEYWORD_DEFAULT_WEIGHT = 1.0
+KEYWORD_WEIGHTS = {
+    'urgent': 3, 'urgence': 3, 'asap': 3, 'deadline': 3, 'dead line': 3, 'date limite': 3,
+    'échéance': 3, 'à faire': 2, 'todo': 2, 'à réaliser': 2, 'action': 2, 'tâche': 2, 'task': 2,
+    'livrable': 2, 'deliverable': 2, 'rendre': 2, 'submit': 2, 'due': 2, 'priorité': 2, 'priority': 2,
+    'obligatoire': 2, 'impératif': 2, 'reminder': 2, 'rappeler': 2, 'réunion': 2, 'meeting': 2,
+    'mail': 0.25, 'email': 0.25, 'message': 0.25, 'new': 0.25, 'nouveau': 0.25, 'file': 0.25,
+    'high': 0.25, 'fast': 0.25, 'quick': 0.25, 'soon': 0.25, 'change': 0.25, 'plan': 0.5,
+    'contact': 0.5, 'work': 0.5, 'solution': 0.5, 'test': 0.5, 'control': 0.5, 'correct': 0.5,
+}
+KEYWORD_MIN_SCORE = float(os.getenv('KEYWORD_MIN_SCORE', 1.0))  # score minimal pour qu'un email soit retenu
+
+# Pré-classifieur local (Naive Bayes) : seuls les emails probablement actionnables vont à l'IA
+PRECLASSIFIER_ENABLED = os.getenv('PRECLASSIFIER_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+PRECLASSIFIER_THRESHOLD = float(os.getenv('PRECLASSIFIER_THRESHOLD', 0.3))
+PRECLASSIFIER_MIN_SAMPLES = int(os.getenv('PRECLASSIFIER_MIN_SAMPLES', 20))  # exemples requis par classe
+PRECLASSIFIER_EXPLORATION = float(os.getenv('PRECLASSIFIER_EXPLORATION', 0.05))  # part des rejets envoyée quand même
+
+# Détection des tâches en double (MinHash/LSH sur les trigrammes du texte)
+TASK_SIMILARITY_THRESHOLD = float(os.getenv('TASK_SIMILARITY_THRESHOLD', 0.6))  # Jaccard minimal
+TASK_LSH_BANDS = int(os.getenv('TASK_LSH_BANDS', 20))
+TASK_LSH_ROWS = int(os.getenv('TASK_LSH_ROWS', 3))
+
+# Instrumentation : durées par étape, compteurs et tokens (/metrics, table sync_runs)
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+SYNC_RUNS_KEPT = int(os.getenv('SYNC_RUNS_KEPT', 500))  # résumés de synchronisation conservés
+
+# Tableau de bord en direct (/events) : deltas des tâches et avancement de la synchronisation
+TASK_CHANGES_KEPT = int(os.getenv('TASK_CHANGES_KEPT', 10000))  # modifications rejouables après une déconnexion
+EVENTS_POLL_INTERVAL = float(os.getenv('EVENTS_POLL_INTERVAL', 0.5))
+EVENTS_STREAM_TIMEOUT = int(os.getenv('EVENTS_STREAM_TIMEOUT', 300))  # le navigateur se reconnecte (Last-Event-ID)
+
+# Cache du tableau de bord : pages rendues gardées en mémoire tant que la version des données ne change pas
+DASHBOARD_CACHE_ENABLED = os.getenv('DASHBOARD_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+DASHBOARD_CACHE_SIZE = int(os.getenv('DASHBOARD_CACHE_SIZE', 64))  # combinaisons de filtres/pages gardées
+
 # Configuration de la base de données
-DATABASE_NAME = 'tasks.db'
\ No newline at end of file
+DATABASE_NAME = os.getenv('DATABASE_NAME', 'tasks.db')
+SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')  # lecteurs et écrivain ne se bloquent plus
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')  # sûr en WAL, sans fsync à chaque commit
+SQLITE_CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', 16384))
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 128 * 1024 * 1024))
+SQLITE_BUSY_TIMEOUT = float(os.getenv('SQLITE_BUSY_TIMEOUT', 10))  # secondes d'attente d'un verrou
+SQLITE_STATEMENT_CACHE = int(os.getenv('SQLITE_STATEMENT_CACHE', 256))  # requêtes préparées gardées par connexion
\ No newline at end of file
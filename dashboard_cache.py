@@ -0,0 +1,78 @@
+import threading
+from collections import OrderedDict
+from config import DASHBOARD_CACHE_ENABLED, DASHBOARD_CACHE_SIZE
+from database import get_data_version
+
+
+def query_key(query):
+    """Clé d'une vue du tableau de bord : filtres, tri et curseur normalisés"""
+    return tuple(sorted((name, tuple(value) if isinstance(value, list) else value)
+                        for name, value in query.items()))
+
+
+class DashboardCache:
+    """
+    Vues du tableau de bord (tâches, compteurs, cartes rendues) gardées en mémoire (LRU).
+    Chaque entrée est liée à la version des données (get_data_version) : dès qu'une
+    écriture la fait avancer, dans ce processus ou un autre, tout le cache est périmé.
+    """
+
+    def __init__(self, size=DASHBOARD_CACHE_SIZE, enabled=DASHBOARD_CACHE_ENABLED):
+        self.size = size
+        self.enabled = enabled
+        self._entries = OrderedDict()  # clé de la vue -> données calculées par build()
+        self._version = None
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def get(self, query, build):
+        """
+        Retourne la vue pour ces filtres, calculée par build() au premier appel et
+        après chaque changement de version
+        """
+        if not self.enabled:
+            return build()
+        key = query_key(query)
+        # Lue avant build() : une écriture concurrente laisse l'entrée sous l'ancienne
+        # version, la requête suivante la recalcule
+        version = get_data_version()
+
+        with self._lock:
+            if version != self._version:
+                if self._entries:
+                    self.stats['invalidations'] += 1
+                self._entries.clear()
+                self._version = version
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return entry
+            self.stats['misses'] += 1
+
+        entry = build()
+        with self._lock:
+            if version == self._version:
+                self._entries[key] = entry
+                while len(self._entries) > self.size:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._version = None
+
+    def get_stats(self):
+        """Compteurs de hits/misses et taille, pour l'API"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self._entries)
+            stats['version'] = self._version
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+        stats['enabled'] = self.enabled
+        return stats
+
+
+dashboard_cache = DashboardCache()
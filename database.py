@@ -1,15 +1,72 @@
 import sqlite3
 import logging
 import hashlib
-from datetime import datetime
-from config import DATABASE_NAME
+import json
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from config import DATABASE_NAME, SQLITE_JOURNAL_MODE, SQLITE_SYNCHRONOUS, SQLITE_CACHE_SIZE_KB
+from config import SQLITE_MMAP_SIZE, SQLITE_BUSY_TIMEOUT, SQLITE_STATEMENT_CACHE, TASK_SIMILARITY_THRESHOLD
+from config import IMAP_SERVER, IMAP_PORT, EMAIL_ADDRESS, IMAP_USE_SSL, IMAP_POOL_SIZE, SYNC_MAILBOX
+from config import SYNC_RUNS_KEPT, TASK_CHANGES_KEPT, SYNC_JOB_STALE_AFTER
+from task_similarity import lsh, shingles, jaccard, numbers
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# CONNEXIONS PARTAGÉES
+
+_local = threading.local()
+
+def open_connection(path=None):
+    """Ouvre une connexion configurée (WAL, cache, mmap, attente des verrous)"""
+    conn = sqlite3.connect(path or DATABASE_NAME, timeout=SQLITE_BUSY_TIMEOUT,
+                           cached_statements=SQLITE_STATEMENT_CACHE)
+    conn.execute(f'PRAGMA journal_mode = {SQLITE_JOURNAL_MODE}')
+    conn.execute(f'PRAGMA synchronous = {SQLITE_SYNCHRONOUS}')
+    conn.execute(f'PRAGMA cache_size = -{SQLITE_CACHE_SIZE_KB}')
+    conn.execute(f'PRAGMA mmap_size = {SQLITE_MMAP_SIZE}')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    return conn
+
+def get_connection():
+    """
+    Connexion du thread courant, ouverte une seule fois puis réutilisée :
+    les requêtes préparées restent en cache d'un appel à l'autre.
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.path != DATABASE_NAME:
+        close_connection()
+        conn = _local.conn = open_connection()
+        _local.path = DATABASE_NAME
+    elif conn.in_transaction:
+        # Transaction laissée ouverte par une exception dans un appel précédent
+        conn.rollback()
+    return conn
+
+def close_connection():
+    """Ferme la connexion du thread courant (elle sera rouverte au besoin)"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+_initialized = set()
+_init_lock = threading.Lock()
+
+def ensure_db():
+    """
+    Initialise la base au premier besoin (première requête, première synchronisation) :
+    une seule fois par fichier et par processus, rien n'est fait à l'import
+    """
+    if DATABASE_NAME not in _initialized:
+        with _init_lock:
+            if DATABASE_NAME not in _initialized:
+                init_db()
+
 def init_db():
     """Initialise la base de données SQLite"""
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     
     cursor.execute('''
@@ -20,7 +77,11 @@ def init_db():
             deadline TEXT,
             info TEXT,
             status INTEGER DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            source_text TEXT,
+            source_subject TEXT,
+            source_sender TEXT,
+            account_id INTEGER
         )
     ''')
     
@@ -30,34 +91,349 @@ def init_db():
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             email_subject TEXT NOT NULL,
             email_body_hash TEXT NOT NULL,
-            processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            message_key TEXT
+        )
+    ''')
+    
+    # Comptes IMAP synchronisés ; une colonne NULL reprend la valeur du .env
+    # (le mot de passe n'est jamais stocké : password_env nomme sa variable d'environnement)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS accounts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            imap_server TEXT,
+            imap_port INTEGER,
+            email_address TEXT,
+            password_env TEXT,
+            use_ssl INTEGER,
+            folders TEXT,
+            max_connections INTEGER,
+            enabled INTEGER NOT NULL DEFAULT 1,
+            last_sync_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('SELECT COUNT(*) FROM accounts')
+    if cursor.fetchone()[0] == 0:
+        cursor.execute("INSERT INTO accounts (name) VALUES ('default')")
+        logger.info("📮 Compte 'default' créé à partir de la configuration")
+    
+    # Watermarks IMAP par compte et par boîte pour la synchronisation incrémentale
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS mailbox_state (
+            account_id INTEGER NOT NULL,
+            mailbox TEXT NOT NULL,
+            uidvalidity INTEGER NOT NULL,
+            last_uid INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (account_id, mailbox)
+        )
+    ''')
+    migrate_mailbox_state(cursor)
+    
+    # Suivi des synchronisations exécutées en arrière-plan
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sync_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            status TEXT NOT NULL DEFAULT 'pending',
+            total INTEGER DEFAULT 0,
+            processed INTEGER DEFAULT 0,
+            tasks_added INTEGER DEFAULT 0,
+            skipped INTEGER DEFAULT 0,
+            errors INTEGER DEFAULT 0,
+            message TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP,
+            filtered INTEGER DEFAULT 0,
+            tasks_updated INTEGER DEFAULT 0
+        )
+    ''')
+    
+    # Résumé de chaque synchronisation : compteurs, tokens et durée par étape (JSON)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sync_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_id INTEGER,
+            status TEXT NOT NULL,
+            started_at TIMESTAMP NOT NULL,
+            finished_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            duration_s REAL NOT NULL,
+            emails_seen INTEGER DEFAULT 0,
+            relevant INTEGER DEFAULT 0,
+            skipped INTEGER DEFAULT 0,
+            filtered INTEGER DEFAULT 0,
+            extracted INTEGER DEFAULT 0,
+            tasks_added INTEGER DEFAULT 0,
+            tasks_updated INTEGER DEFAULT 0,
+            fallback_tasks INTEGER DEFAULT 0,
+            errors INTEGER DEFAULT 0,
+            llm_requests INTEGER DEFAULT 0,
+            prompt_tokens INTEGER DEFAULT 0,
+            completion_tokens INTEGER DEFAULT 0,
+            stage_seconds TEXT,
+            message TEXT
+        )
+    ''')
+    
+    # Cache persistant des réponses de l'IA (clé = hash du contenu normalisé + modèle + version du prompt)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS extraction_cache (
+            cache_key TEXT PRIMARY KEY,
+            model TEXT NOT NULL,
+            prompt_version TEXT NOT NULL,
+            result TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_used_at REAL NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_extraction_cache_last_used ON extraction_cache (last_used_at)')
+    
+    # Email source des tâches supprimées : exemples négatifs du pré-classifieur
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS deleted_task_emails (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            source_text TEXT NOT NULL,
+            deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Index LSH des tâches (bucket MinHash -> tâche) pour retrouver les doublons
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS task_lsh (
+            bucket INTEGER NOT NULL,
+            task_id INTEGER NOT NULL,
+            PRIMARY KEY (bucket, task_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_task_lsh_task ON task_lsh (task_id)')
+    
+    # Conversations : tâche associée à chaque fil, et fil de chaque message connu
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS email_threads (
+            thread_key TEXT PRIMARY KEY,
+            task_id INTEGER,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_email_threads_task ON email_threads (task_id)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS thread_messages (
+            message_key TEXT PRIMARY KEY,
+            thread_key TEXT NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    
+    # Compteurs de modifications par table (ETag / Last-Modified de l'API)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS table_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            updated_at REAL NOT NULL
         )
     ''')
+    cursor.execute("INSERT OR IGNORE INTO table_versions (name, version, updated_at) VALUES ('tasks', 0, ?)",
+                   (time.time(),))
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS tasks_version_{event.lower()} AFTER {event} ON tasks BEGIN
+                UPDATE table_versions SET version = version + 1,
+                       updated_at = (julianday('now') - 2440587.5) * 86400.0
+                WHERE name = 'tasks';
+            END
+        ''')
+    
+    # Emails traités : les triggers tiennent aussi le nombre de lignes (row_count),
+    # lu à la place d'un COUNT(*) qui parcourt toute la table
+    add_column_if_missing(cursor, 'table_versions', 'row_count', 'INTEGER NOT NULL DEFAULT 0')
+    cursor.execute('''
+        INSERT OR IGNORE INTO table_versions (name, version, updated_at, row_count)
+        VALUES ('processed_emails', 0, ?, (SELECT COUNT(*) FROM processed_emails))
+    ''', (time.time(),))
+    for event, delta in (('INSERT', '+'), ('DELETE', '-')):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS processed_emails_version_{event.lower()} AFTER {event} ON processed_emails BEGIN
+                UPDATE table_versions SET version = version + 1, row_count = row_count {delta} 1,
+                       updated_at = (julianday('now') - 2440587.5) * 86400.0
+                WHERE name = 'processed_emails';
+            END
+        ''')
+    
+    # Journal des modifications de tâches, lu par le flux /events du tableau de bord.
+    # status : statut après la modification (avant, pour une suppression)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS task_changes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            task_id INTEGER NOT NULL,
+            op TEXT NOT NULL,
+            status INTEGER
+        )
+    ''')
+    task_change_ops = {
+        'INSERT': ('new', "'insert'"),
+        'UPDATE': ('new', "CASE WHEN old.status = 0 AND new.status = 1 THEN 'done' ELSE 'update' END"),
+        'DELETE': ('old', "'delete'"),
+    }
+    for event, (row, op) in task_change_ops.items():
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS tasks_change_{event.lower()} AFTER {event} ON tasks BEGIN
+                INSERT INTO task_changes (task_id, op, status) VALUES ({row}.id, {op}, {row}.status);
+            END
+        ''')
+    # Purge toutes les 1000 modifications (un import massif n'en paie pas une par ligne) ;
+    # recréé à chaque démarrage pour suivre TASK_CHANGES_KEPT
+    cursor.execute('DROP TRIGGER IF EXISTS task_changes_prune')
+    cursor.execute(f'''
+        CREATE TRIGGER task_changes_prune AFTER INSERT ON task_changes WHEN new.id % 1000 = 0 BEGIN
+            DELETE FROM task_changes WHERE id <= new.id - {TASK_CHANGES_KEPT};
+        END
+    ''')
+    
+    # Bases créées avant l'ajout de ces colonnes
+    add_column_if_missing(cursor, 'tasks', 'source_text', 'TEXT')
+    add_column_if_missing(cursor, 'tasks', 'source_subject', 'TEXT')
+    add_column_if_missing(cursor, 'tasks', 'source_sender', 'TEXT')
+    add_column_if_missing(cursor, 'tasks', 'account_id', 'INTEGER')
+    add_column_if_missing(cursor, 'sync_jobs', 'filtered', 'INTEGER DEFAULT 0')
+    add_column_if_missing(cursor, 'sync_jobs', 'tasks_updated', 'INTEGER DEFAULT 0')
+    add_column_if_missing(cursor, 'sync_jobs', 'heartbeat_at', 'REAL')
+    add_column_if_missing(cursor, 'processed_emails', 'message_key', 'TEXT')
+    migrate_processed_emails(cursor)
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_processed_emails_key ON processed_emails (message_key)')
+    index_missing_tasks(cursor)
+    create_search_index(cursor)
+    configure_search_rank(cursor)
+    
+    # Pagination par curseur : filtre sur le statut puis tri sur la date de création ou la deadline
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_tasks_status_created ON tasks (status, created_at, id)')
+    cursor.execute(f'''
+        CREATE INDEX IF NOT EXISTS idx_tasks_status_deadline ON tasks (status, IFNULL(deadline, '{NO_DEADLINE}'), id)
+    ''')
     
     conn.commit()
-    conn.close()
+    _initialized.add(DATABASE_NAME)
     logger.info("Base de données initialisée")
 
-def add_task(tache, priorite, deadline=None, info=""):
+def add_column_if_missing(cursor, table, column, declaration):
+    """Migration légère : ajoute une colonne à une table existante"""
+    cursor.execute(f'PRAGMA table_info({table})')
+    if column not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {declaration}')
+        logger.info(f"🛠️ Colonne {table}.{column} ajoutée")
+
+def migrate_mailbox_state(cursor):
+    """Watermarks antérieurs aux comptes (clé = boîte seule) : rattachés au premier compte"""
+    cursor.execute('PRAGMA table_info(mailbox_state)')
+    if 'account_id' in [row[1] for row in cursor.fetchall()]:
+        return
+    cursor.execute('ALTER TABLE mailbox_state RENAME TO mailbox_state_legacy')
+    cursor.execute('''
+        CREATE TABLE mailbox_state (
+            account_id INTEGER NOT NULL,
+            mailbox TEXT NOT NULL,
+            uidvalidity INTEGER NOT NULL,
+            last_uid INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (account_id, mailbox)
+        )
+    ''')
+    cursor.execute('''
+        INSERT INTO mailbox_state (account_id, mailbox, uidvalidity, last_uid, updated_at)
+        SELECT (SELECT MIN(id) FROM accounts), mailbox, uidvalidity, last_uid, updated_at FROM mailbox_state_legacy
+    ''')
+    cursor.execute('DROP TABLE mailbox_state_legacy')
+    logger.info("🛠️ Watermarks rattachés au compte par défaut")
+
+def migrate_processed_emails(cursor):
+    """Donne une clé aux lignes antérieures au Message-ID et supprime les doublons"""
+    cursor.execute('''
+        UPDATE processed_emails SET message_key = 'legacy:' || email_body_hash || ':' || email_subject
+        WHERE message_key IS NULL
+    ''')
+    if cursor.rowcount > 0:
+        migrated = cursor.rowcount
+        cursor.execute('''
+            DELETE FROM processed_emails WHERE id NOT IN (
+                SELECT MIN(id) FROM processed_emails GROUP BY message_key
+            )
+        ''')
+        logger.info(f"🛠️ {migrated} emails traités migrés vers les clés de déduplication ({cursor.rowcount} doublons retirés)")
+
+def create_search_index(cursor):
+    """Index plein texte FTS5 des tâches (contenu externe, tenu à jour par triggers)"""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'tasks_fts'")
+    if cursor.fetchone():
+        return
+    try:
+        cursor.execute('''
+            CREATE VIRTUAL TABLE tasks_fts USING fts5(
+                tache, info, source_subject, source_sender,
+                content = 'tasks', content_rowid = 'id',
+                tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        logger.warning(f"⚠️ FTS5 indisponible, recherche désactivée: {e}")
+        return
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_insert AFTER INSERT ON tasks BEGIN
+            INSERT INTO tasks_fts (rowid, tache, info, source_subject, source_sender)
+            VALUES (new.id, new.tache, new.info, new.source_subject, new.source_sender);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_delete AFTER DELETE ON tasks BEGIN
+            INSERT INTO tasks_fts (tasks_fts, rowid, tache, info, source_subject, source_sender)
+            VALUES ('delete', old.id, old.tache, old.info, old.source_subject, old.source_sender);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_update
+        AFTER UPDATE OF tache, info, source_subject, source_sender ON tasks BEGIN
+            INSERT INTO tasks_fts (tasks_fts, rowid, tache, info, source_subject, source_sender)
+            VALUES ('delete', old.id, old.tache, old.info, old.source_subject, old.source_sender);
+            INSERT INTO tasks_fts (rowid, tache, info, source_subject, source_sender)
+            VALUES (new.id, new.tache, new.info, new.source_subject, new.source_sender);
+        END
+    ''')
+    # Tâches existantes
+    cursor.execute("INSERT INTO tasks_fts (tasks_fts) VALUES ('rebuild')")
+    logger.info("🔎 Index de recherche plein texte créé")
+
+# Poids BM25 de la colonne rank : tache, info, sujet de l'email, expéditeur
+SEARCH_RANK = 'bm25(10.0, 2.0, 5.0, 1.0)'
+
+def configure_search_rank(cursor):
+    """Classement par défaut de tasks_fts (colonne rank), enregistré dans l'index lui-même"""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'tasks_fts_config'")
+    if not cursor.fetchone():
+        return
+    cursor.execute("SELECT v FROM tasks_fts_config WHERE k = 'rank'")
+    row = cursor.fetchone()
+    if row is None or row[0] != SEARCH_RANK:
+        cursor.execute("INSERT INTO tasks_fts (tasks_fts, rank) VALUES ('rank', ?)", (SEARCH_RANK,))
+
+def add_task(tache, priorite, deadline=None, info="", source_text=None, source_subject=None, source_sender=None):
     """Ajoute une nouvelle tâche à la base de données"""
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     
     cursor.execute('''
-        INSERT INTO tasks (tache, priorite, deadline, info, status)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (tache, priorite, deadline, info, 0))
+        INSERT INTO tasks (tache, priorite, deadline, info, status, source_text, source_subject, source_sender)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (tache, priorite, deadline, info, 0, source_text, source_subject, source_sender))
+    task_id = cursor.lastrowid
+    index_task(cursor, task_id, tache)
     
     conn.commit()
-    task_id = cursor.lastrowid
-    conn.close()
     
     logger.info(f"Tâche ajoutée: {tache}")
     return task_id
 
 def get_tasks(include_done=False):
     """Récupère toutes les tâches"""
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     
     if include_done:
@@ -72,7 +448,6 @@ def get_tasks(include_done=False):
         ''')
     
     tasks = cursor.fetchall()
-    conn.close()
     
     # Formatage des tâches
     formatted_tasks = []
@@ -89,112 +464,1067 @@ def get_tasks(include_done=False):
     
     return formatted_tasks
 
+# Marqueurs des termes trouvés dans les extraits (caractères à usage privé,
+# remplacés par du HTML une fois le texte échappé)
+SNIPPET_START = '\ue000'
+SNIPPET_END = '\ue001'
+
+# Correspondances classées par recherche, les plus récentes : quelques millisecondes
+# même pour un mot présent dans des centaines de milliers de tâches (BM25 calculé
+# pour chaque correspondance classée)
+SEARCH_CANDIDATES = 1000
+
+def build_search_query(text):
+    """
+    Requête FTS5 sûre : chaque mot entre guillemets, tous requis ; le dernier
+    est un préfixe tant que la saisie n'est pas terminée par un espace
+    """
+    words = re.findall(r'\w+', text)
+    terms = [f'"{word}"' for word in words]
+    if terms and not text[-1:].isspace():
+        terms[-1] += '*'
+    return ' '.join(terms)
+
+def search_tasks(text, limit=20, include_done=False):
+    """Recherche plein texte (classement BM25) dans les tâches et leur email d'origine"""
+    query = build_search_query(text)
+    if not query:
+        return []
+    
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    # Classement dans FTS5 (rank = BM25 pondéré, voir configure_search_rank) parmi les
+    # SEARCH_CANDIDATES correspondances les plus récentes : exact pour un terme présent dans
+    # moins de SEARCH_CANDIDATES tâches, coût borné pour un terme fréquent. Seules les
+    # meilleures sont jointes à tasks pour filtrer le statut ; si trop sont terminées,
+    # deuxième passage sur tous les candidats.
+    fetch = limit if include_done else limit * 4
+    while True:
+        cursor.execute(f'''
+            SELECT tasks.id, tasks.tache, tasks.priorite, tasks.deadline, tasks.info, tasks.status, tasks.created_at,
+                   tasks.source_subject, tasks.source_sender, hits.score
+            FROM (
+                SELECT id, score FROM (
+                    SELECT rowid AS id, rank AS score FROM tasks_fts WHERE tasks_fts MATCH ?
+                    ORDER BY rowid DESC LIMIT ?
+                ) ORDER BY score LIMIT ?
+            ) AS hits
+            JOIN tasks ON tasks.id = hits.id {'' if include_done else 'WHERE tasks.status = 0'}
+            ORDER BY hits.score LIMIT ?
+        ''', (query, SEARCH_CANDIDATES, fetch, limit))
+        rows = cursor.fetchall()
+        if len(rows) >= limit or fetch >= SEARCH_CANDIDATES:
+            break
+        fetch = SEARCH_CANDIDATES
+    
+    # Extraits calculés pour les seuls résultats retenus (rowid IN), en un parcours de
+    # l'intervalle de rowid : tous des candidats, donc au plus SEARCH_CANDIDATES
+    # correspondances. Un rowid IN comme contrainte relancerait la requête FTS5 pour
+    # chaque id, soit la fusion complète des listes d'un préfixe à chaque fois.
+    snippets = {}
+    if rows:
+        ids = [row[0] for row in rows]
+        cursor.execute(f'''
+            SELECT rowid, CASE WHEN rowid IN ({', '.join('?' * len(ids))})
+                          THEN snippet(tasks_fts, -1, '{SNIPPET_START}', '{SNIPPET_END}', '…', 12) END
+            FROM tasks_fts WHERE tasks_fts MATCH ? AND rowid BETWEEN ? AND ?
+        ''', (*ids, query, min(ids), max(ids)))
+        wanted = set(ids)
+        snippets = {rowid: snippet for rowid, snippet in cursor.fetchall() if rowid in wanted}
+    
+    return [{
+        'id': row[0],
+        'tache': row[1],
+        'priorite': row[2],
+        'deadline': row[3],
+        'info': row[4],
+        'status': row[5],
+        'created_at': row[6],
+        'source_subject': row[7],
+        'source_sender': row[8],
+        'score': round(-row[9], 6),
+        'snippet': snippets.get(row[0])
+    } for row in rows]
+
+# Pagination par curseur de l'API : tri -> (colonne indexée, sens)
+# Les tâches sans deadline passent après les autres dans le tri par deadline
+NO_DEADLINE = '9999-12-31'
+TASK_SORTS = {
+    'created': ('created_at', 'DESC'),
+    'deadline': (f"IFNULL(deadline, '{NO_DEADLINE}')", 'ASC'),
+}
+TASK_STATUSES = {'open': 0, 'done': 1}
+
+def list_tasks(status='open', priorities=None, deadline_from=None, deadline_to=None,
+               sort='created', after=None, limit=50, account_id=None):
+    """
+    Page de tâches filtrées, triées par date de création (récentes d'abord) ou par
+    deadline (proches d'abord). after = (valeur de tri, id) de la dernière tâche de
+    la page précédente. Retourne (tâches, curseur suivant ou None).
+    """
+    column, direction = TASK_SORTS[sort]
+    conditions, params = [], []
+    if status in TASK_STATUSES:
+        conditions.append('status = ?')
+        params.append(TASK_STATUSES[status])
+    if priorities:
+        conditions.append(f"priorite IN ({', '.join('?' * len(priorities))})")
+        params.extend(priorities)
+    if deadline_from:
+        conditions.append('deadline >= ?')
+        params.append(deadline_from)
+    if deadline_to:
+        conditions.append('deadline <= ?')
+        params.append(deadline_to)
+    if account_id is not None:
+        conditions.append('account_id = ?')
+        params.append(account_id)
+    if after:
+        # Reprend exactement après la dernière ligne vue ; la borne "{column} >= ?"
+        # (ou <=) permet à SQLite de se positionner directement dans l'index
+        strict = '<' if direction == 'DESC' else '>'
+        conditions.append(f"{column} {strict}= ? AND ({column} {strict} ? OR id {strict} ?)")
+        params.extend((after[0], after[0], after[1]))
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    # Une ligne de plus que demandé pour savoir s'il reste une page
+    cursor.execute(f'''
+        SELECT id, tache, priorite, deadline, info, status, created_at, account_id, {column}
+        FROM tasks {where}
+        ORDER BY {column} {direction}, id {direction} LIMIT ?
+    ''', (*params, limit + 1))
+    rows = cursor.fetchall()
+    
+    tasks = [{
+        'id': row[0],
+        'tache': row[1],
+        'priorite': row[2],
+        'deadline': row[3],
+        'info': row[4],
+        'status': row[5],
+        'created_at': row[6],
+        'account_id': row[7]
+    } for row in rows[:limit]]
+    next_cursor = (rows[limit - 1][8], rows[limit - 1][0]) if len(rows) > limit else None
+    
+    return tasks, next_cursor
+
+def count_tasks(status='open'):
+    """Nombre de tâches (COUNT sur l'index du statut)"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    if status in TASK_STATUSES:
+        cursor.execute('SELECT COUNT(*) FROM tasks WHERE status = ?', (TASK_STATUSES[status],))
+    else:
+        cursor.execute('SELECT COUNT(*) FROM tasks')
+    
+    return cursor.fetchone()[0]
+
+def get_table_version(name='tasks'):
+    """Retourne (compteur de modifications, horodatage unix de la dernière modification)"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute('SELECT version, updated_at FROM table_versions WHERE name = ?', (name,))
+    row = cursor.fetchone()
+    
+    return (row[0], row[1]) if row else (0, 0.0)
+
+def get_data_version():
+    """
+    Version des données affichées par le tableau de bord : somme des compteurs de
+    modifications, elle augmente à chaque écriture (tous processus confondus)
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute('SELECT SUM(version) FROM table_versions')
+    
+    return cursor.fetchone()[0] or 0
+
+TASK_CHANGES_BATCH = 200
+
+def get_last_task_change():
+    """Numéro de la dernière modification de tâche (point de départ du flux /events)"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute('SELECT MAX(id) FROM task_changes')
+    
+    return cursor.fetchone()[0] or 0
+
+def get_task_changes(after, limit=TASK_CHANGES_BATCH):
+    """
+    Modifications de tâches postérieures au numéro after (parcours de la clé primaire),
+    avec l'état courant de la tâche (None si elle a été supprimée depuis).
+    Retourne None si le journal ne remonte plus jusqu'à after : le client doit recharger.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+        SELECT c.id, c.op, c.task_id, c.status,
+               t.id, t.tache, t.priorite, t.deadline, t.info, t.status, t.created_at, t.account_id
+        FROM task_changes c LEFT JOIN tasks t ON t.id = c.task_id
+        WHERE c.id > ? ORDER BY c.id LIMIT ?
+    ''', (after, limit))
+    rows = cursor.fetchall()
+    
+    if rows and rows[0][0] > after + 1:
+        cursor.execute('SELECT 1 FROM task_changes WHERE id <= ? LIMIT 1', (after,))
+        if after and cursor.fetchone() is None:
+            return None
+    
+    return [{
+        'seq': row[0],
+        'op': row[1],
+        'id': row[2],
+        'status': row[3],
+        'task': {
+            'id': row[4],
+            'tache': row[5],
+            'priorite': row[6],
+            'deadline': row[7],
+            'info': row[8],
+            'status': row[9],
+            'created_at': row[10],
+            'account_id': row[11]
+        } if row[4] is not None else None
+    } for row in rows]
+
+# EXPORT / IMPORT EN FLUX
+
+TASK_EXPORT_FIELDS = ('id', 'tache', 'priorite', 'deadline', 'info', 'status', 'created_at',
+                      'source_subject', 'source_sender', 'account_id')
+TRANSFER_CHUNK_SIZE = 1000
+
+def iter_tasks(status='all', chunk_size=TRANSFER_CHUNK_SIZE):
+    """
+    Parcourt les tâches par paquets (curseur sur l'id) : la mémoire reste
+    constante quelle que soit la taille de la table
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    condition = 'AND status = ?' if status in TASK_STATUSES else ''
+    params = (TASK_STATUSES[status],) if status in TASK_STATUSES else ()
+    last_id = 0
+    while True:
+        cursor.execute(f'''
+            SELECT {', '.join(TASK_EXPORT_FIELDS)} FROM tasks
+            WHERE id > ? {condition} ORDER BY id LIMIT ?
+        ''', (last_id, *params, chunk_size))
+        rows = cursor.fetchall()
+        if not rows:
+            return
+        for row in rows:
+            yield dict(zip(TASK_EXPORT_FIELDS, row))
+        last_id = rows[-1][0]
+
+def import_tasks(rows, chunk_size=TRANSFER_CHUNK_SIZE):
+    """
+    Importe des tâches (itérable de dictionnaires, consommé au fur et à mesure)
+    par transactions de chunk_size lignes. Une tâche identique (même statut, date
+    de création, texte et deadline) déjà présente est ignorée : réimporter un
+    export ne crée pas de doublon.
+    Retourne {'imported', 'skipped', 'errors', 'error_lines'}.
+    """
+    stats = {'imported': 0, 'skipped': 0, 'errors': 0, 'error_lines': []}
+    chunk = []
+    for line, row in enumerate(rows, start=1):
+        try:
+            chunk.append(_import_row(row))
+        except (KeyError, TypeError, ValueError) as e:
+            stats['errors'] += 1
+            if len(stats['error_lines']) < 10:
+                stats['error_lines'].append({'line': line, 'error': str(e)})
+        if len(chunk) >= chunk_size:
+            _import_chunk(chunk, stats)
+            chunk = []
+    _import_chunk(chunk, stats)
+    
+    logger.info(f"📥 Import terminé: {stats['imported']} tâches, {stats['skipped']} doublons, {stats['errors']} erreurs")
+    return stats
+
+def _import_row(row):
+    """Valide une ligne importée et la ramène au format de la table"""
+    if not isinstance(row, dict):
+        raise ValueError("ligne illisible")
+    tache = row.get('tache') or ''
+    if not isinstance(tache, str):
+        raise ValueError("tache illisible")
+    tache = tache.strip()
+    if not tache:
+        raise ValueError("tache manquante")
+    priorite = row.get('priorite') or 'moyenne'
+    if priorite not in ('basse', 'moyenne', 'haute'):
+        raise ValueError(f"priorité invalide: {priorite}")
+    status = int(row.get('status') or 0)
+    if status not in (0, 1):
+        raise ValueError(f"statut invalide: {status}")
+    # Vide dans un CSV, absent des exports antérieurs aux comptes multiples
+    account_id = row.get('account_id')
+    try:
+        account_id = int(account_id) if account_id not in (None, '') else None
+    except ValueError:
+        raise ValueError(f"compte invalide: {account_id}")
+    return (tache, priorite, row.get('deadline') or None, row.get('info') or '', status,
+            row.get('created_at') or datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+            row.get('source_subject') or None, row.get('source_sender') or None, account_id)
+
+def _import_chunk(chunk, stats):
+    if not chunk:
+        return
+    
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        # Doublons exacts déjà en base, une requête par paquet (index statut + date de création)
+        cursor.execute(f'''
+            WITH batch(tache, deadline, status, created_at) AS (VALUES {', '.join(['(?, ?, ?, ?)'] * len(chunk))})
+            SELECT tasks.tache, tasks.deadline, tasks.status, tasks.created_at FROM batch
+            JOIN tasks ON tasks.status = batch.status AND tasks.created_at = batch.created_at
+                      AND tasks.tache = batch.tache AND tasks.deadline IS batch.deadline
+        ''', [value for row in chunk for value in (row[0], row[2], row[4], row[5])])
+        seen = set(cursor.fetchall())
+        
+        for row in chunk:
+            key = (row[0], row[2], row[4], row[5])
+            if key in seen:
+                stats['skipped'] += 1
+                continue
+            seen.add(key)
+            cursor.execute('''
+                INSERT INTO tasks (tache, priorite, deadline, info, status, created_at, source_subject,
+                                   source_sender, account_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', row)
+            # Seules les tâches en cours servent à la détection de doublons
+            if row[4] == 0:
+                index_task(cursor, cursor.lastrowid, row[0])
+            stats['imported'] += 1
+        
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
 def mark_task_done(task_id):
-    """Marque une tâche comme terminée"""
-    conn = sqlite3.connect(DATABASE_NAME)
+    """Marque une tâche comme terminée ; False si elle n'existe pas"""
+    conn = get_connection()
     cursor = conn.cursor()
     
     cursor.execute('UPDATE tasks SET status = 1 WHERE id = ?', (task_id,))
+    found = cursor.rowcount > 0
     conn.commit()
-    conn.close()
     
-    logger.info(f"Tâche {task_id} marquée comme terminée")
-    return True
+    if found:
+        logger.info(f"Tâche {task_id} marquée comme terminée")
+    return found
 
 def delete_task(task_id):
-    """Supprime une tâche"""
-    conn = sqlite3.connect(DATABASE_NAME)
+    """Supprime une tâche ; False si elle n'existe pas"""
+    conn = get_connection()
     cursor = conn.cursor()
     
+    # Une tâche supprimée est un exemple d'email non actionnable pour le pré-classifieur
+    cursor.execute('''
+        INSERT INTO deleted_task_emails (source_text)
+        SELECT source_text FROM tasks WHERE id = ? AND source_text IS NOT NULL
+    ''', (task_id,))
     cursor.execute('DELETE FROM tasks WHERE id = ?', (task_id,))
+    found = cursor.rowcount > 0
+    cursor.execute('DELETE FROM task_lsh WHERE task_id = ?', (task_id,))
+    cursor.execute('DELETE FROM email_threads WHERE task_id = ?', (task_id,))
     conn.commit()
-    conn.close()
     
-    logger.info(f"Tâche {task_id} supprimée")
-    return True
+    if found:
+        logger.info(f"Tâche {task_id} supprimée")
+    return found
+
+# Candidats vérifiés (Jaccard exact) par recherche de doublon
+SIMILARITY_CANDIDATES = 20
 
 def task_exists(tache, deadline=None):
     """Vérifie si une tâche similaire existe déjà"""
-    conn = sqlite3.connect(DATABASE_NAME)
+    return find_similar_task(tache, deadline) is not None
+
+def find_similar_task(tache, deadline=None):
+    """Retourne l'id de la tâche en cours la plus proche (même deadline si fournie), ou None"""
+    conn = get_connection()
     cursor = conn.cursor()
     
-    if deadline:
-        cursor.execute('''
-            SELECT COUNT(*) FROM tasks 
-            WHERE tache LIKE ? AND deadline = ? AND status = 0
-        ''', (f'%{tache}%', deadline))
-    else:
-        cursor.execute('''
-            SELECT COUNT(*) FROM tasks 
-            WHERE tache LIKE ? AND status = 0
-        ''', (f'%{tache}%',))
+    return _find_similar_task(cursor, tache, deadline)
+
+def _find_similar_task(cursor, tache, deadline=None):
+    query = shingles(tache)
+    buckets = lsh.buckets(query)
+    if not buckets:
+        return None
     
-    count = cursor.fetchone()[0]
-    conn.close()
+    # Candidats : tâches partageant le plus de buckets LSH (recherche indexée,
+    # vérification exacte limitée aux meilleurs candidats)
+    cursor.execute(f'''
+        SELECT tasks.id, tasks.tache FROM (
+            SELECT task_id, COUNT(*) AS shared FROM task_lsh
+            WHERE bucket IN ({', '.join('?' * len(buckets))})
+            GROUP BY task_id
+        ) AS hits
+        JOIN tasks ON tasks.id = hits.task_id
+        WHERE tasks.status = 0 AND (? IS NULL OR tasks.deadline = ?)
+        ORDER BY hits.shared DESC LIMIT ?
+    ''', (*buckets, deadline or None, deadline or None, SIMILARITY_CANDIDATES))
     
-    return count > 0
+    best_id, best_score = None, TASK_SIMILARITY_THRESHOLD
+    query_numbers = numbers(tache)
+    for task_id, candidate in cursor.fetchall():
+        if numbers(candidate) != query_numbers:
+            continue
+        score = jaccard(query, shingles(candidate))
+        if score >= best_score:
+            best_id, best_score = task_id, score
+    return best_id
 
-# NOUVELLES FONCTIONS POUR GÉRER LES EMAILS TRAITÉS
+def index_task(cursor, task_id, tache):
+    """Enregistre les buckets LSH d'une tâche"""
+    cursor.executemany('INSERT OR IGNORE INTO task_lsh (bucket, task_id) VALUES (?, ?)',
+                       [(bucket, task_id) for bucket in lsh.buckets(shingles(tache))])
 
-def is_email_processed(subject, body):
-    """Vérifie si un email a déjà été traité"""
-    body_hash = hashlib.md5(body.encode('utf-8')).hexdigest()
+def index_missing_tasks(cursor):
+    """
+    Indexe les tâches en cours créées avant l'index LSH. Les tâches sont indexées à
+    leur création : seules celles au-delà de la dernière tâche indexée sont relues,
+    l'index (task_id) sert de watermark sans parcourir toute la table à chaque démarrage.
+    """
+    cursor.execute('SELECT COALESCE(MAX(task_id), 0) FROM task_lsh')
+    indexed_up_to = cursor.fetchone()[0]
+    cursor.execute('SELECT id, tache FROM tasks WHERE id > ? AND status = 0', (indexed_up_to,))
+    missing = cursor.fetchall()
+    for task_id, tache in missing:
+        index_task(cursor, task_id, tache)
+    if missing:
+        logger.info(f"🛠️ {len(missing)} tâches ajoutées à l'index de similarité")
+
+def merge_task(cursor, task_id, task):
+    """Complète une tâche existante avec un doublon : info, deadline et priorité la plus haute"""
+    cursor.execute('SELECT priorite, deadline, info FROM tasks WHERE id = ?', (task_id,))
+    priorite, deadline, info = cursor.fetchone()
+    
+    ranks = {'basse': 0, 'moyenne': 1, 'haute': 2}
+    if ranks.get(task.get('priorite'), -1) > ranks.get(priorite, -1):
+        priorite = task['priorite']
+    deadline = deadline or task.get('deadline') or None
+    extra = (task.get('info') or '').strip()
+    if extra and extra not in (info or ''):
+        info = f"{info}\n{extra}" if info else extra
     
-    conn = sqlite3.connect(DATABASE_NAME)
+    cursor.execute('''
+        UPDATE tasks SET priorite = ?, deadline = ?, info = ? WHERE id = ?
+    ''', (priorite, deadline, info, task_id))
+
+def update_thread_task(cursor, task_id, task):
+    """
+    Met à jour la tâche d'une conversation avec l'extraction des nouveaux messages :
+    leur deadline remplace l'ancienne (report, avancement), la priorité ne baisse pas
+    """
+    new_deadline = task.get('deadline') or None
+    merge_task(cursor, task_id, task)
+    if new_deadline:
+        cursor.execute('UPDATE tasks SET deadline = ? WHERE id = ?', (new_deadline, task_id))
+
+# CONVERSATIONS (FILS DE DISCUSSION)
+
+def find_threads(message_keys):
+    """Retourne {clé de message: clé de conversation} pour les messages déjà rattachés à un fil"""
+    conn = get_connection()
     cursor = conn.cursor()
     
+    keys = list(set(message_keys))
+    threads = {}
+    for start in range(0, len(keys), QUERY_CHUNK_SIZE):
+        chunk = keys[start:start + QUERY_CHUNK_SIZE]
+        cursor.execute(f'''
+            SELECT message_key, thread_key FROM thread_messages
+            WHERE message_key IN ({','.join('?' * len(chunk))})
+        ''', chunk)
+        threads.update(cursor.fetchall())
+    
+    return threads
+
+def _thread_task(cursor, thread_key):
+    """Tâche en cours associée à une conversation, ou None"""
     cursor.execute('''
-        SELECT COUNT(*) FROM processed_emails 
-        WHERE email_subject = ? AND email_body_hash = ?
-    ''', (subject, body_hash))
+        SELECT tasks.id FROM email_threads JOIN tasks ON tasks.id = email_threads.task_id
+        WHERE email_threads.thread_key = ? AND tasks.status = 0
+    ''', (thread_key,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+# NOUVELLES FONCTIONS POUR GÉRER LES EMAILS TRAITÉS
+
+# Nombre de valeurs par requête groupée (limite de variables SQLite)
+QUERY_CHUNK_SIZE = 300
+
+def body_hash(body):
+    """Empreinte du corps (ancienne clé de déduplication)"""
+    return hashlib.md5(body.encode('utf-8')).hexdigest()
+
+def message_key(message_id=None, subject='', body='', from_addr='', date=''):
+    """
+    Clé de déduplication d'un email : son Message-ID (RFC 5322) ou, à défaut,
+    une empreinte de l'expéditeur, de la date, du sujet et du corps
+    """
+    if message_id:
+        message_id = ''.join(str(message_id).split())
+        match = re.search(r'<[^<>]+>', message_id)
+        return 'mid:' + (match.group() if match else message_id)
+    data = '\0'.join((from_addr or '', date or '', subject or '', body or ''))
+    return 'sha256:' + hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+def legacy_key(subject, body):
+    """Clé des lignes enregistrées avant le Message-ID (sujet + hash du corps)"""
+    return f"legacy:{body_hash(body)}:{subject}"
+
+def email_keys(email_msg):
+    """(clé, clé historique) d'un email sous forme de dictionnaire"""
+    key = message_key(email_msg.get('message_id'), email_msg['subject'], email_msg['body'],
+                      email_msg.get('from', ''), email_msg.get('date', ''))
+    return key, legacy_key(email_msg['subject'], email_msg['body'])
+
+def _find_processed(cursor, keys):
+    """Sous-ensemble des clés déjà présentes, une requête indexée par paquet"""
+    keys = list(dict.fromkeys(keys))
+    found = set()
+    for start in range(0, len(keys), QUERY_CHUNK_SIZE):
+        chunk = keys[start:start + QUERY_CHUNK_SIZE]
+        cursor.execute(f'''
+            SELECT message_key FROM processed_emails
+            WHERE message_key IN ({', '.join('?' * len(chunk))})
+        ''', chunk)
+        found.update(row[0] for row in cursor.fetchall())
+    return found
+
+def filter_unprocessed(ids):
+    """Retourne, dans l'ordre, les clés (voir message_key) qui n'ont pas encore été traitées"""
+    conn = get_connection()
+    cursor = conn.cursor()
     
-    count = cursor.fetchone()[0]
-    conn.close()
+    processed = _find_processed(cursor, ids)
+    
+    return [key for key in ids if key not in processed]
+
+def is_email_processed(subject, body, message_id=None, from_addr='', date=''):
+    """Vérifie si un email a déjà été traité"""
+    keys = [message_key(message_id, subject, body, from_addr, date), legacy_key(subject, body)]
     
-    is_processed = count > 0
+    is_processed = len(filter_unprocessed(keys)) < len(keys)
     if is_processed:
         logger.info(f"📧 Email déjà traité: {subject[:50]}...")
     
     return is_processed
 
-def mark_email_processed(subject, body):
-    """Marque un email comme traité"""
-    body_hash = hashlib.md5(body.encode('utf-8')).hexdigest()
-    
-    conn = sqlite3.connect(DATABASE_NAME)
+def mark_email_processed(subject, body, message_id=None, from_addr='', date=''):
+    """Marque un email comme traité (sans effet s'il l'est déjà)"""
+    conn = get_connection()
     cursor = conn.cursor()
     
     cursor.execute('''
-        INSERT INTO processed_emails (email_subject, email_body_hash)
-        VALUES (?, ?)
-    ''', (subject, body_hash))
+        INSERT OR IGNORE INTO processed_emails (email_subject, email_body_hash, message_key)
+        VALUES (?, ?, ?)
+    ''', (subject, body_hash(body), message_key(message_id, subject, body, from_addr, date)))
     
     conn.commit()
-    conn.close()
     
     logger.info(f"✅ Email marqué comme traité: {subject[:50]}...")
     return True
 
+def ingest_batch(entries, watermarks=()):
+    """
+    Enregistre en une seule transaction un lot de résultats de synchronisation.
+    entries : [{'subject', 'body', 'message_id', 'from', 'date', 'tasks' (liste de tâches ou None), 'source_text',
+    'thread' (clé de conversation ou None), 'account_id'}] ; une entrée sans tâche marque simplement l'email comme traité.
+    La première tâche d'une conversation qui en a déjà une en cours met celle-ci à jour.
+    Les emails déjà traités sont ignorés, ce qui rend l'appel rejouable sans doublon.
+    watermarks : [(boîte, uidvalidity, dernier UID, compte)] enregistrés dans la même transaction,
+    le watermark d'une boîte n'avance donc jamais sans les emails qu'il couvre.
+    Retourne {'processed', 'tasks_added', 'tasks_merged', 'tasks_updated', 'skipped'}.
+    """
+    stats = {'processed': 0, 'tasks_added': 0, 'tasks_merged': 0, 'tasks_updated': 0, 'skipped': 0}
+    if not entries and not watermarks:
+        return stats
+    
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    # Verrou d'écriture dès le début : les vérifications et les insertions voient le même état
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        keys = [email_keys(entry) for entry in entries]
+        processed = _find_processed(cursor, [k for pair in keys for k in pair])
+        
+        fresh = []
+        for entry, (key, legacy) in zip(entries, keys):
+            if key in processed or legacy in processed:
+                stats['skipped'] += 1
+            else:
+                processed.add(key)
+                fresh.append((entry, key))
+        
+        # La première tâche met à jour celle de sa conversation ; les autres (et celles
+        # d'un email hors fil connu) sont comparées à l'index LSH, y compris aux tâches
+        # insérées plus tôt dans ce lot : un doublon complète la tâche existante
+        for entry, _ in fresh:
+            thread = entry.get('thread')
+            for position, task in enumerate(entry.get('tasks') or []):
+                deadline = task.get('deadline') or None
+                task_id = _thread_task(cursor, thread) if thread and position == 0 else None
+                if task_id is not None:
+                    update_thread_task(cursor, task_id, task)
+                    stats['tasks_updated'] += 1
+                else:
+                    task_id = _find_similar_task(cursor, task['tache'], deadline)
+                    if task_id is not None:
+                        merge_task(cursor, task_id, task)
+                        stats['tasks_merged'] += 1
+                    else:
+                        cursor.execute('''
+                            INSERT INTO tasks (tache, priorite, deadline, info, status, source_text, source_subject,
+                                               source_sender, account_id)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                        ''', (task['tache'], task['priorite'], deadline, task.get('info', ''), 0,
+                              entry.get('source_text'), entry['subject'], entry.get('from'), entry.get('account_id')))
+                        task_id = cursor.lastrowid
+                        index_task(cursor, task_id, task['tache'])
+                        stats['tasks_added'] += 1
+                if thread and position == 0:
+                    cursor.execute('''
+                        INSERT INTO email_threads (thread_key, task_id) VALUES (?, ?)
+                        ON CONFLICT (thread_key) DO UPDATE SET task_id = excluded.task_id, updated_at = CURRENT_TIMESTAMP
+                    ''', (thread, task_id))
+        
+        cursor.executemany('''
+            INSERT OR IGNORE INTO processed_emails (email_subject, email_body_hash, message_key)
+            VALUES (?, ?, ?)
+        ''', [(entry['subject'], body_hash(entry['body']), key) for entry, key in fresh])
+        # Les réponses à venir retrouvent leur conversation par l'un de ces messages
+        cursor.executemany('''
+            INSERT OR IGNORE INTO thread_messages (message_key, thread_key) VALUES (?, ?)
+        ''', [(key, entry['thread']) for entry, key in fresh if entry.get('thread') and key.startswith('mid:')])
+        for mailbox, uidvalidity, last_uid, account_id in watermarks:
+            _save_mailbox_state(cursor, mailbox, uidvalidity, last_uid, account_id)
+        
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    
+    stats['processed'] = len(fresh)
+    logger.info(f"📥 Lot enregistré: {stats['tasks_added']} tâches (+{stats['tasks_merged']} fusionnées, "
+                f"{stats['tasks_updated']} conversations mises à jour), "
+                f"{len(fresh)} emails traités, {stats['skipped']} déjà connus")
+    return stats
+
 def clear_processed_emails():
     """Vide la table des emails traités (pour les tests)"""
-    conn = sqlite3.connect(DATABASE_NAME)
+    conn = get_connection()
     cursor = conn.cursor()
     
     cursor.execute('DELETE FROM processed_emails')
+    # Sans watermark, la prochaine synchronisation repart d'une resync complète
+    cursor.execute('DELETE FROM mailbox_state')
     
     conn.commit()
-    conn.close()
     
     logger.info("🗑️ Table processed_emails vidée")
     return True
 
 def get_processed_emails_count():
-    """Retourne le nombre d'emails traités"""
-    conn = sqlite3.connect(DATABASE_NAME)
+    """Retourne le nombre d'emails traités (compteur tenu par les triggers)"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute("SELECT row_count FROM table_versions WHERE name = 'processed_emails'")
+    row = cursor.fetchone()
+    
+    return row[0] if row else 0
+
+# WATERMARKS DE SYNCHRONISATION IMAP
+
+def get_mailbox_state(mailbox, account_id=None):
+    """Retourne (uidvalidity, last_uid) d'une boîte du compte (par défaut le premier), ou None"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+        SELECT uidvalidity, last_uid FROM mailbox_state
+        WHERE account_id = COALESCE(?, (SELECT MIN(id) FROM accounts)) AND mailbox = ?
+    ''', (account_id, mailbox))
+    
+    row = cursor.fetchone()
+    
+    return (row[0], row[1]) if row else None
+
+def save_mailbox_state(mailbox, uidvalidity, last_uid, account_id=None):
+    """Enregistre le dernier UID vu pour une boîte du compte (par défaut le premier)"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    _save_mailbox_state(cursor, mailbox, uidvalidity, last_uid, account_id)
+    
+    conn.commit()
+    return True
+
+def _save_mailbox_state(cursor, mailbox, uidvalidity, last_uid, account_id=None):
+    cursor.execute('''
+        INSERT OR REPLACE INTO mailbox_state (account_id, mailbox, uidvalidity, last_uid, updated_at)
+        VALUES (COALESCE(?, (SELECT MIN(id) FROM accounts)), ?, ?, ?, CURRENT_TIMESTAMP)
+    ''', (account_id, mailbox, uidvalidity, last_uid))
+    logger.info(f"📌 Watermark {mailbox}: UIDVALIDITY={uidvalidity}, dernier UID={last_uid}")
+
+# COMPTES IMAP
+
+ACCOUNT_FIELDS = ('imap_server', 'imap_port', 'email_address', 'password_env', 'use_ssl', 'folders',
+                  'max_connections', 'enabled')
+
+def _account_dict(row):
+    """Compte avec les valeurs du .env pour les colonnes laissées à NULL"""
+    (account_id, name, imap_server, imap_port, email_address, password_env, use_ssl, folders,
+     max_connections, enabled, last_sync_at) = row
+    return {
+        'id': account_id,
+        'name': name,
+        'imap_server': imap_server or IMAP_SERVER,
+        'imap_port': imap_port or IMAP_PORT,
+        'email_address': email_address or EMAIL_ADDRESS,
+        'password_env': password_env or 'EMAIL_PASSWORD',
+        'use_ssl': IMAP_USE_SSL if use_ssl is None else bool(use_ssl),
+        'folders': [f.strip() for f in (folders or SYNC_MAILBOX).split(',') if f.strip()],
+        'max_connections': max_connections or IMAP_POOL_SIZE,
+        'enabled': bool(enabled),
+        'last_sync_at': last_sync_at,
+    }
+
+def get_accounts(enabled_only=False):
+    """Comptes IMAP, les moins récemment synchronisés d'abord"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute(f'''
+        SELECT id, name, imap_server, imap_port, email_address, password_env, use_ssl, folders,
+               max_connections, enabled, last_sync_at
+        FROM accounts {'WHERE enabled = 1' if enabled_only else ''}
+        ORDER BY last_sync_at IS NOT NULL, last_sync_at, id
+    ''')
+    
+    return [_account_dict(row) for row in cursor.fetchall()]
+
+def get_account(account_id):
+    """Retourne un compte ou None"""
+    return next((a for a in get_accounts() if a['id'] == account_id), None)
+
+def validate_account_fields(fields):
+    """
+    Champs d'un compte ramenés au format de la table (ValueError si invalides) :
+    port et sessions entiers positifs, dossiers en liste de noms ou "INBOX,Projets",
+    use_ssl et enabled booléens, le reste en texte. Les champs inconnus ou None sont ignorés.
+    """
+    values = {}
+    for field, value in fields.items():
+        if field not in ACCOUNT_FIELDS or value is None:
+            continue
+        if field in ('imap_port', 'max_connections'):
+            if isinstance(value, bool) or not isinstance(value, int) or value <= 0:
+                raise ValueError(f"{field} doit être un entier positif: {value!r}")
+        elif field in ('use_ssl', 'enabled'):
+            if not isinstance(value, bool):
+                raise ValueError(f"{field} doit être un booléen (true/false): {value!r}")
+            value = int(value)
+        elif field == 'folders':
+            if isinstance(value, str):
+                value = value.split(',')
+            if not isinstance(value, (list, tuple)) or not all(isinstance(f, str) for f in value):
+                raise ValueError(f"folders doit être une liste de noms de dossiers: {value!r}")
+            folders = [f.strip() for f in value if f.strip()]
+            if not folders:
+                raise ValueError("folders ne contient aucun dossier")
+            value = ','.join(folders)
+        elif not isinstance(value, str):
+            raise ValueError(f"{field} doit être une chaîne: {value!r}")
+        values[field] = value
+    return values
+
+def add_account(name, **fields):
+    """
+    Ajoute un compte (imap_server, imap_port, email_address, password_env, use_ssl,
+    folders : liste ou "INBOX,Projets", max_connections, enabled) et retourne son id
+    """
+    fields = validate_account_fields(fields)
+    
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    columns = ['name', *fields]
+    cursor.execute(f'''
+        INSERT INTO accounts ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})
+    ''', (name, *fields.values()))
+    
+    conn.commit()
+    
+    logger.info(f"📮 Compte ajouté: {name}")
+    return cursor.lastrowid
+
+def mark_account_synced(account_id):
+    """Horodate la dernière synchronisation d'un compte (ordre de passage suivant)"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute('UPDATE accounts SET last_sync_at = CURRENT_TIMESTAMP WHERE id = ?', (account_id,))
+    
+    conn.commit()
+
+
+# SUIVI DES SYNCHRONISATIONS EN ARRIÈRE-PLAN
+
+SYNC_JOB_FIELDS = ('status', 'total', 'processed', 'tasks_added', 'tasks_updated', 'skipped', 'filtered', 'errors',
+                   'message', 'started_at', 'finished_at')
+
+def _sync_job_dict(row):
+    # heartbeat_at est interne : il change sans que l'avancement ne change
+    job = dict(row)
+    job.pop('heartbeat_at', None)
+    return job
+
+def create_sync_job():
+    """Crée un job de synchronisation en attente et retourne son id"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute("INSERT INTO sync_jobs (status, heartbeat_at) VALUES ('pending', ?)", (time.time(),))
+    
+    conn.commit()
+    job_id = cursor.lastrowid
+    
+    return job_id
+
+def update_sync_job(job_id, **fields):
+    """Met à jour l'avancement d'un job (status, compteurs, message...)"""
+    fields = {k: v for k, v in fields.items() if k in SYNC_JOB_FIELDS}
+    if not fields:
+        return False
+    
+    conn = get_connection()
     cursor = conn.cursor()
     
-    cursor.execute('SELECT COUNT(*) FROM processed_emails')
+    # Chaque mise à jour vaut signe de vie
+    assignments = ', '.join(f"{name} = ?" for name in fields)
+    cursor.execute(f'UPDATE sync_jobs SET {assignments}, heartbeat_at = ? WHERE id = ?',
+                   (*fields.values(), time.time(), job_id))
+    
+    conn.commit()
+    
+    return True
+
+def touch_sync_job(job_id):
+    """Signe de vie d'un job en cours (appelé périodiquement par le processus qui l'exécute)"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute("UPDATE sync_jobs SET heartbeat_at = ? WHERE id = ? AND status IN ('pending', 'running')",
+                   (time.time(), job_id))
+    
+    conn.commit()
+
+def get_sync_job(job_id):
+    """Retourne l'état d'un job sous forme de dictionnaire, ou None"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    
+    cursor.execute('SELECT * FROM sync_jobs WHERE id = ?', (job_id,))
+    row = cursor.fetchone()
+    
+    return _sync_job_dict(row) if row else None
+
+def get_active_sync_job():
+    """
+    Retourne le job en attente ou en cours, s'il y en a un : seulement s'il donne
+    signe de vie (un job dont le processus est mort n'est plus actif)
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    
+    cursor.execute('''
+        SELECT * FROM sync_jobs WHERE status IN ('pending', 'running') AND heartbeat_at >= ?
+        ORDER BY id DESC LIMIT 1
+    ''', (time.time() - SYNC_JOB_STALE_AFTER,))
+    row = cursor.fetchone()
+    
+    return _sync_job_dict(row) if row else None
+
+def fail_interrupted_sync_jobs():
+    """
+    Marque en erreur les jobs actifs sans signe de vie depuis SYNC_JOB_STALE_AFTER
+    (processus arrêté ou tué) ; un job en cours dans un autre processus n'est pas touché
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+        UPDATE sync_jobs SET status = 'error', message = 'Interrompu : plus de signe de vie du processus',
+               finished_at = CURRENT_TIMESTAMP
+        WHERE status IN ('pending', 'running') AND (heartbeat_at IS NULL OR heartbeat_at < ?)
+    ''', (time.time() - SYNC_JOB_STALE_AFTER,))
+    
+    conn.commit()
+    count = cursor.rowcount
+    
+    return count
+
+SYNC_RUN_FIELDS = ('job_id', 'status', 'started_at', 'duration_s', 'emails_seen', 'relevant', 'skipped', 'filtered',
+                   'extracted', 'tasks_added', 'tasks_updated', 'fallback_tasks', 'errors', 'llm_requests',
+                   'prompt_tokens', 'completion_tokens', 'stage_seconds', 'message')
+
+def save_sync_run(**fields):
+    """Enregistre le résumé d'une synchronisation (seuls les SYNC_RUNS_KEPT derniers sont gardés)"""
+    fields = {k: v for k, v in fields.items() if k in SYNC_RUN_FIELDS}
+    if 'stage_seconds' in fields:
+        fields['stage_seconds'] = json.dumps(fields['stage_seconds'])
+    
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute(f'''
+        INSERT INTO sync_runs ({', '.join(fields)}) VALUES ({', '.join('?' * len(fields))})
+    ''', tuple(fields.values()))
+    run_id = cursor.lastrowid
+    cursor.execute('DELETE FROM sync_runs WHERE id <= ?', (run_id - SYNC_RUNS_KEPT,))
+    
+    conn.commit()
+    
+    return run_id
+
+def get_sync_runs(limit=50):
+    """Derniers résumés de synchronisation, du plus récent au plus ancien"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    
+    cursor.execute('SELECT * FROM sync_runs ORDER BY id DESC LIMIT ?', (limit,))
+    runs = [dict(row) for row in cursor.fetchall()]
+    for run in runs:
+        run['stage_seconds'] = json.loads(run['stage_seconds'] or '{}')
+    
+    return runs
+
+
+# CACHE DES EXTRACTIONS IA
+
+def get_cached_extraction(cache_key, min_created_at=0):
+    """Retourne (résultat JSON, created_at) depuis le cache, ou None (lecture seule, voir touch_cached_extractions)"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+        SELECT result, created_at FROM extraction_cache WHERE cache_key = ? AND created_at >= ?
+    ''', (cache_key, min_created_at))
+    row = cursor.fetchone()
+    
+    return (row[0], row[1]) if row else None
+
+def touch_cached_extractions(used_at):
+    """Rafraîchit en une transaction les dates d'usage accumulées ({clé: timestamp})"""
+    if not used_at:
+        return
+    
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.executemany('UPDATE extraction_cache SET last_used_at = MAX(last_used_at, ?) WHERE cache_key = ?',
+                       [(timestamp, key) for key, timestamp in used_at.items()])
+    
+    conn.commit()
+
+def save_cached_extraction(cache_key, model, prompt_version, result):
+    """Enregistre une réponse de l'IA dans le cache persistant"""
+    now = time.time()
+    
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+        INSERT OR REPLACE INTO extraction_cache (cache_key, model, prompt_version, result, created_at, last_used_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (cache_key, model, prompt_version, result, now, now))
+    
+    conn.commit()
+    
+    return True
+
+def evict_extraction_cache(max_entries, min_created_at=0):
+    """Supprime les entrées expirées puis les moins récemment utilisées au-delà de max_entries"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute('DELETE FROM extraction_cache WHERE created_at < ?', (min_created_at,))
+    removed = cursor.rowcount
+    
+    cursor.execute('''
+        DELETE FROM extraction_cache WHERE cache_key IN (
+            SELECT cache_key FROM extraction_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+        )
+    ''', (max_entries,))
+    removed += cursor.rowcount
+    
+    conn.commit()
+    
+    if removed:
+        logger.info(f"🧹 {removed} entrées retirées du cache d'extraction")
+    return removed
+
+def get_extraction_cache_size():
+    """Retourne le nombre d'entrées du cache persistant"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute('SELECT COUNT(*) FROM extraction_cache')
     count = cursor.fetchone()[0]
-    conn.close()
     
-    return count
\ No newline at end of file
+    return count
+
+
+# DONNÉES D'ENTRAÎNEMENT DU PRÉ-CLASSIFIEUR
+
+def get_classifier_samples():
+    """Retourne [(texte, label)] : 1 = tâche conservée, 0 = tâche supprimée"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+        SELECT source_text, 1 FROM tasks WHERE source_text IS NOT NULL
+        UNION ALL
+        SELECT source_text, 0 FROM deleted_task_emails
+    ''')
+    samples = cursor.fetchall()
+    
+    return samples
+
+def count_classifier_samples():
+    """Retourne (positifs, négatifs) disponibles pour l'entraînement"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+        SELECT (SELECT COUNT(*) FROM tasks WHERE source_text IS NOT NULL),
+               (SELECT COUNT(*) FROM deleted_task_emails)
+    ''')
+    counts = cursor.fetchone()
+    
+    return counts
@@ -1,141 +1,298 @@
 import imaplib
 import email
+import base64
+import quopri
+import re
+import time
 from email.policy import default
 import logging
-from config import IMAP_SERVER, IMAP_PORT, EMAIL_ADDRESS, EMAIL_PASSWORD, KEYWORDS
+from config import IMAP_SERVER, IMAP_PORT, EMAIL_ADDRESS, EMAIL_PASSWORD, KEYWORD_MIN_SCORE
+from config import SYNC_MAILBOX, INITIAL_SYNC_LIMIT, SYNC_MAX_EMAILS
+from database import get_mailbox_state
+from imap_parser import parse_fetch_response, get_section, find_text_part, iter_body_parts, uid_set
+from imap_pool import get_connection_manager, IdleListener
+from keyword_matcher import get_keyword_matcher
+from metrics import metrics
+from mime_body import extract_body, part_text, clean_body, MAX_MESSAGE_BYTES
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def search_emails():
+# En-têtes demandés en phase 1 (le corps n'est téléchargé qu'en phase 2)
+HEADER_FIELDS = 'SUBJECT FROM DATE MESSAGE-ID IN-REPLY-TO REFERENCES'
+MAX_BODY_BYTES = 20000
+# Le HTML (styles, balises) est bien plus volumineux que le texte qu'il contient
+MAX_HTML_BYTES = 100000
+
+def search_emails(mailbox=SYNC_MAILBOX, mark_as_read=True, manager=None, account_id=None):
     """
-    Version corrigée utilisant imaplib au lieu de IMAPClient
+    Recherche incrémentale : seuls les UID au-delà du watermark (propre au compte
+    et à la boîte) sont récupérés. Retourne (emails pertinents, watermark proposé) ;
+    le watermark n'est pas enregistré ici mais avec le lot qui enregistre les emails
+    (ingest_batch), pour qu'un email perdu avant l'enregistrement soit relu
     """
-    mail = None
+    manager = manager or get_connection_manager()
     try:
         logger.info("🚀 Démarrage de la recherche d'emails (imaplib)...")
         
-        # Connexion avec imaplib (plus stable)
-        logger.info(f"🔗 Connexion à {IMAP_SERVER}:{IMAP_PORT}")
-        mail = imaplib.IMAP4_SSL(IMAP_SERVER, IMAP_PORT)
-        mail.timeout = 30
-        
-        logger.info("🔑 Authentification...")
-        mail.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
-        logger.info("✅ Authentification réussie")
-        
-        # Sélection de la boîte de réception
-        mail.select('INBOX')
-        logger.info("📂 Boîte INBOX sélectionnée")
+        # Session authentifiée réutilisée depuis le pool
+        with manager.connection() as mail:
+            return _search_mailbox(mail, mailbox, mark_as_read, account_id)
         
-        # Recherche de tous les emails
-        status, messages = mail.search(None, 'ALL')
+    except Exception as e:
+        logger.error(f"💥 ERREUR GÉNÉRALE: {str(e)}")
+        return [], None
+
+def _search_mailbox(mail, mailbox, mark_as_read, account_id=None):
+    """Recherche sur une session déjà authentifiée"""
+    search_start = time.perf_counter()
+    # Sélection de la boîte
+    status, _ = mail.select(mailbox)
+    if status != 'OK':
+        logger.error(f"❌ Impossible de sélectionner {mailbox}")
+        return [], None
+    logger.info(f"📂 Boîte {mailbox} sélectionnée")
+    
+    uidvalidity = get_uidvalidity(mail, mailbox)
+    state = get_mailbox_state(mailbox, account_id)
+    
+    if state and state[0] == uidvalidity:
+        # Synchronisation incrémentale : UID n+1:*
+        last_uid = state[1]
+        status, messages = mail.uid('SEARCH', None, f'UID {last_uid + 1}:*')
         if status != 'OK':
             logger.error("❌ Erreur lors de la recherche d'emails")
-            return []
-        
-        email_ids = messages[0].split()
-        logger.info(f"📧 {len(email_ids)} emails trouvés")
-        
-        # Limiter aux 10 derniers emails
-        test_ids = email_ids[-10:] if len(email_ids) > 10 else email_ids
-        logger.info(f"🔍 Analyse de {len(test_ids)} emails")
-        
-        relevant_emails = []
+            return [], None
+        # "n+1:*" renvoie toujours le dernier message, même déjà vu
+        uids = [int(uid) for uid in messages[0].split() if int(uid) > last_uid]
+        logger.info(f"📧 {len(uids)} nouveaux emails depuis l'UID {last_uid}")
+    else:
+        # Première synchronisation ou UIDVALIDITY changée : resync complète
+        if state:
+            logger.warning(f"♻️ UIDVALIDITY modifiée ({state[0]} → {uidvalidity}), resync complète")
+        status, messages = mail.uid('SEARCH', None, 'ALL')
+        if status != 'OK':
+            logger.error("❌ Erreur lors de la recherche d'emails")
+            return [], None
+        all_uids = [int(uid) for uid in messages[0].split()]
+        logger.info(f"📧 {len(all_uids)} emails trouvés")
         
-        for i, email_id in enumerate(test_ids):
-            try:
-                logger.info(f"--- Email {i+1}/{len(test_ids)} (ID: {email_id}) ---")
-                
-                # Récupération de l'email
-                status, msg_data = mail.fetch(email_id, '(RFC822)')
-                if status != 'OK':
-                    logger.warning(f"Impossible de récupérer l'email {email_id}")
-                    continue
-                
-                # Extraction du message
-                msg = email.message_from_bytes(msg_data[0][1], policy=default)
-                
-                # Extraction des informations
-                subject = str(msg.get('subject', 'Sans sujet')).strip()
-                from_addr = str(msg.get('from', 'Expéditeur inconnu'))
-                date = str(msg.get('date', 'Date inconnue'))
-                body = extract_body_imaplib(msg)
-                
-                logger.info(f"📨 Sujet: {subject[:50]}...")
+        # Limiter aux derniers emails, le watermark couvre le reste de la boîte
+        uids = all_uids[-INITIAL_SYNC_LIMIT:] if INITIAL_SYNC_LIMIT > 0 else []
+        last_uid = all_uids[-1] if all_uids else 0
+        if uids:
+            last_uid = uids[0] - 1
+    
+    uids.sort()
+    if SYNC_MAX_EMAILS > 0 and len(uids) > SYNC_MAX_EMAILS:
+        logger.info(f"⏳ {len(uids) - SYNC_MAX_EMAILS} emails reportés à la prochaine synchronisation")
+        uids = uids[:SYNC_MAX_EMAILS]
+    metrics.observe('search', time.perf_counter() - search_start)
+    metrics.inc('emails_seen', len(uids))
+    logger.info(f"🔍 Analyse de {len(uids)} emails")
+    
+    relevant_emails = []
+    matcher = get_keyword_matcher()
+    watermark = last_uid
+    watermark_blocked = False
+    
+    # Phase 1 : en-têtes + BODYSTRUCTURE de tout le lot en un seul FETCH
+    headers = fetch_headers(mail, uids) if uids else {}
+    
+    # Filtre : seuls les messages avec une partie texte (text/plain, sinon text/html) passent à la phase 2
+    text_parts = {}
+    full_messages = []
+    for uid, info in headers.items():
+        part = find_text_part(info['structure']) or find_text_part(info['structure'], 'html')
+        if part:
+            text_parts[uid] = part
+        elif needs_full_message(info['structure']):
+            full_messages.append(uid)
+    
+    # Phase 2 : uniquement la partie texte, jamais les pièces jointes
+    bodies = fetch_text_parts(mail, text_parts)
+    # Structure illisible ou email joint (message/rfc822) : message brut analysé en flux
+    bodies.update(fetch_full_messages(mail, full_messages))
+    
+    filter_start = time.perf_counter()
+    for i, uid in enumerate(uids):
+        try:
+            logger.info(f"--- Email {i+1}/{len(uids)} (UID: {uid}) ---")
+            
+            info = headers.get(uid)
+            if info is None:
+                logger.warning(f"Impossible de récupérer l'email {uid}")
+                watermark_blocked = True
+                continue
+            
+            msg = info['headers']
+            
+            # Extraction des informations
+            subject = str(msg.get('subject', 'Sans sujet')).strip()
+            from_addr = str(msg.get('from', 'Expéditeur inconnu'))
+            date = str(msg.get('date', 'Date inconnue'))
+            message_id = str(msg.get('message-id', '')).strip() or None
+            in_reply_to = message_ids(msg.get('in-reply-to'))
+            body = bodies.get(uid) or "Aucun contenu texte trouvé"
+            
+            logger.info(f"📨 Sujet: {subject[:50]}...")
+            
+            # Recherche des mots-clés (une passe, score pondéré)
+            found_keywords, relevance = matcher.analyze(f"{subject} {body}")
+            
+            if relevance >= KEYWORD_MIN_SCORE:
+                logger.info(f"✅ MOTS-CLÉS TROUVÉS (score {relevance}): {', '.join(found_keywords[:3])}...")
                 
-                # Recherche des mots-clés
-                full_text = f"{subject} {body}".lower()
-                found_keywords = [kw for kw in KEYWORDS if kw.lower() in full_text]
+                email_info = {
+                    'uid': uid,
+                    'message_id': message_id,
+                    'in_reply_to': in_reply_to[0] if in_reply_to else None,
+                    'references': message_ids(msg.get('references')),
+                    'gm_thread_id': info['gm_thread_id'],
+                    'subject': subject,
+                    'body': body,
+                    'from': from_addr,
+                    'date': date,
+                    'keywords': found_keywords,
+                    'relevance': relevance
+                }
+                relevant_emails.append(email_info)
+            else:
+                logger.info(f"❌ Pertinence insuffisante (score {relevance})")
+                metrics.inc('emails_filtered', reason='keywords')
+            
+            # Le watermark n'avance pas au-delà d'un email en échec
+            if not watermark_blocked:
+                watermark = uid
                 
-                if found_keywords:
-                    logger.info(f"✅ MOTS-CLÉS TROUVÉS: {', '.join(found_keywords[:3])}...")
-                    
-                    email_info = {
-                        'subject': subject,
-                        'body': body,
-                        'from': from_addr,
-                        'date': date,
-                        'keywords': found_keywords
-                    }
-                    relevant_emails.append(email_info)
-                else:
-                    logger.info("❌ Aucun mot-clé détecté")
-                    
-            except Exception as e:
-                logger.error(f"⚠️ Erreur email {email_id}: {str(e)}")
-                continue
-        
-        mail.close()
-        mail.logout()
-        logger.info(f"🎉 RECHERCHE TERMINÉE: {len(relevant_emails)} emails pertinents")
-        return relevant_emails
-        
-    except Exception as e:
-        logger.error(f"💥 ERREUR GÉNÉRALE: {str(e)}")
-        if mail:
+        except Exception as e:
+            logger.error(f"⚠️ Erreur email {uid}: {str(e)}")
+            watermark_blocked = True
+            continue
+    metrics.observe('filter', time.perf_counter() - filter_start)
+    
+    # BODY.PEEK ne pose pas \Seen : on conserve le marquage comme lu de l'ancien FETCH RFC822
+    if mark_as_read and headers:
+        mail.uid('STORE', uid_set(headers), '+FLAGS', '(\\Seen)')
+    
+    logger.info(f"🎉 RECHERCHE TERMINÉE: {len(relevant_emails)} emails pertinents")
+    return relevant_emails, {'mailbox': mailbox, 'uidvalidity': uidvalidity, 'last_uid': watermark,
+                             'account_id': account_id}
+
+def get_uidvalidity(mail, mailbox):
+    """Lit l'UIDVALIDITY de la boîte sélectionnée (réponse SELECT, sinon STATUS)"""
+    _, data = mail.response('UIDVALIDITY')
+    if data and data[0]:
+        return int(data[0])
+    
+    status, data = mail.status(mailbox, '(UIDVALIDITY)')
+    if status == 'OK' and data and data[0]:
+        match = re.search(rb'UIDVALIDITY (\d+)', data[0])
+        if match:
+            return int(match.group(1))
+    raise imaplib.IMAP4.error(f"UIDVALIDITY introuvable pour {mailbox}")
+
+def fetch_headers(mail, uids):
+    """Phase 1 : un seul UID FETCH pour les en-têtes utiles et le BODYSTRUCTURE du lot"""
+    # Gmail fournit directement l'identifiant de conversation
+    thread_item = ' X-GM-THRID' if 'X-GM-EXT-1' in getattr(mail, 'capabilities', ()) else ''
+    with metrics.timer('fetch'):
+        status, data = mail.uid('FETCH', uid_set(uids),
+                                f'(UID{thread_item} BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS ({HEADER_FIELDS})])')
+    if status != 'OK':
+        logger.error("❌ Erreur lors de la récupération des en-têtes")
+        return {}
+    
+    headers = {}
+    with metrics.timer('parse'):
+        for fields in parse_fetch_response(data):
             try:
-                mail.close()
-                mail.logout()
-            except:
-                pass
+                uid = int(fields['UID'])
+                raw_headers = get_section(fields, 'BODY[HEADER') or b''
+                headers[uid] = {
+                    'headers': email.message_from_bytes(bytes(raw_headers), policy=default),
+                    'structure': fields.get('BODYSTRUCTURE'),
+                    'gm_thread_id': fields.get('X-GM-THRID'),
+                }
+            except (KeyError, ValueError) as e:
+                logger.warning(f"Réponse FETCH incomplète ignorée: {e}")
+    
+    logger.info(f"📥 En-têtes récupérés pour {len(headers)} emails")
+    return headers
+
+def message_ids(value):
+    """Message-ID (<...>) cités dans un en-tête In-Reply-To ou References"""
+    if not value:
         return []
+    return re.findall(r'<[^<>]+>', ''.join(str(value).split()))
 
-def extract_body_imaplib(msg):
-    """Extrait le corps texte avec imaplib"""
-    try:
-        body = ""
-        if msg.is_multipart():
-            for part in msg.walk():
-                content_type = part.get_content_type()
-                content_disposition = str(part.get('Content-Disposition', ''))
-                
-                if content_type == "text/plain" and "attachment" not in content_disposition:
-                    try:
-                        payload = part.get_payload(decode=True)
-                        if payload:
-                            body = payload.decode('utf-8', errors='ignore')
-                            break
-                    except Exception as e:
-                        logger.warning(f"Erreur décodage: {e}")
-        else:
-            content_type = msg.get_content_type()
-            if content_type == "text/plain":
-                try:
-                    payload = msg.get_payload(decode=True)
-                    if payload:
-                        body = payload.decode('utf-8', errors='ignore')
-                except Exception as e:
-                    logger.warning(f"Erreur décodage email simple: {e}")
-        
-        # Nettoyage
-        if body:
-            body = ' '.join(body.split())[:5000]
+def fetch_text_parts(mail, text_parts):
+    """Phase 2 : récupère les parties texte, un FETCH par numéro de section"""
+    by_section = {}
+    for uid, part in text_parts.items():
+        by_section.setdefault((part['section'], part['subtype']), []).append(uid)
+    
+    bodies = {}
+    for (section, subtype), uids in by_section.items():
+        max_bytes = MAX_HTML_BYTES if subtype == 'html' else MAX_BODY_BYTES
+        with metrics.timer('fetch'):
+            status, data = mail.uid('FETCH', uid_set(uids), f'(UID BODY.PEEK[{section}]<0.{max_bytes}>)')
+        if status != 'OK':
+            logger.warning(f"Impossible de récupérer la section {section}")
+            continue
         
-        return body or "Aucun contenu texte trouvé"
-    except Exception as e:
-        logger.error(f"Erreur extraction: {e}")
-        return "Erreur extraction"
+        with metrics.timer('parse'):
+            for fields in parse_fetch_response(data):
+                try:
+                    uid = int(fields['UID'])
+                    payload = get_section(fields, f'BODY[{section}]')
+                    if payload is not None and uid in text_parts:
+                        bodies[uid] = decode_text_part(bytes(payload), text_parts[uid])
+                except (KeyError, ValueError) as e:
+                    logger.warning(f"Partie texte ignorée: {e}")
+    
+    return bodies
+
+def needs_full_message(structure):
+    """Pas de partie texte exploitable dans le BODYSTRUCTURE : email joint ou structure non analysée"""
+    if structure is None:
+        return True
+    return any(part['type'] == 'message' for part in iter_body_parts(structure))
+
+def fetch_full_messages(mail, uids):
+    """Message brut tronqué à MAX_MESSAGE_BYTES, texte extrait par BodyExtractor"""
+    if not uids:
+        return {}
+    
+    bodies = {}
+    with metrics.timer('fetch'):
+        status, data = mail.uid('FETCH', uid_set(uids), f'(UID BODY.PEEK[]<0.{MAX_MESSAGE_BYTES}>)')
+    if status != 'OK':
+        logger.warning("Impossible de récupérer les messages complets")
+        return bodies
+    
+    with metrics.timer('parse'):
+        for fields in parse_fetch_response(data):
+            try:
+                payload = get_section(fields, 'BODY[]')
+                if payload is not None:
+                    bodies[int(fields['UID'])] = extract_body(bytes(payload))
+            except (KeyError, ValueError) as e:
+                logger.warning(f"Message ignoré: {e}")
+    
+    return bodies
+
+def decode_text_part(payload, part):
+    """Décode une partie (base64/quoted-printable) selon son charset déclaré"""
+    encoding = part['encoding']
+    if encoding == 'base64':
+        # La lecture partielle peut couper un bloc base64
+        cleaned = b''.join(payload.split())
+        payload = base64.b64decode(cleaned[:len(cleaned) - len(cleaned) % 4])
+    elif encoding == 'quoted-printable':
+        payload = quopri.decodestring(payload)
+    
+    # HTML converti en texte, citations et signature retirées avant troncature
+    return clean_body(part_text(payload, part['subtype'], part['charset']))
 
 def debug_email_connection_imaplib():
     """Debug avec imaplib"""
@@ -149,30 +306,24 @@ def debug_email_connection_imaplib():
             logger.error("❌ Email ou mot de passe manquant")
             return False
         
-        # Test connexion
-        mail = imaplib.IMAP4_SSL(IMAP_SERVER, IMAP_PORT)
-        mail.timeout = 15
-        
-        mail.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
-        logger.info("✅ Authentification réussie!")
-        
-        mail.select('INBOX')
-        status, messages = mail.search(None, 'ALL')
-        
-        if status == 'OK':
-            email_ids = messages[0].split()
-            logger.info(f"✅ {len(email_ids)} emails trouvés")
+        # Test connexion (session du pool, pas de nouveau LOGIN si elle est ouverte)
+        with get_connection_manager().connection() as mail:
+            logger.info("✅ Authentification réussie!")
             
-            if email_ids:
-                # Test lecture d'un email
-                status, msg_data = mail.fetch(email_ids[-1], '(RFC822)')
-                if status == 'OK':
-                    msg = email.message_from_bytes(msg_data[0][1], policy=default)
-                    subject = str(msg.get('subject', 'Sans sujet'))
-                    logger.info(f"✅ Test lecture: {subject[:30]}...")
+            status, data = mail.select('INBOX', readonly=True)
+            
+            if status == 'OK':
+                count = int(data[0])
+                logger.info(f"✅ {count} emails trouvés")
+                
+                if count:
+                    # Test lecture d'un email (en-têtes seulement)
+                    status, msg_data = mail.fetch(str(count), '(BODY.PEEK[HEADER.FIELDS (SUBJECT)])')
+                    if status == 'OK':
+                        msg = email.message_from_bytes(msg_data[0][1], policy=default)
+                        subject = str(msg.get('subject', 'Sans sujet'))
+                        logger.info(f"✅ Test lecture: {subject[:30]}...")
         
-        mail.close()
-        mail.logout()
         logger.info("🎉 DEBUG RÉUSSI - Tout fonctionne!")
         return True
         
@@ -182,11 +333,26 @@ def debug_email_connection_imaplib():
 
 # Classe pour la compatibilité
 class EmailReader:
-    def search_emails(self, mark_as_read=True):
-        return search_emails()
+    def __init__(self, manager=None, account_id=None):
+        self.manager = manager or get_connection_manager()
+        self.account_id = account_id
+        self.idle_listener = None
+    
+    def search_emails(self, mark_as_read=True, mailbox=SYNC_MAILBOX):
+        return search_emails(mailbox, mark_as_read, self.manager, self.account_id)
+    
+    def start_idle(self, on_new_mail, mailbox=SYNC_MAILBOX):
+        """Démarre l'écoute IMAP IDLE ; on_new_mail() est appelé à chaque nouveau message"""
+        if self.idle_listener is None or not self.idle_listener.is_alive():
+            self.idle_listener = IdleListener(self.manager, on_new_mail, mailbox)
+            self.idle_listener.start()
+        return self.idle_listener
     
     def disconnect(self):
-        pass
+        if self.idle_listener is not None:
+            self.idle_listener.stop()
+            self.idle_listener = None
+        self.manager.close_all()
     
     def debug_connection(self):
         return debug_email_connection_imaplib()
\ No newline at end of file
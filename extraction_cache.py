@@ -0,0 +1,148 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from config import EXTRACTION_CACHE_ENABLED, EXTRACTION_CACHE_TTL_DAYS
+from config import EXTRACTION_CACHE_MAX_ENTRIES, EXTRACTION_CACHE_MEMORY_SIZE
+from database import get_cached_extraction, save_cached_extraction, touch_cached_extractions
+from database import evict_extraction_cache, get_extraction_cache_size
+
+logger = logging.getLogger(__name__)
+
+# Éviction SQLite déclenchée toutes les N écritures
+EVICTION_INTERVAL = 100
+# Dates d'usage écrites en SQLite par paquets de N hits (une transaction par paquet)
+TOUCH_BATCH_SIZE = 100
+
+
+def normalize_content(text):
+    """Forme canonique d'un email : Unicode NFC et espaces compactés"""
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+
+def cache_key(content, model, prompt_version):
+    """Clé adressée par le contenu : sha256(version du prompt, modèle, contenu normalisé)"""
+    data = f"{prompt_version}\0{model}\0{normalize_content(content)}"
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+class ExtractionCache:
+    """
+    Cache des tâches extraites : LRU en mémoire devant la table extraction_cache,
+    avec expiration (TTL) et taille maximale. Les hits ne sont pas écrits un par un :
+    leurs dates d'usage sont accumulées puis enregistrées par flush_usage().
+    Une erreur SQLite (base verrouillée, disque plein) est journalisée sans interrompre
+    l'extraction : au pire la réponse n'est pas gardée et sera redemandée.
+    """
+
+    def __init__(self, memory_size=EXTRACTION_CACHE_MEMORY_SIZE, ttl_days=EXTRACTION_CACHE_TTL_DAYS,
+                 max_entries=EXTRACTION_CACHE_MAX_ENTRIES, enabled=EXTRACTION_CACHE_ENABLED):
+        self.memory_size = memory_size
+        self.ttl = ttl_days * 86400
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._memory = OrderedDict()  # clé -> (created_at, tâche)
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._used_at = {}  # clé -> dernier hit pas encore écrit en SQLite
+        self.stats = {'memory_hits': 0, 'db_hits': 0, 'misses': 0, 'stores': 0}
+
+    def _min_created_at(self):
+        return time.time() - self.ttl if self.ttl > 0 else 0
+
+    def get(self, content, model, prompt_version):
+        """Retourne la tâche en cache pour ce contenu, ou None"""
+        if not self.enabled:
+            return None
+        key = cache_key(content, model, prompt_version)
+        min_created_at = self._min_created_at()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and entry[0] >= min_created_at:
+                self._memory.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                flush = self._touch(key)
+                task_data = entry[1]
+            else:
+                task_data = None
+
+        if task_data is None:
+            row = get_cached_extraction(key, min_created_at)
+            with self._lock:
+                if row is None:
+                    self.stats['misses'] += 1
+                    return None
+                self.stats['db_hits'] += 1
+                task_data = json.loads(row[0])
+                self._remember(key, row[1], task_data)
+                flush = self._touch(key)
+        if flush:
+            self.flush_usage()
+        return dict(task_data)
+
+    def put(self, content, model, prompt_version, task_data):
+        """Enregistre une tâche extraite (jamais les tâches de secours)"""
+        if not self.enabled or not task_data:
+            return
+        key = cache_key(content, model, prompt_version)
+        try:
+            save_cached_extraction(key, model, prompt_version, json.dumps(task_data, ensure_ascii=False))
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Extraction non enregistrée dans le cache: {e}")
+            return
+
+        with self._lock:
+            self._remember(key, time.time(), task_data)
+            self.stats['stores'] += 1
+            self._writes += 1
+            evict = self._writes % EVICTION_INTERVAL == 0
+        if evict:
+            # L'éviction LRU doit voir les dates d'usage récentes
+            self.flush_usage()
+            try:
+                evict_extraction_cache(self.max_entries, self._min_created_at())
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ Éviction du cache d'extraction reportée: {e}")
+
+    def _touch(self, key):
+        self._used_at[key] = time.time()
+        return len(self._used_at) >= TOUCH_BATCH_SIZE
+
+    def flush_usage(self):
+        """Écrit les dates d'usage accumulées (fin d'un lot d'extractions, éviction)"""
+        with self._lock:
+            used_at, self._used_at = self._used_at, {}
+        try:
+            touch_cached_extractions(used_at)
+        except sqlite3.Error as e:
+            # Dates d'usage perdues : l'éviction LRU est seulement moins précise
+            logger.warning(f"⚠️ Dates d'usage du cache d'extraction non enregistrées: {e}")
+
+    def _remember(self, key, created_at, task_data):
+        self._memory[key] = (created_at, dict(task_data))
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def clear_memory(self):
+        with self._lock:
+            self._memory.clear()
+
+    def get_stats(self):
+        """Compteurs de hits/misses et tailles, pour l'API"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['memory_entries'] = len(self._memory)
+        lookups = stats['memory_hits'] + stats['db_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['memory_hits'] + stats['db_hits']) / lookups, 3) if lookups else 0.0
+        stats['db_entries'] = get_extraction_cache_size()
+        stats['enabled'] = self.enabled
+        return stats
+
+
+extraction_cache = ExtractionCache()
@@ -0,0 +1,179 @@
+import re
+
+# Parseur minimal des réponses FETCH d'imaplib (listes, atomes, chaînes, littéraux)
+
+_TOKEN_RE = re.compile(rb'''
+    \s+
+  | (?P<open>\()
+  | (?P<close>\))
+  | "(?P<quoted>(?:[^"\\]|\\.)*)"
+  | \{(?P<literal>\d+)\}\s*$
+  | (?P<atom>(?:[^\s()"\[]+|\[[^\]]*\])+)
+''', re.VERBOSE)
+
+_ORIGIN_RE = re.compile(r'<\d+>$')
+
+
+class Literal(bytes):
+    """Contenu d'un littéral IMAP ({n} suivi de n octets)"""
+
+
+def _tokenize(data):
+    """Transforme la liste renvoyée par imaplib en flux de jetons"""
+    for item in data:
+        if item is None:
+            continue
+        if isinstance(item, tuple):
+            prefix, literal = item[0], item[1]
+            yield from _tokenize_line(prefix)
+            yield Literal(literal)
+        else:
+            yield from _tokenize_line(item)
+
+
+def _tokenize_line(line):
+    pos = 0
+    while pos < len(line):
+        match = _TOKEN_RE.match(line, pos)
+        if not match:
+            raise ValueError(f"Réponse IMAP illisible: {line[pos:pos + 40]!r}")
+        pos = match.end()
+        if match.group('open'):
+            yield '('
+        elif match.group('close'):
+            yield ')'
+        elif match.group('quoted') is not None:
+            yield re.sub(rb'\\(.)', rb'\1', match.group('quoted'))
+        elif match.group('atom'):
+            atom = match.group('atom').decode('ascii', errors='replace')
+            yield None if atom.upper() == 'NIL' else atom
+        # les annonces de littéral sont ignorées : le littéral suit dans le tuple
+
+
+def _parse(tokens):
+    """Construit des listes imbriquées à partir du flux de jetons"""
+    stack = [[]]
+    for token in tokens:
+        if token == '(':
+            stack.append([])
+        elif token == ')':
+            if len(stack) == 1:
+                raise ValueError("Parenthèse fermante inattendue")
+            closed = stack.pop()
+            stack[-1].append(closed)
+        else:
+            stack[-1].append(token)
+    if len(stack) != 1:
+        raise ValueError("Réponse IMAP incomplète")
+    return stack[0]
+
+
+def parse_fetch_response(data):
+    """
+    Analyse une réponse FETCH imaplib et retourne une liste de dictionnaires
+    {ATTRIBUT: valeur} (UID, BODYSTRUCTURE, BODY[...], ...)
+    """
+    items = _parse(_tokenize(data))
+    messages = []
+    # Alternance "<seq> (attributs...)"
+    for i in range(0, len(items) - 1, 2):
+        attributes = items[i + 1]
+        if not isinstance(attributes, list):
+            continue
+        fields = {}
+        for j in range(0, len(attributes) - 1, 2):
+            key = attributes[j]
+            if not isinstance(key, str):
+                continue
+            key = _ORIGIN_RE.sub('', key.upper())
+            fields[key] = attributes[j + 1]
+        messages.append(fields)
+    return messages
+
+
+def get_section(fields, prefix):
+    """Retourne la première valeur dont la clé commence par prefix (ex: 'BODY[HEADER')"""
+    prefix = prefix.upper()
+    for key, value in fields.items():
+        if key.startswith(prefix):
+            return value
+    return None
+
+
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, bytes):
+        return value.decode('utf-8', errors='replace')
+    return str(value)
+
+
+def _params(value):
+    """Convertit une liste (clé valeur clé valeur...) en dictionnaire"""
+    if not isinstance(value, list):
+        return {}
+    return {_text(value[i]).lower(): _text(value[i + 1]) for i in range(0, len(value) - 1, 2)}
+
+
+def iter_body_parts(structure, section=''):
+    """
+    Parcourt un BODYSTRUCTURE et produit un dictionnaire par partie feuille
+    (section, type, subtype, charset, encoding, size, attachment)
+    """
+    if not isinstance(structure, list) or not structure:
+        return
+
+    if isinstance(structure[0], list):
+        # Multipart : sous-parties puis sous-type
+        index = 0
+        for child in structure:
+            if not isinstance(child, list):
+                break
+            index += 1
+            child_section = f"{section}.{index}" if section else str(index)
+            yield from iter_body_parts(child, child_section)
+        return
+
+    main_type = _text(structure[0]).lower()
+    subtype = _text(structure[1]).lower() if len(structure) > 1 else ''
+    params = _params(structure[2]) if len(structure) > 2 else {}
+    encoding = _text(structure[5]).lower() if len(structure) > 5 else '7bit'
+    try:
+        size = int(structure[6]) if len(structure) > 6 else 0
+    except (TypeError, ValueError):
+        size = 0
+
+    # Extension : disposition en position 9 pour text/*, 8 pour les autres types simples
+    disposition_index = 9 if main_type == 'text' else 8
+    disposition = ''
+    if len(structure) > disposition_index and isinstance(structure[disposition_index], list):
+        disposition = _text(structure[disposition_index][0]).lower()
+
+    yield {
+        'section': section or '1',
+        'type': main_type,
+        'subtype': subtype,
+        'charset': params.get('charset', 'utf-8'),
+        'encoding': encoding,
+        'size': size,
+        'attachment': disposition == 'attachment' or 'name' in params,
+    }
+
+
+def find_text_part(structure, subtype='plain'):
+    """Retourne la première partie text/<subtype> qui n'est pas une pièce jointe"""
+    for part in iter_body_parts(structure):
+        if part['type'] == 'text' and part['subtype'] == subtype and not part['attachment']:
+            return part
+    return None
+
+
+def uid_set(uids):
+    """Compresse une liste d'UID en ensemble IMAP ("1:5,8,10:12")"""
+    ranges = []
+    for uid in sorted(set(uids)):
+        if ranges and uid == ranges[-1][1] + 1:
+            ranges[-1][1] = uid
+        else:
+            ranges.append([uid, uid])
+    return ','.join(str(a) if a == b else f"{a}:{b}" for a, b in ranges)
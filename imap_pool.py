@@ -0,0 +1,252 @@
+import imaplib
+import logging
+import queue
+import random
+import select
+import ssl
+import threading
+import time
+from contextlib import contextmanager
+from config import IMAP_SERVER, IMAP_PORT, EMAIL_ADDRESS, EMAIL_PASSWORD
+from config import IMAP_USE_SSL, IMAP_POOL_SIZE, IMAP_TIMEOUT, IMAP_NOOP_INTERVAL
+from config import IMAP_RECONNECT_ATTEMPTS, IMAP_RECONNECT_MAX_DELAY, IMAP_IDLE_TIMEOUT
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Erreurs qui invalident une session (la connexion est jetée puis recréée)
+CONNECTION_ERRORS = (imaplib.IMAP4.abort, OSError, EOFError)
+
+
+def backoff_delay(attempt, base=1.0, max_delay=IMAP_RECONNECT_MAX_DELAY):
+    """Délai exponentiel avec jitter pour la tentative n (0, 1, 2...)"""
+    return min(max_delay, base * (2 ** attempt)) * random.uniform(0.5, 1.0)
+
+
+class IMAPConnectionManager:
+    """
+    Garde des sessions IMAP authentifiées ouvertes entre deux synchronisations
+    au lieu de refaire TLS + LOGIN à chaque appel.
+    """
+
+    def __init__(self, host=IMAP_SERVER, port=IMAP_PORT, user=EMAIL_ADDRESS, password=EMAIL_PASSWORD,
+                 use_ssl=IMAP_USE_SSL, pool_size=IMAP_POOL_SIZE, timeout=IMAP_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.use_ssl = use_ssl
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._last_used = {}
+        self.connections_opened = 0
+
+    def connect(self):
+        """Ouvre et authentifie une nouvelle session, avec reconnexion progressive"""
+        last_error = None
+        for attempt in range(IMAP_RECONNECT_ATTEMPTS):
+            try:
+                logger.info(f"🔗 Connexion à {self.host}:{self.port}")
+                with metrics.timer('connect'):
+                    if self.use_ssl:
+                        mail = imaplib.IMAP4_SSL(self.host, self.port, timeout=self.timeout)
+                    else:
+                        mail = imaplib.IMAP4(self.host, self.port, timeout=self.timeout)
+
+                    logger.info("🔑 Authentification...")
+                    mail.login(self.user, self.password)
+                logger.info("✅ Authentification réussie")
+                self.connections_opened += 1
+                return mail
+            except imaplib.IMAP4.error as e:
+                # Identifiants refusés : réessayer ne sert à rien
+                if not isinstance(e, imaplib.IMAP4.abort):
+                    raise
+                last_error = e
+            except (OSError, EOFError) as e:
+                last_error = e
+
+            delay = backoff_delay(attempt)
+            logger.warning(f"⏳ Connexion IMAP échouée ({last_error}), nouvel essai dans {delay:.1f}s")
+            time.sleep(delay)
+
+        raise imaplib.IMAP4.abort(f"Connexion IMAP impossible après {IMAP_RECONNECT_ATTEMPTS} essais: {last_error}")
+
+    @contextmanager
+    def connection(self):
+        """Prête une session authentifiée ; elle retourne au pool si elle est toujours saine"""
+        self._slots.acquire()
+        mail = None
+        try:
+            mail = self._checkout()
+            yield mail
+        except CONNECTION_ERRORS:
+            self._discard(mail)
+            mail = None
+            raise
+        finally:
+            if mail is not None:
+                self._release(mail)
+            self._slots.release()
+
+    def _checkout(self):
+        while True:
+            try:
+                mail = self._idle.get_nowait()
+            except queue.Empty:
+                return self.connect()
+
+            # Vérification légère si la session est restée inactive longtemps
+            if time.monotonic() - self._last_used.get(id(mail), 0) < IMAP_NOOP_INTERVAL:
+                return mail
+            try:
+                mail.noop()
+                return mail
+            except CONNECTION_ERRORS + (imaplib.IMAP4.error,):
+                logger.info("♻️ Session IMAP expirée, reconnexion")
+                self._discard(mail)
+
+    def _release(self, mail):
+        if mail.state == 'SELECTED':
+            try:
+                mail.close()
+            except CONNECTION_ERRORS + (imaplib.IMAP4.error,):
+                self._discard(mail)
+                return
+        self._last_used[id(mail)] = time.monotonic()
+        self._idle.put(mail)
+
+    def _discard(self, mail):
+        if mail is None:
+            return
+        self._last_used.pop(id(mail), None)
+        try:
+            mail.logout()
+        except Exception:
+            pass
+
+    def close_all(self):
+        """Ferme toutes les sessions inactives"""
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+
+class IdleListener(threading.Thread):
+    """
+    Écoute une boîte en IMAP IDLE sur une session dédiée et appelle
+    on_new_mail() dès que le serveur annonce de nouveaux messages.
+    """
+
+    def __init__(self, manager, on_new_mail, mailbox='INBOX', idle_timeout=IMAP_IDLE_TIMEOUT, poll_interval=1.0):
+        super().__init__(name=f"imap-idle-{mailbox}", daemon=True)
+        self.manager = manager
+        self.on_new_mail = on_new_mail
+        self.mailbox = mailbox
+        self.idle_timeout = idle_timeout
+        self.poll_interval = poll_interval
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        attempt = 0
+        while not self._stop_event.is_set():
+            mail = None
+            try:
+                mail = self.manager.connect()
+                mail.select(self.mailbox, readonly=True)
+                attempt = 0
+                logger.info(f"👂 IDLE actif sur {self.mailbox}")
+                while not self._stop_event.is_set():
+                    if self._idle_once(mail):
+                        self._notify()
+            except Exception as e:
+                delay = backoff_delay(attempt)
+                attempt += 1
+                logger.warning(f"⚠️ IDLE interrompu ({e}), reprise dans {delay:.1f}s")
+                self._stop_event.wait(delay)
+            finally:
+                if mail is not None:
+                    try:
+                        mail.logout()
+                    except Exception:
+                        pass
+
+    def _idle_once(self, mail):
+        """Un cycle IDLE ... DONE ; retourne True si de nouveaux messages sont arrivés"""
+        tag = mail._new_tag()
+        mail.send(tag + b' IDLE\r\n')
+        line = mail.readline()
+        if not line.startswith(b'+'):
+            raise imaplib.IMAP4.error(f"IDLE refusé: {line!r}")
+
+        new_mail = False
+        deadline = time.monotonic() + self.idle_timeout
+        while not self._stop_event.is_set() and time.monotonic() < deadline and not new_mail:
+            if not self._readable(mail):
+                continue
+            line = mail.readline()
+            if not line:
+                raise imaplib.IMAP4.abort("Connexion fermée pendant IDLE")
+            if line.startswith(b'*') and line.rstrip().upper().endswith(b'EXISTS'):
+                new_mail = True
+
+        # Fin de l'IDLE (renouvelé régulièrement, les serveurs coupent après ~30 min)
+        mail.send(b'DONE\r\n')
+        while True:
+            line = mail.readline()
+            if not line:
+                raise imaplib.IMAP4.abort("Connexion fermée pendant IDLE")
+            if line.startswith(tag):
+                break
+            if line.startswith(b'*') and line.rstrip().upper().endswith(b'EXISTS'):
+                new_mail = True
+        return new_mail
+
+    def _readable(self, mail):
+        # Réponses déjà lues par imaplib (plusieurs lignes dans un même paquet) :
+        # select() sur la socket ne les voit plus
+        if self._buffered(mail):
+            return True
+        sock = mail.sock
+        if isinstance(sock, ssl.SSLSocket) and sock.pending():
+            return True
+        readable, _, _ = select.select([sock], [], [], self.poll_interval)
+        return bool(readable)
+
+    def _buffered(self, mail):
+        """Données disponibles sans attendre : tampon de mail.file ou octets déjà arrivés"""
+        sock = mail.sock
+        timeout = sock.gettimeout()
+        sock.setblocking(False)
+        try:
+            return bool(mail.file.peek(1))
+        except (BlockingIOError, ssl.SSLWantReadError):
+            return False
+        finally:
+            sock.settimeout(timeout)
+
+    def _notify(self):
+        logger.info(f"📬 Nouveau message signalé sur {self.mailbox}")
+        try:
+            self.on_new_mail()
+        except Exception as e:
+            logger.error(f"⚠️ Erreur du traitement IDLE: {e}")
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_connection_manager():
+    """Gestionnaire partagé par toute l'application"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = IMAPConnectionManager()
+        return _manager
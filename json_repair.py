@@ -0,0 +1,188 @@
+import json
+import re
+
+# Lecture tolérante du JSON produit par un modèle : texte autour de la valeur
+# (phrase d'introduction, bloc ```json), virgules en trop ou manquantes,
+# guillemets simples, littéraux Python, clés non citées et réponse tronquée
+
+_NUMBER_RE = re.compile(r'-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?$')
+_LITERALS = {'true': 'true', 'false': 'false', 'null': 'null', 'none': 'null', 'undefined': 'null'}
+_ESCAPES = {'\n': '\\n', '\r': '\\r', '\t': '\\t'}
+
+
+class JSONRepairer:
+    """
+    Analyse incrémentale : le texte est fourni par morceaux (réponse complète ou
+    deltas d'un flux) et réécrit au fil de l'eau en JSON strict. Seule la première
+    valeur de premier niveau est conservée ; close() referme ce qui est resté
+    ouvert et retourne la valeur décodée, ou None.
+    """
+
+    def __init__(self, openers='{['):
+        self.openers = openers
+        self.started = False
+        self.done = False
+        self.repaired = False
+        self._out = []
+        self._stack = []
+        self._quote = None
+        self._escape = False
+        self._word = []
+        self._key_start = None
+
+    def feed(self, chunk):
+        """Ajoute un morceau de texte ; retourne False quand la valeur est complète"""
+        for char in chunk:
+            if self.done:
+                break
+            if not self.started:
+                if char in self.openers:
+                    self.started = True
+                    self._open(char)
+            elif self._quote:
+                self._string_char(char)
+            else:
+                self._char(char)
+        return not self.done
+
+    def close(self):
+        """Referme chaînes, objets et tableaux ouverts puis décode ; None si rien d'exploitable"""
+        if not self.started:
+            return None
+        if not self.done:
+            self.repaired = True
+            if self._quote:
+                if self._escape:
+                    self._out.pop()
+                self._end_string()
+            self._flush_word()
+            if self._last() == ',':
+                self._out.pop()
+            if self._last() == ':':
+                self._out.append('null')
+            elif self._key_start is not None:
+                # Réponse coupée juste après une clé
+                self._out.append(':null')
+            while self._stack:
+                self._out.append(self._stack.pop())
+        try:
+            return json.loads(''.join(self._out))
+        except ValueError:
+            return None
+
+    def _last(self):
+        return self._out[-1][-1] if self._out else ''
+
+    def _separate(self):
+        # Deux valeurs accolées ("a" "b", } {) : virgule manquante
+        if self._last() in '"}]' or (self._out and self._out[-1][-1].isalnum()):
+            self._out.append(',')
+            self.repaired = True
+
+    def _open(self, char):
+        self._out.append(char)
+        self._stack.append('}' if char == '{' else ']')
+
+    def _char(self, char):
+        if char.isspace():
+            self._flush_word()
+        elif char in '"\'':
+            self._flush_word()
+            self._separate()
+            # Chaîne en position de clé : suivie de ":" si la réponse est complète
+            in_object = self._stack and self._stack[-1] == '}'
+            self._key_start = len(self._out) if in_object and self._last() in '{,' else None
+            self._quote = char
+            self._out.append('"')
+            if char == "'":
+                self.repaired = True
+        elif char in '{[':
+            self._flush_word()
+            self._separate()
+            self._open(char)
+        elif char in '}]':
+            self._flush_word()
+            self._close(char)
+        elif char == ',':
+            self._flush_word()
+            if self._last() in ',[{':
+                self.repaired = True
+            else:
+                self._out.append(',')
+        elif char == ':':
+            self._flush_word()
+            self._key_start = None
+            self._out.append(':')
+        else:
+            self._word.append(char)
+
+    def _close(self, char):
+        if char not in self._stack:
+            self.repaired = True
+            return
+        if self._last() == ',':
+            self._out.pop()
+            self.repaired = True
+        if self._last() == ':':
+            self._out.append('null')
+            self.repaired = True
+        # Fermeture qui saute un niveau resté ouvert
+        while self._stack[-1] != char:
+            self._out.append(self._stack.pop())
+            self.repaired = True
+        self._out.append(self._stack.pop())
+        self._key_start = None
+        if not self._stack:
+            self.done = True
+
+    def _string_char(self, char):
+        if self._escape:
+            self._escape = False
+            if char == "'":
+                # \' n'existe pas en JSON
+                self._out[-1] = "'"
+                self.repaired = True
+            else:
+                self._out.append(char)
+        elif char == '\\':
+            self._escape = True
+            self._out.append('\\')
+        elif char == self._quote:
+            self._end_string()
+        elif char == '"':
+            self._out.append('\\"')
+        elif char < ' ':
+            self._out.append(_ESCAPES.get(char, f'\\u{ord(char):04x}'))
+            self.repaired = True
+        else:
+            self._out.append(char)
+
+    def _end_string(self):
+        self._out.append('"')
+        self._quote = None
+
+    def _flush_word(self):
+        if not self._word:
+            return
+        word = ''.join(self._word)
+        self._word = []
+        self._separate()
+        if word.lower() in _LITERALS:
+            value = _LITERALS[word.lower()]
+            self.repaired = self.repaired or value != word
+        elif _NUMBER_RE.match(word):
+            value = word
+        else:
+            # Clé ou valeur sans guillemets
+            value = json.dumps(word, ensure_ascii=False)
+            self.repaired = True
+        in_object = self._stack and self._stack[-1] == '}'
+        self._key_start = len(self._out) if in_object and self._last() in '{,' else None
+        self._out.append(value)
+
+
+def parse_json(text, openers='{['):
+    """Valeur JSON d'une réponse de modèle, réparée si besoin ; None si illisible"""
+    repairer = JSONRepairer(openers)
+    repairer.feed(text)
+    return repairer.close()
@@ -0,0 +1,91 @@
+import re
+import unicodedata
+from config import KEYWORDS, KEYWORD_WEIGHTS, KEYWORD_DEFAULT_WEIGHT
+
+
+# Diacritiques combinants laissés par la décomposition NFKD
+_COMBINING_RE = re.compile('[\u0300-\u036f]')
+
+
+def normalize_text(text):
+    """Minuscules sans accents ('Échéance' -> 'echeance') pour une comparaison tolérante"""
+    text = text.casefold()
+    if text.isascii():
+        return text
+    return _COMBINING_RE.sub('', unicodedata.normalize('NFKD', text))
+
+
+def _trie_pattern(words):
+    """
+    Construit une expression régulière en forme de trie à partir des mots-clés :
+    les préfixes communs ne sont testés qu'une fois (pas d'essai mot par mot).
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node):
+        end = '' in node
+        branches = []
+        for char in sorted(c for c in node if c):
+            # Un espace dans un mot-clé accepte n'importe quel blanc ("dead  line", "à\nfaire")
+            token = r'\s+' if char == ' ' else re.escape(char)
+            branches.append(token + build(node[char]))
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if end:
+            body = '(?:' + body + ')?'
+        return body
+
+    return build(trie)
+
+
+class KeywordMatcher:
+    """
+    Détecte en une seule passe tous les mots-clés d'un texte, sans accents,
+    en respectant les frontières de mots ('plan' ne trouve pas 'planète'),
+    et calcule un score de pertinence pondéré.
+    """
+
+    def __init__(self, keywords=KEYWORDS, weights=None, default_weight=KEYWORD_DEFAULT_WEIGHT):
+        weights = {normalize_text(k): w for k, w in (KEYWORD_WEIGHTS if weights is None else weights).items()}
+        self.keywords = {}  # forme normalisée -> mot-clé d'origine
+        for keyword in keywords:
+            normalized = ' '.join(normalize_text(keyword).split())
+            if normalized and normalized not in self.keywords:
+                self.keywords[normalized] = keyword
+        self.weights = {original: weights.get(k, default_weight) for k, original in self.keywords.items()}
+        self.pattern = re.compile(r'\b' + _trie_pattern(self.keywords) + r'\b')
+
+    def find(self, text):
+        """Retourne {mot-clé d'origine: occurrences} pour les mots-clés présents"""
+        hits = {}
+        for match in self.pattern.finditer(normalize_text(text)):
+            normalized = ' '.join(match.group().split())
+            keyword = self.keywords[normalized]
+            hits[keyword] = hits.get(keyword, 0) + 1
+        return hits
+
+    def score(self, hits):
+        """Somme des poids des mots-clés distincts trouvés"""
+        return round(sum(self.weights[keyword] for keyword in hits), 2)
+
+    def analyze(self, text):
+        """Retourne (mots-clés trouvés, score de pertinence)"""
+        hits = self.find(text)
+        return list(hits), self.score(hits)
+
+
+_matcher = None
+
+
+def get_keyword_matcher():
+    """Matcher construit une seule fois à partir de config.KEYWORDS"""
+    global _matcher
+    if _matcher is None:
+        _matcher = KeywordMatcher()
+    return _matcher
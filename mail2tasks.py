@@ -0,0 +1,100 @@
+"""
+Commandes sans serveur web, pour cron ou systemd :
+
+    python -m mail2tasks sync                      # tous les comptes actifs
+    python -m mail2tasks sync --account perso --json
+    python -m mail2tasks idle                      # synchronise à chaque nouvel email (IMAP IDLE)
+
+La synchronisation est enregistrée dans sync_jobs comme celles lancées depuis
+l'interface : le tableau de bord en affiche l'avancement (/events).
+Code de sortie : 0 si terminée (ou déjà en cours ailleurs), 1 en cas d'échec.
+"""
+import argparse
+import json
+import logging
+import sys
+from config import LOG_LEVEL
+
+logger = logging.getLogger('mail2tasks')
+
+
+def configure_logging(level=LOG_LEVEL):
+    """Configuration unique de la journalisation (sans effet si le serveur d'application l'a déjà faite)"""
+    logging.basicConfig(level=level)
+
+
+def select_accounts(names):
+    """Comptes actifs désignés par nom ou par id (tous si names est vide)"""
+    from database import get_accounts
+    accounts = get_accounts(enabled_only=True)
+    if not names:
+        return None
+    selected = [a for a in accounts if a['name'] in names or str(a['id']) in names]
+    unknown = set(names) - {a['name'] for a in selected} - {str(a['id']) for a in selected}
+    if unknown:
+        raise SystemExit(f"Compte(s) inconnu(s) ou désactivé(s): {', '.join(sorted(unknown))}")
+    return selected
+
+
+def sync_command(args):
+    from database import init_db, create_sync_job, get_active_sync_job
+    from sync_jobs import fail_stale_jobs, run_job
+
+    init_db()
+    accounts = select_accounts(args.account)
+    # Un job dont le processus est mort (crash, kill) ne bloque pas les passages suivants
+    fail_stale_jobs()
+    active = get_active_sync_job()
+    if active and not args.force:
+        logger.warning(f"⏭️ Synchronisation {active['id']} déjà en cours, rien à faire")
+        return 0
+    job_id = create_sync_job()
+    logger.info(f"🚀 Synchronisation {job_id} lancée")
+    job = run_job(job_id, accounts=accounts)
+
+    print(json.dumps(job, ensure_ascii=False) if args.json else job['message'])
+    return 0 if job['status'] == 'done' else 1
+
+
+def idle_command(args):
+    from database import init_db
+    from sync_jobs import fail_stale_jobs, get_job_runner
+    from sync_pipeline import get_reader
+
+    init_db()
+    fail_stale_jobs()
+    runner = get_job_runner()
+    reader = get_reader()
+    # Une seule session IDLE pour toute l'installation : les workers web n'en ouvrent pas
+    listener = reader.start_idle(runner.submit)
+    logger.info("👂 En attente de nouveaux emails (Ctrl+C pour arrêter)")
+    try:
+        while listener.is_alive():
+            listener.join(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reader.disconnect()
+        runner.shutdown()
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m mail2tasks', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    sync = commands.add_parser('sync', help="synchronise les emails puis quitte")
+    sync.add_argument('--account', action='append', help="nom ou id du compte (répétable, défaut : tous)")
+    sync.add_argument('--json', action='store_true', help="affiche l'état final du job en JSON")
+    sync.add_argument('--force', action='store_true', help="lance même si une synchronisation est en cours")
+    sync.set_defaults(handler=sync_command)
+    idle = commands.add_parser('idle', help="écoute la boîte en IMAP IDLE et synchronise à chaque nouvel email")
+    idle.set_defaults(handler=idle_command)
+    args = parser.parse_args(argv)
+
+    configure_logging()
+    return args.handler(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,145 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+from config import METRICS_ENABLED
+
+# Instrumentation du pipeline de synchronisation : durée de chaque étape
+# (histogrammes), compteurs d'emails et de tâches, tokens consommés par l'IA.
+# Exposée au format texte Prometheus (/metrics) et résumée par synchronisation
+# dans la table sync_runs. Désactivée, chaque appel se réduit à un test.
+
+STAGES = ('connect', 'search', 'fetch', 'parse', 'filter', 'llm', 'dedup', 'insert')
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+PREFIX = 'mail2tasks'
+
+COUNTERS = {
+    'emails_seen': "Emails examinés (UID récupérés sur le serveur)",
+    'emails_skipped': "Emails déjà traités lors d'une synchronisation précédente",
+    'emails_filtered': "Emails écartés avant l'IA (reason=keywords|preclassifier)",
+    'emails_extracted': "Emails envoyés à l'extraction IA",
+    'fallback_tasks': "Tâches de secours créées faute de réponse IA lisible",
+    'tasks': "Tâches enregistrées (result=added|merged|updated)",
+    'llm_requests': "Appels HTTP à l'API Mistral (status=code HTTP ou error)",
+    'llm_tokens': "Tokens déclarés par l'API dans le champ usage (type=prompt|completion)",
+    'syncs': "Synchronisations terminées (status=done|error)",
+}
+
+_NULL_TIMER = nullcontext()
+
+
+class _Timer:
+    __slots__ = ('metrics', 'stage', 'start')
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class Metrics:
+    """Registre des métriques du processus, partagé entre threads"""
+
+    def __init__(self, enabled=METRICS_ENABLED):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        # étape -> [compte par bucket (+Inf en dernier), somme, nombre]
+        self._stages = {stage: [[0] * (len(BUCKETS) + 1), 0.0, 0] for stage in STAGES}
+        # (nom, (label, valeur)...) -> valeur
+        self._counters = {}
+
+    def timer(self, stage):
+        """Contexte qui mesure la durée d'une étape : with metrics.timer('fetch'): ..."""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, stage)
+
+    def observe(self, stage, seconds):
+        if not self.enabled:
+            return
+        with self._lock:
+            buckets, _, _ = entry = self._stages[stage]
+            buckets[bisect_left(BUCKETS, seconds)] += 1
+            entry[1] += seconds
+            entry[2] += 1
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled or not value:
+            return
+        key = (name, *sorted(labels.items()))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def snapshot(self):
+        """État courant : {'stages': {étape: (nombre, somme)}, 'counters': {clé: valeur}}"""
+        with self._lock:
+            return {
+                'stages': {stage: (entry[2], entry[1]) for stage, entry in self._stages.items()},
+                'counters': dict(self._counters),
+            }
+
+    def delta(self, before):
+        """
+        Écart depuis un snapshot, pour le résumé d'une synchronisation :
+        ({étape: secondes}, {nom: total toutes étiquettes confondues}, {clé complète: valeur})
+        """
+        after = self.snapshot()
+        stages = {}
+        for stage, (count, total) in after['stages'].items():
+            if count > before['stages'][stage][0]:
+                stages[stage] = round(total - before['stages'][stage][1], 4)
+        totals, detailed = {}, {}
+        for key, value in after['counters'].items():
+            value -= before['counters'].get(key, 0)
+            if value:
+                detailed[key] = value
+                totals[key[0]] = totals.get(key[0], 0) + value
+        return stages, totals, detailed
+
+    def render(self):
+        """Exposition au format texte Prometheus (version 0.0.4)"""
+        snapshot_stages, counters = self._copy()
+        lines = [
+            f"# HELP {PREFIX}_stage_duration_seconds Durée des étapes de synchronisation",
+            f"# TYPE {PREFIX}_stage_duration_seconds histogram",
+        ]
+        for stage, (buckets, total, count) in snapshot_stages.items():
+            cumulative = 0
+            for bound, bucket in zip(BUCKETS + ('+Inf',), buckets):
+                cumulative += bucket
+                lines.append(f'{PREFIX}_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{PREFIX}_stage_duration_seconds_sum{{stage="{stage}"}} {total:.6f}')
+            lines.append(f'{PREFIX}_stage_duration_seconds_count{{stage="{stage}"}} {count}')
+
+        for name, help_text in COUNTERS.items():
+            lines.append(f"# HELP {PREFIX}_{name}_total {help_text}")
+            lines.append(f"# TYPE {PREFIX}_{name}_total counter")
+            series = sorted((key, value) for key, value in counters.items() if key[0] == name)
+            for key, value in series or [((name,), 0)]:
+                labels = ','.join(f'{label}="{label_value}"' for label, label_value in key[1:])
+                lines.append(f"{PREFIX}_{name}_total{{{labels}}} {value}" if labels else
+                             f"{PREFIX}_{name}_total {value}")
+        return '\n'.join(lines) + '\n'
+
+    def _copy(self):
+        with self._lock:
+            stages = {stage: (list(entry[0]), entry[1], entry[2]) for stage, entry in self._stages.items()}
+            return stages, dict(self._counters)
+
+    def reset(self):
+        with self._lock:
+            for entry in self._stages.values():
+                entry[0] = [0] * (len(BUCKETS) + 1)
+                entry[1] = 0.0
+                entry[2] = 0
+            self._counters.clear()
+
+
+metrics = Metrics()
@@ -0,0 +1,180 @@
+import html
+import re
+from email.parser import BytesFeedParser
+
+# Extraction du texte utile d'un email : décodage selon le charset, repli sur
+# text/html, suppression des citations et de la signature, puis troncature
+
+MAX_BODY_CHARS = 5000
+MAX_MESSAGE_BYTES = 256 * 1024
+READ_CHUNK_SIZE = 16 * 1024
+
+_DROP_RE = re.compile(r'<(script|style|head|title)\b.*?</\1\s*>|<!--.*?-->', re.IGNORECASE | re.DOTALL)
+_BLOCK_RE = re.compile(r'<(?:br|hr|/?p|/?div|/?li|/?tr|/?h[1-6]|/?table|/?ul|/?ol)\b[^>]*>', re.IGNORECASE)
+_TAG_RE = re.compile(r'<[^>]*>')
+# Début de l'historique cité dans les clients courants (blockquote, Gmail, Outlook)
+_HTML_QUOTE_RE = re.compile(
+    r'<blockquote\b|<div\b[^>]*(?:gmail_quote|divRplyFwdMsg|moz-cite-prefix|yahoo_quoted)', re.IGNORECASE)
+
+_REPLY_HEADER_RE = re.compile(
+    r'^(?:(?:le|on)\b.{0,200}\b(?:a écrit|wrote)\s*:?'
+    r'|.{0,200}\b(?:a écrit|wrote)\s*:'
+    r'|-{2,}\s*(?:original message|message d\'origine|message original)\s*-{2,}'
+    r'|_{10,})\s*$',
+    re.IGNORECASE)
+_HEADER_BLOCK_RE = re.compile(r'^(?:de|from)\s*:', re.IGNORECASE)
+_HEADER_FIELD_RE = re.compile(r'^(?:envoyé|sent|date|à|to|objet|subject)\s*:', re.IGNORECASE)
+_FORWARD_SUBJECT_RE = re.compile(r'^(?:objet|subject)\s*:\s*(?:tr|fw|fwd)\s*:', re.IGNORECASE)
+_SIGNATURE_RE = re.compile(r'^(?:--|__)\s*$|^(?:envoyé (?:de|depuis) mon|sent from my|get outlook for)\b',
+                           re.IGNORECASE)
+_SIGN_OFF_RE = re.compile(
+    r'^(?:cordialement|bien cordialement|bien à (?:vous|toi)|salutations|merci d\'avance|'
+    r'best regards|kind regards|regards|best|cheers|thanks)\W*$', re.IGNORECASE)
+SIGN_OFF_MAX_TAIL = 8
+
+_CONTENT_TYPE_RE = re.compile(rb'^content-type:\s*([\w.+-]+)/', re.IGNORECASE | re.MULTILINE)
+
+
+def decode_payload(payload, charset):
+    """Décode des octets selon le charset déclaré (UTF-8 si absent ou inconnu)"""
+    try:
+        return payload.decode(charset or 'utf-8', errors='replace')
+    except LookupError:
+        return payload.decode('utf-8', errors='replace')
+
+
+def html_to_text(source):
+    """Conversion HTML -> texte par expressions régulières (sans construire d'arbre)"""
+    quote = _HTML_QUOTE_RE.search(source)
+    if quote:
+        source = source[:quote.start()]
+    source = _DROP_RE.sub(' ', source)
+    source = _BLOCK_RE.sub('\n', source)
+    source = _TAG_RE.sub(' ', source)
+    return html.unescape(source).replace('\xa0', ' ')
+
+
+def _is_header_block(lines, index):
+    """Bloc "De : / Envoyé : / Objet :" d'Outlook ; un transfert (Objet : TR:) est conservé"""
+    following = lines[index + 1:index + 6]
+    if not any(_HEADER_FIELD_RE.match(line) for line in following):
+        return False
+    return not any(_FORWARD_SUBJECT_RE.match(line) for line in following)
+
+
+def strip_quotes(text):
+    """
+    Retire l'historique cité d'une réponse (lignes "> ...", "Le ... a écrit :",
+    en-têtes Outlook) et la signature. Un email sans texte propre au-dessus de
+    la citation est conservé tel quel.
+    """
+    lines = [line.strip() for line in text.splitlines()]
+    kept = []
+    for index, line in enumerate(lines):
+        if _REPLY_HEADER_RE.match(line) or (_HEADER_BLOCK_RE.match(line) and _is_header_block(lines, index)):
+            if any(kept):
+                break
+            continue
+        if line.startswith('>'):
+            continue
+        if _SIGNATURE_RE.match(line) and any(kept):
+            break
+        kept.append(line)
+
+    # Formule de politesse proche de la fin : la suite est la signature
+    content = [i for i, line in enumerate(kept) if line]
+    for position, index in enumerate(content):
+        if len(content) - position <= SIGN_OFF_MAX_TAIL and position > 0 and _SIGN_OFF_RE.match(kept[index]):
+            kept = kept[:index]
+            break
+
+    return '\n'.join(kept) if any(kept) else text
+
+
+def clean_body(text, limit=MAX_BODY_CHARS):
+    """Citations et signature retirées avant la troncature, espaces normalisés"""
+    return ' '.join(strip_quotes(text).split())[:limit]
+
+
+def part_text(payload, subtype, charset):
+    """Texte d'une partie déjà décodée de son transfer-encoding"""
+    text = decode_payload(payload, charset)
+    return html_to_text(text) if subtype == 'html' else text
+
+
+class BodyExtractor:
+    """
+    Analyse incrémentale d'un message RFC822 (BytesFeedParser) : les octets sont
+    fournis par morceaux et la lecture s'arrête dès qu'une pièce jointe commence
+    après une partie texte, ou au-delà de max_bytes.
+    """
+
+    def __init__(self, max_bytes=MAX_MESSAGE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.done = False
+        self._parser = BytesFeedParser()
+        self._seen_text = False
+        self._tail = b''
+
+    def feed(self, data):
+        """Ajoute un morceau ; retourne False quand la suite est inutile"""
+        if self.done:
+            return False
+        self._parser.feed(data)
+        self.size += len(data)
+
+        # En-têtes Content-Type rencontrés dans ce morceau (avec la fin du précédent)
+        window = self._tail + data
+        for match in _CONTENT_TYPE_RE.finditer(window):
+            if match.start() < len(self._tail) and match.end() <= len(self._tail):
+                continue
+            main_type = match.group(1).lower()
+            if main_type == b'text':
+                self._seen_text = True
+            elif main_type not in (b'multipart', b'message') and self._seen_text:
+                self.done = True
+        self._tail = window[-256:]
+
+        if self.size >= self.max_bytes:
+            self.done = True
+        return not self.done
+
+    def close(self):
+        """Termine l'analyse et retourne le texte nettoyé (chaîne vide si aucun)"""
+        message = self._parser.close()
+        plain, html_source = [], None
+        # Toutes les parties text/plain (dont celles d'un email joint), le HTML en repli
+        for part in message.walk():
+            if part.is_multipart() or part.get_content_maintype() != 'text':
+                continue
+            if part.get_content_disposition() == 'attachment':
+                continue
+            payload = part.get_payload(decode=True)
+            if not payload:
+                continue
+            subtype = part.get_content_subtype()
+            if subtype == 'plain':
+                plain.append(clean_body(part_text(payload, subtype, part.get_content_charset())))
+            elif subtype == 'html' and html_source is None:
+                html_source = (payload, part.get_content_charset())
+
+        text = ' '.join(filter(None, plain))[:MAX_BODY_CHARS]
+        if not text and html_source:
+            text = clean_body(part_text(html_source[0], 'html', html_source[1]))
+        return text
+
+
+def extract_body(source, max_bytes=MAX_MESSAGE_BYTES):
+    """Texte d'un message brut (octets ou fichier binaire), lu par morceaux"""
+    extractor = BodyExtractor(max_bytes)
+    if isinstance(source, (bytes, bytearray)):
+        for start in range(0, len(source), READ_CHUNK_SIZE):
+            if not extractor.feed(bytes(source[start:start + READ_CHUNK_SIZE])):
+                break
+    else:
+        while True:
+            chunk = source.read(READ_CHUNK_SIZE)
+            if not chunk or not extractor.feed(chunk):
+                break
+    return extractor.close()
@@ -0,0 +1,121 @@
+import logging
+import math
+import random
+import re
+import threading
+from collections import Counter
+from config import PRECLASSIFIER_ENABLED, PRECLASSIFIER_THRESHOLD, PRECLASSIFIER_MIN_SAMPLES, PRECLASSIFIER_EXPLORATION
+from database import get_classifier_samples, count_classifier_samples
+from keyword_matcher import normalize_text
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r'\w{2,}')
+
+
+def tokenize(text):
+    """Mots normalisés (minuscules, sans accents) d'au moins 2 caractères"""
+    return _TOKEN_RE.findall(normalize_text(text))
+
+
+class NaiveBayesClassifier:
+    """
+    Naive Bayes multinomial (lissage de Laplace) en Python pur :
+    probabilité qu'un email mène à une tâche conservée.
+    """
+
+    def __init__(self, alpha=1.0):
+        self.alpha = alpha
+        self.log_priors = {}
+        self.log_likelihoods = {}
+        self.log_unknown = {}
+
+    def fit(self, texts, labels):
+        counts = {0: Counter(), 1: Counter()}
+        documents = Counter(labels)
+        for text, label in zip(texts, labels):
+            counts[label].update(tokenize(text))
+
+        vocabulary = set(counts[0]) | set(counts[1])
+        total = sum(documents.values())
+        for label in (0, 1):
+            denominator = sum(counts[label].values()) + self.alpha * (len(vocabulary) + 1)
+            self.log_priors[label] = math.log((documents[label] + self.alpha) / (total + 2 * self.alpha))
+            self.log_likelihoods[label] = {
+                token: math.log((count + self.alpha) / denominator) for token, count in counts[label].items()
+            }
+            self.log_unknown[label] = math.log(self.alpha / denominator)
+        return self
+
+    def predict_proba(self, text):
+        """Probabilité de la classe 1 (email actionnable)"""
+        tokens = tokenize(text)
+        scores = {}
+        for label in (0, 1):
+            likelihoods = self.log_likelihoods[label]
+            unknown = self.log_unknown[label]
+            scores[label] = self.log_priors[label] + sum(likelihoods.get(token, unknown) for token in tokens)
+        # Softmax sur deux classes, stable numériquement
+        delta = max(-700.0, min(700.0, scores[0] - scores[1]))
+        return 1.0 / (1.0 + math.exp(delta))
+
+
+class PreClassifier:
+    """
+    Filtre local avant l'IA : entraîné sur les tâches conservées / supprimées,
+    réentraîné (refresh, une fois par synchronisation) dès que le nombre d'exemples
+    a changé. Inactif tant qu'il n'y a pas assez d'exemples de chaque classe.
+    """
+
+    def __init__(self, threshold=PRECLASSIFIER_THRESHOLD, min_samples=PRECLASSIFIER_MIN_SAMPLES,
+                 exploration=PRECLASSIFIER_EXPLORATION, enabled=PRECLASSIFIER_ENABLED):
+        self.threshold = threshold
+        self.min_samples = min_samples
+        self.exploration = exploration
+        self.enabled = enabled
+        self._model = None
+        self._trained_on = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """
+        Compte les exemples et réentraîne si ce nombre a changé. Appelé une fois par
+        synchronisation : les emails évalués ensuite ne relisent pas la base
+        """
+        counts = count_classifier_samples()
+        with self._lock:
+            if counts != self._trained_on:
+                self._trained_on = counts
+                if min(counts) < self.min_samples:
+                    self._model = None
+                else:
+                    samples = get_classifier_samples()
+                    self._model = NaiveBayesClassifier().fit([t for t, _ in samples], [l for _, l in samples])
+                    logger.info(f"🧮 Pré-classifieur entraîné ({counts[0]} conservées, {counts[1]} supprimées)")
+            return self._model
+
+    def model(self):
+        """Retourne le modèle courant (entraîné au premier appel), ou None si les données sont insuffisantes"""
+        if self._trained_on is None:
+            return self.refresh()
+        return self._model
+
+    def score(self, text):
+        """Probabilité que l'email soit actionnable, ou None si le modèle n'est pas prêt"""
+        if not self.enabled:
+            return None
+        model = self.model()
+        return model.predict_proba(text) if model else None
+
+    def should_extract(self, text):
+        """
+        Retourne (envoyer à l'IA ?, score). Une petite part des emails sous le seuil
+        est envoyée quand même pour continuer à recueillir des exemples.
+        """
+        score = self.score(text)
+        if score is None or score >= self.threshold:
+            return True, score
+        return random.random() < self.exploration, score
+
+
+preclassifier = PreClassifier()
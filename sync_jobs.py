@@ -0,0 +1,197 @@
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from config import EVENTS_POLL_INTERVAL, EVENTS_STREAM_TIMEOUT, SYNC_JOB_HEARTBEAT_INTERVAL
+from database import create_sync_job, update_sync_job, get_sync_job, get_active_sync_job, fail_interrupted_sync_jobs
+from database import get_task_changes, touch_sync_job, close_connection, TASK_CHANGES_BATCH
+
+logger = logging.getLogger(__name__)
+
+FINISHED_STATUSES = ('done', 'error')
+
+
+def _now():
+    # Même format UTC que CURRENT_TIMESTAMP de SQLite
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class SyncJobRunner:
+    """
+    Exécute les synchronisations dans un thread de fond ; l'état de chaque
+    job est écrit dans la table sync_jobs pour être consulté par l'API.
+    """
+
+    def __init__(self, pipeline=None):
+        self.pipeline = pipeline
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sync')
+        self._lock = threading.Lock()
+
+    def submit(self):
+        """Lance une synchronisation, ou retourne l'id de celle déjà en cours (ici ou dans un autre processus)"""
+        with self._lock:
+            fail_stale_jobs()
+            active = get_active_sync_job()
+            if active:
+                return active['id']
+            job_id = create_sync_job()
+            self._executor.submit(self._run, job_id)
+        logger.info(f"🚀 Synchronisation {job_id} lancée en arrière-plan")
+        return job_id
+
+    def _run(self, job_id):
+        run_job(job_id, self.pipeline)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+def fail_stale_jobs():
+    """
+    Clôt les jobs restés actifs sans signe de vie (processus arrêté ou tué) ; même
+    critère pour le runner de l'application et la commande `python -m mail2tasks sync`
+    """
+    interrupted = fail_interrupted_sync_jobs()
+    if interrupted:
+        logger.warning(f"⚠️ {interrupted} synchronisation(s) interrompue(s) sans signe de vie")
+    return interrupted
+
+
+def run_job(job_id, pipeline=None, **options):
+    """
+    Exécute la synchronisation job_id dans le thread courant (runner de l'application
+    ou commande `python -m mail2tasks sync`) ; l'état est écrit dans sync_jobs, avec un
+    signe de vie périodique tant que le job tourne
+    """
+    if pipeline is None:
+        # Import différé : imaplib, email et requests ne sont chargés qu'à la première synchronisation
+        from sync_pipeline import run_sync as pipeline
+    stop = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat, args=(job_id, stop), name=f'sync-heartbeat-{job_id}', daemon=True)
+    update_sync_job(job_id, status='running', started_at=_now())
+    heartbeat.start()
+    try:
+        stats = pipeline(progress=lambda counters: update_sync_job(job_id, **counters), job_id=job_id, **options)
+        update_sync_job(job_id, status='done', finished_at=_now(), message=summarize(stats), **stats)
+    except Exception as e:
+        logger.error(f"💥 Synchronisation {job_id} en échec: {e}")
+        update_sync_job(job_id, status='error', finished_at=_now(), message=str(e))
+    finally:
+        stop.set()
+        heartbeat.join()
+    return get_sync_job(job_id)
+
+
+def _heartbeat(job_id, stop, interval=SYNC_JOB_HEARTBEAT_INTERVAL):
+    while not stop.wait(interval):
+        try:
+            touch_sync_job(job_id)
+        except Exception as e:
+            logger.warning(f"⚠️ Signe de vie du job {job_id} non enregistré: {e}")
+    close_connection()
+
+
+def summarize(stats):
+    """Message lisible pour l'interface, comme les anciens messages flash"""
+    message = _summary(stats)
+    if stats.get('errors', 0) > 0 and stats['processed'] > 0:
+        message += f" - ⚠️ {stats['errors']} emails en échec, retentés au prochain passage"
+    return message
+
+
+def _summary(stats):
+    if stats['tasks_added'] > 0:
+        return f"✅ {stats['tasks_added']} nouvelles tâches ajoutées! ({stats['processed']} emails traités)"
+    if stats.get('tasks_updated', 0) > 0:
+        return f"🧵 {stats['tasks_updated']} tâches de conversations mises à jour ({stats['processed']} emails traités)"
+    if stats['processed'] > 0:
+        return f"ℹ️ Aucune nouvelle tâche trouvée ({stats['processed']} emails analysés)"
+    if stats.get('errors', 0) > 0:
+        return f"⚠️ {stats['errors']} emails en échec, retentés au prochain passage"
+    if stats['skipped'] > 0:
+        return f"🔁 Tous les emails ont déjà été traités ({stats['skipped']} emails ignorés)"
+    if stats.get('filtered', 0) > 0:
+        return f"🚫 Aucun email pertinent ({stats['filtered']} écartés par le pré-classifieur)"
+    return '📭 Aucun email à traiter'
+
+
+def job_events(job_id, interval=0.5, timeout=600):
+    """Flux server-sent events : un événement à chaque changement d'état du job"""
+    last = None
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = get_sync_job(job_id)
+        if job is None:
+            yield f"event: error\ndata: {json.dumps({'error': 'job inconnu'})}\n\n"
+            return
+        if job != last:
+            yield f"data: {json.dumps(job)}\n\n"
+            last = job
+        if job['status'] in FINISHED_STATUSES:
+            return
+        time.sleep(interval)
+
+
+def sse(data, event=None, event_id=None):
+    """Un événement server-sent events (data en JSON)"""
+    head = (f"id: {event_id}\n" if event_id is not None else '') + (f"event: {event}\n" if event else '')
+    return f"{head}data: {json.dumps(data)}\n\n"
+
+
+def dashboard_events(after, job_id=None, render_task=None, interval=EVENTS_POLL_INTERVAL,
+                     timeout=EVENTS_STREAM_TIMEOUT, keepalive=15):
+    """
+    Flux server-sent events du tableau de bord à partir de la modification numéro after :
+    - task : {seq, op (insert|update|done|delete), id, status, task, html (carte rendue par render_task)},
+      avec seq comme id d'événement pour la reprise (Last-Event-ID) ;
+    - sync : état de la synchronisation en cours (ou du job job_id), puis son état final ;
+    - reset : modifications perdues (journal purgé), la page doit être rechargée.
+    Chaque tour ne lit que le journal au-delà de after : le coût ne dépend pas du nombre de tâches.
+    """
+    deadline = time.monotonic() + timeout
+    quiet_since = time.monotonic()
+    last_job = None
+    # Délai de reconnexion du navigateur à la fin du flux (en millisecondes)
+    yield "retry: 2000\n\n"
+    while time.monotonic() < deadline:
+        changes = get_task_changes(after)
+        if changes is None:
+            yield sse({'after': after}, event='reset')
+            return
+        for change in changes:
+            if render_task and change['task']:
+                change['html'] = render_task(change['task'])
+            yield sse(change, event='task', event_id=change['seq'])
+            after = change['seq']
+        sent = bool(changes)
+
+        job = get_active_sync_job() or (get_sync_job(job_id) if job_id else None)
+        if job is not None and job != last_job:
+            yield sse(job, event='sync')
+            last_job = job
+            sent = True
+        job_id = job['id'] if job is not None and job['status'] not in FINISHED_STATUSES else None
+
+        if sent:
+            quiet_since = time.monotonic()
+        elif time.monotonic() - quiet_since > keepalive:
+            # Commentaire SSE : garde la connexion ouverte à travers les proxys
+            yield ": ping\n\n"
+            quiet_since = time.monotonic()
+        if len(changes) < TASK_CHANGES_BATCH:
+            time.sleep(interval)
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_job_runner():
+    """Runner partagé par l'application"""
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = SyncJobRunner()
+        return _runner
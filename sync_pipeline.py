@@ -0,0 +1,330 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from email_reader import EmailReader
+from ai_extractor import extract_tasks_concurrently
+from config import SYNC_INGEST_BATCH_SIZE
+from database import filter_unprocessed, email_keys, ingest_batch, find_threads, message_key
+from database import get_accounts, mark_account_synced, save_sync_run
+from imap_pool import IMAPConnectionManager, get_connection_manager
+from metrics import metrics
+from preclassifier import preclassifier
+from sync_scheduler import SyncScheduler
+
+logger = logging.getLogger(__name__)
+
+_reader = None
+_account_readers = {}
+_readers_lock = threading.Lock()
+
+
+def get_reader():
+    """Lecteur partagé : les sessions IMAP restent ouvertes entre deux synchronisations"""
+    global _reader
+    if _reader is None:
+        _reader = EmailReader()
+    return _reader
+
+
+def get_account_reader(account):
+    """
+    Lecteur d'un compte, avec son propre pool de max_connections sessions ;
+    recréé si les paramètres de connexion du compte ont changé
+    """
+    settings = (account['imap_server'], account['imap_port'], account['email_address'], account['password_env'],
+                account['use_ssl'], account['max_connections'])
+    with _readers_lock:
+        cached = _account_readers.get(account['id'])
+        if cached and cached[0] == settings:
+            return cached[1]
+        if cached:
+            cached[1].disconnect()
+        shared = get_connection_manager()
+        if settings[:5] == (shared.host, shared.port, shared.user, 'EMAIL_PASSWORD', shared.use_ssl):
+            # Compte du .env : mêmes sessions que le lecteur principal (et l'IDLE)
+            manager = shared
+        else:
+            manager = IMAPConnectionManager(account['imap_server'], account['imap_port'], account['email_address'],
+                                            os.getenv(account['password_env']), account['use_ssl'],
+                                            pool_size=account['max_connections'])
+        reader = EmailReader(manager=manager, account_id=account['id'])
+        _account_readers[account['id']] = (settings, reader)
+        return reader
+
+
+def fetch_accounts(accounts, scheduler=None):
+    """
+    Relève en parallèle les dossiers de tous les comptes (SyncScheduler) ; la durée
+    suit la boîte la plus chargée plutôt que la somme des boîtes.
+    Retourne (emails pertinents, watermarks proposés par boîte, à enregistrer avec les emails)
+    """
+    def fetch(account, folder):
+        return get_account_reader(account).search_emails(mark_as_read=True, mailbox=folder)
+
+    emails = []
+    watermarks = []
+    failed = set()
+    for account, folder, result, error in (scheduler or SyncScheduler()).run(accounts, fetch):
+        if error is not None:
+            failed.add(account['id'])
+            continue
+        result, watermark = result
+        logger.info(f"📂 {account['name']}/{folder}: {len(result)} emails pertinents")
+        for email_msg in result:
+            email_msg['account_id'] = account['id']
+            email_msg['mailbox'] = folder
+        emails.extend(result)
+        if watermark is not None:
+            watermarks.append(dict(watermark, account_id=account['id']))
+    for account in accounts:
+        if account['id'] not in failed:
+            mark_account_synced(account['id'])
+    return emails, watermarks
+
+
+class WatermarkTracker:
+    """
+    Watermarks des boîtes relevées, avancés au fil des lots enregistrés : jamais au-delà
+    du premier email pertinent pas encore enregistré. Un email dont l'extraction ou
+    l'enregistrement échoue reste au-dessus du watermark et sera relu au prochain passage.
+    """
+
+    def __init__(self, watermarks, emails):
+        self.watermarks = {(w['account_id'], w['mailbox']): w for w in watermarks}
+        self.waiting = {key: [] for key in self.watermarks}  # UID en attente, triés
+        for email_msg in emails:
+            key = (email_msg.get('account_id'), email_msg.get('mailbox'))
+            if key in self.waiting and email_msg.get('uid') is not None:
+                self.waiting[key].append(email_msg['uid'])
+        for uids in self.waiting.values():
+            uids.sort()
+        self.position = dict.fromkeys(self.watermarks, 0)
+        self.stored = set()
+        self.saved = {}
+
+    def _first_waiting(self, key, stored):
+        uids = self.waiting[key]
+        position = self.position[key]
+        while position < len(uids) and ((*key, uids[position]) in self.stored or (*key, uids[position]) in stored):
+            position += 1
+        return position
+
+    def updates(self, entries=()):
+        """Watermarks qui avancent si entries sont enregistrés : [(boîte, uidvalidity, dernier UID, compte)]"""
+        stored = {(e.get('account_id'), e.get('mailbox'), e.get('uid')) for e in entries}
+        updates = []
+        for key, watermark in self.watermarks.items():
+            position = self._first_waiting(key, stored)
+            last_uid = watermark['last_uid']
+            if position < len(self.waiting[key]):
+                last_uid = min(last_uid, self.waiting[key][position] - 1)
+            if self.saved.get(key) != last_uid:
+                updates.append((watermark['mailbox'], watermark['uidvalidity'], last_uid, watermark['account_id']))
+        return updates
+
+    def commit(self, entries, updates):
+        """Après l'enregistrement : entries sont couverts, updates sont les watermarks enregistrés"""
+        self.stored.update((e.get('account_id'), e.get('mailbox'), e.get('uid')) for e in entries)
+        for key in self.watermarks:
+            self.position[key] = self._first_waiting(key, ())
+        for mailbox, _, last_uid, account_id in updates:
+            self.saved[(account_id, mailbox)] = last_uid
+
+
+def format_email(email_msg):
+    """Combine sujet et corps pour l'analyse"""
+    return f"Sujet: {email_msg['subject']}\n\nCorps: {email_msg['body']}"
+
+
+def format_thread(messages):
+    """Nouveaux messages d'une conversation, dans l'ordre d'arrivée, en un seul texte"""
+    if len(messages) == 1:
+        return format_email(messages[0])
+    parts = [f"[{m.get('from', '')}, {m.get('date', '')}]\n{m['body']}" for m in messages]
+    return f"Sujet: {messages[0]['subject']}\n\nConversation:\n" + "\n\n".join(parts)
+
+
+def assign_threads(emails):
+    """
+    Ajoute à chaque email sa clé de conversation ('thread') : identifiant Gmail
+    (X-GM-THRID), sinon fil déjà connu d'un message cité, sinon premier message
+    de References / In-Reply-To. Les emails sont traités dans l'ordre d'arrivée :
+    une réponse retrouve le fil d'un message du même lot.
+    """
+    def cited(email_msg):
+        ids = list(email_msg.get('references') or [])
+        if email_msg.get('in_reply_to'):
+            ids.append(email_msg['in_reply_to'])
+        return [message_key(i) for i in ids]
+
+    def own(email_msg):
+        return message_key(email_msg['message_id']) if email_msg.get('message_id') else None
+
+    known = find_threads([k for e in emails for k in cited(e) + [own(e)] if k])
+    for email_msg in emails:
+        keys = cited(email_msg)
+        if email_msg.get('gm_thread_id'):
+            thread = f"gm:{email_msg['gm_thread_id']}"
+        else:
+            thread = next((known[k] for k in reversed(keys + [own(email_msg)]) if k in known), None)
+            thread = thread or (keys[0] if keys else own(email_msg))
+        email_msg['thread'] = thread
+        if own(email_msg):
+            known[own(email_msg)] = thread
+
+
+def group_by_thread(emails):
+    """Listes d'emails d'une même conversation (un email sans fil forme son propre groupe)"""
+    groups = {}
+    for index, email_msg in enumerate(emails):
+        groups.setdefault(email_msg.get('thread') or f"email:{index}", []).append(email_msg)
+    return list(groups.values())
+
+
+def run_sync(progress=None, accounts=None, job_id=None):
+    """
+    Pipeline de synchronisation : emails de tous les comptes actifs (ou de accounts)
+    -> IA -> base. progress(compteurs) est appelé après chaque lot enregistré.
+    Un résumé (compteurs, tokens, durée par étape) est enregistré dans sync_runs.
+    """
+    started_at = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    start = time.perf_counter()
+    before = metrics.snapshot()
+    try:
+        stats = _run_sync(progress, accounts)
+    except Exception as e:
+        metrics.inc('syncs', status='error')
+        record_sync_run(job_id, 'error', started_at, start, before, {}, message=str(e))
+        raise
+    metrics.inc('syncs', status='done')
+    record_sync_run(job_id, 'done', started_at, start, before, stats)
+    return stats
+
+
+def record_sync_run(job_id, status, started_at, start, before, stats, message=None):
+    """Résumé d'une synchronisation : compteurs du pipeline et écart des métriques depuis son début"""
+    stages, counters, detailed = metrics.delta(before)
+    try:
+        save_sync_run(
+            job_id=job_id, status=status, started_at=started_at, duration_s=round(time.perf_counter() - start, 3),
+            emails_seen=counters.get('emails_seen', 0), relevant=stats.get('total', 0),
+            skipped=stats.get('skipped', 0), filtered=stats.get('filtered', 0),
+            extracted=counters.get('emails_extracted', 0), tasks_added=stats.get('tasks_added', 0),
+            tasks_updated=stats.get('tasks_updated', 0), fallback_tasks=counters.get('fallback_tasks', 0),
+            errors=stats.get('errors', 0), llm_requests=counters.get('llm_requests', 0),
+            prompt_tokens=detailed.get(('llm_tokens', ('type', 'prompt')), 0),
+            completion_tokens=detailed.get(('llm_tokens', ('type', 'completion')), 0),
+            stage_seconds=stages, message=message,
+        )
+    except Exception as e:
+        logger.warning(f"⚠️ Résumé de synchronisation non enregistré: {e}")
+
+
+def _run_sync(progress, accounts):
+    stats = {'total': 0, 'processed': 0, 'tasks_added': 0, 'tasks_updated': 0, 'skipped': 0, 'filtered': 0,
+             'errors': 0}
+
+    def report():
+        if progress:
+            progress(dict(stats))
+
+    accounts = get_accounts(enabled_only=True) if accounts is None else accounts
+    if not accounts:
+        logger.warning("📭 Aucun compte IMAP actif")
+    emails, watermarks = fetch_accounts(accounts)
+    stats['total'] = len(emails)
+    report()
+    watermarks = WatermarkTracker(watermarks, emails)
+
+    # Résultats en attente d'écriture : chaque lot est enregistré en une transaction,
+    # tâches, emails traités et watermarks ensemble (après un crash, rien n'est perdu :
+    # les emails pas encore enregistrés sont relus au prochain passage)
+    buffer = []
+
+    def flush(counter='processed'):
+        updates = watermarks.updates(buffer)
+        if not buffer and not updates:
+            return
+        try:
+            with metrics.timer('insert'):
+                result = ingest_batch(buffer, updates)
+            watermarks.commit(buffer, updates)
+            for outcome in ('added', 'merged', 'updated'):
+                metrics.inc('tasks', result[f'tasks_{outcome}'], result=outcome)
+            stats[counter] += result['processed']
+            stats['tasks_added'] += result['tasks_added']
+            stats['tasks_updated'] += result['tasks_updated']
+            stats['skipped'] += result['skipped']
+        except Exception as e:
+            logger.error(f"⚠️ Erreur d'enregistrement d'un lot de {len(buffer)} emails: {e}")
+            stats['errors'] += len(buffer)
+        buffer.clear()
+        report()
+
+    # Vérifier en une requête indexée quels emails ont déjà été traités, puis
+    # écarter ceux que le pré-classifieur juge non actionnables (sans appel à l'IA)
+    with metrics.timer('dedup'):
+        keys = [email_keys(email_msg) for email_msg in emails]
+        unprocessed = set(filter_unprocessed([k for pair in keys for k in pair]))
+        fresh = []
+        known = []
+        for email_msg, (key, legacy) in zip(emails, keys):
+            if key not in unprocessed or legacy not in unprocessed:
+                logger.info(f"📧 Email déjà traité: {email_msg['subject'][:50]}...")
+                stats['skipped'] += 1
+                known.append(email_msg)
+                continue
+            fresh.append(email_msg)
+        # Déjà enregistrés lors d'un passage précédent : ne retiennent plus le watermark
+        watermarks.commit(known, ())
+        assign_threads(fresh)
+    metrics.inc('emails_skipped', stats['skipped'])
+    
+    # Un appel IA par conversation, sur ses seuls nouveaux messages : la tâche
+    # déjà associée au fil est mise à jour au lieu d'en créer une par réponse
+    grouped = group_by_thread(fresh)
+    if len(grouped) < len(fresh):
+        logger.info(f"🧵 {len(fresh)} emails regroupés en {len(grouped)} conversations")
+
+    # Le pré-classifieur évalue le texte envoyé à l'IA (format_thread), celui sur
+    # lequel il est entraîné (source_text) ; exemples comptés une fois par synchronisation
+    threads = []
+    contents = []
+    with metrics.timer('filter'):
+        preclassifier.refresh()
+        for messages in grouped:
+            content = format_thread(messages)
+            extract, score = preclassifier.should_extract(content)
+            if extract:
+                threads.append(messages)
+                contents.append(content)
+            else:
+                logger.info(f"🚫 Écarté par le pré-classifieur ({score:.2f}): {messages[0]['subject'][:50]}")
+                buffer.extend(dict(email_msg, tasks=None) for email_msg in messages)
+    pending = sum(len(messages) for messages in threads)
+    metrics.inc('emails_filtered', len(fresh) - pending, reason='preclassifier')
+    metrics.inc('emails_extracted', pending)
+    flush(counter='filtered')
+    report()
+
+    def store(index, tasks):
+        # Une conversation dont l'appel a échoué n'est pas marquée et retient le watermark de
+        # sa boîte : elle sera relue et retentée au prochain passage ; une liste vide la marque
+        # traitée sans créer de tâche
+        if tasks is None:
+            stats['errors'] += len(threads[index])
+        else:
+            *earlier, latest = threads[index]
+            buffer.extend(dict(email_msg, tasks=None) for email_msg in earlier)
+            buffer.append(dict(latest, tasks=tasks, source_text=contents[index]))
+        if len(buffer) >= SYNC_INGEST_BATCH_SIZE:
+            flush()
+
+    # Extraction IA en parallèle
+    extract_tasks_concurrently(contents, on_result=store)
+    flush()
+
+    logger.info(f"🎉 Synchronisation terminée: {stats}")
+    return stats
@@ -0,0 +1,84 @@
+import logging
+import threading
+from collections import deque
+from config import SYNC_ACCOUNT_WORKERS
+
+logger = logging.getLogger(__name__)
+
+
+class SyncScheduler:
+    """
+    Répartit les dossiers de plusieurs comptes entre des workers : les comptes
+    avancent en parallèle, chacun avec au plus max_connections dossiers en cours
+    (ses sessions IMAP), et les comptes sont servis à tour de rôle pour qu'un
+    compte aux nombreux dossiers ne retarde pas les autres.
+    """
+
+    def __init__(self, workers=SYNC_ACCOUNT_WORKERS):
+        self.workers = max(1, workers)
+
+    def run(self, accounts, job):
+        """
+        Exécute job(compte, dossier) pour chaque dossier de chaque compte.
+        Retourne [(compte, dossier, résultat, exception ou None)] dans l'ordre de fin.
+        """
+        ring = deque()
+        limits = {}
+        results = []
+        for account in accounts:
+            if not account['folders']:
+                continue
+            try:
+                limits[account['id']] = max(1, int(account['max_connections']))
+            except (TypeError, ValueError) as e:
+                # Compte mal configuré : ses dossiers sont signalés en échec, les autres comptes continuent
+                logger.error(f"💥 Compte {account['name']}: max_connections invalide ({account['max_connections']!r})")
+                results.extend((account, folder, None, e) for folder in account['folders'])
+                continue
+            ring.append((account, deque(account['folders'])))
+        remaining = sum(len(folders) for _, folders in ring)
+        in_flight = {account['id']: 0 for account, _ in ring}
+        condition = threading.Condition()
+
+        def next_item():
+            # Premier compte du tour qui a encore un dossier et une session libre
+            for _ in range(len(ring)):
+                account, folders = ring[0]
+                ring.rotate(-1)
+                if folders and in_flight[account['id']] < limits[account['id']]:
+                    return account, folders.popleft()
+            return None
+
+        def worker():
+            nonlocal remaining
+            while True:
+                with condition:
+                    item = None
+                    while item is None:
+                        if remaining == 0:
+                            return
+                        item = next_item()
+                        if item is None:
+                            condition.wait()
+                    remaining -= 1
+                    in_flight[item[0]['id']] += 1
+
+                account, folder = item
+                try:
+                    result, error = job(account, folder), None
+                except Exception as e:
+                    logger.error(f"💥 Synchronisation de {account['name']}/{folder} en échec: {e}")
+                    result, error = None, e
+
+                with condition:
+                    in_flight[account['id']] -= 1
+                    results.append((account, folder, result, error))
+                    condition.notify_all()
+
+        threads = [threading.Thread(target=worker, name=f'sync-account-{i}')
+                   for i in range(min(self.workers, remaining))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
@@ -0,0 +1,136 @@
+from datetime import datetime
+
+# Schéma des tâches extraites par l'IA : chaque champ a un validateur qui
+# retourne la valeur normalisée ou lève ValueError avec la raison du refus
+# (reprise telle quelle dans la relance adressée au modèle)
+
+PRIORITIES = ('basse', 'moyenne', 'haute')
+PRIORITY_ALIASES = {
+    'urgent': 'haute', 'urgente': 'haute', 'élevée': 'haute', 'elevee': 'haute', 'high': 'haute',
+    'normal': 'moyenne', 'normale': 'moyenne', 'moyen': 'moyenne', 'medium': 'moyenne',
+    'faible': 'basse', 'bas': 'basse', 'low': 'basse',
+}
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y', '%Y/%m/%d')
+EMPTY_VALUES = ('', 'null', 'none', 'n/a', 'aucune', 'aucun')
+MAX_TASK_CHARS = 200
+
+
+def _is_empty(value):
+    return value is None or (isinstance(value, str) and value.strip().lower() in EMPTY_VALUES)
+
+
+def parse_tache(value):
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError("description de la tâche manquante")
+    return ' '.join(value.split())[:MAX_TASK_CHARS]
+
+
+def parse_priorite(value):
+    if _is_empty(value):
+        return 'moyenne'
+    priorite = str(value).strip().lower()
+    priorite = PRIORITY_ALIASES.get(priorite, priorite)
+    if priorite not in PRIORITIES:
+        raise ValueError(f"{value!r} n'est pas basse, moyenne ou haute")
+    return priorite
+
+
+def parse_deadline(value):
+    if _is_empty(value):
+        return None
+    text = str(value).strip()
+    # Date ISO éventuellement suivie d'une heure (2025-03-14T18:00)
+    if len(text) > 10 and text[10] in 'T ':
+        text = text[:10]
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).date().isoformat()
+        except ValueError:
+            continue
+    raise ValueError(f"{value!r} n'est pas une date au format YYYY-MM-DD")
+
+
+def parse_info(value):
+    if _is_empty(value):
+        return ''
+    if isinstance(value, (list, tuple)):
+        return ' ; '.join(str(item) for item in value)
+    return str(value)
+
+
+TASK_FIELDS = {
+    'tache': parse_tache,
+    'priorite': parse_priorite,
+    'deadline': parse_deadline,
+    'info': parse_info,
+}
+
+# Valeurs retenues pour un champ resté invalide après relance (pas de tâche sans description)
+FIELD_DEFAULTS = {'priorite': 'moyenne', 'deadline': None, 'info': ''}
+
+
+def validate_task(item):
+    """
+    Valide un élément de réponse champ par champ.
+    Retourne (champs valides normalisés, {champ invalide: raison}).
+    """
+    if not isinstance(item, dict):
+        return {}, {'tache': "objet tâche attendu"}
+    task, errors = {}, {}
+    for field, parse in TASK_FIELDS.items():
+        try:
+            task[field] = parse(item.get(field))
+        except ValueError as e:
+            errors[field] = str(e)
+    return task, errors
+
+
+def fix_fields(task, errors, correction):
+    """Applique une correction du modèle aux seuls champs invalides ; retourne les champs corrigés"""
+    fixed = []
+    for field in list(errors):
+        if field not in correction:
+            continue
+        try:
+            task[field] = TASK_FIELDS[field](correction[field])
+        except ValueError as e:
+            errors[field] = str(e)
+            continue
+        del errors[field]
+        fixed.append(field)
+    return fixed
+
+
+def complete_task(task):
+    """Tâche finale, champs encore invalides remplacés par leur valeur par défaut ; None sans description"""
+    if 'tache' not in task:
+        return None
+    return {field: task[field] if field in task else FIELD_DEFAULTS[field] for field in TASK_FIELDS}
+
+
+def response_tasks(data):
+    """
+    Éléments de tâche d'une réponse pour un email : {"tasks": [...]}, un tableau,
+    ou un objet tâche seul (format d'avant les tâches multiples) ; None si absent
+    """
+    if isinstance(data, list):
+        return data
+    if isinstance(data, dict):
+        if isinstance(data.get('tasks'), list):
+            return data['tasks']
+        if 'tache' in data:
+            return [data]
+    return None
+
+
+def response_emails(data):
+    """{id: éléments de tâche} d'une réponse groupée {"emails": [{"id", "tasks"}]} (ou tableau d'objets)"""
+    items = data.get('emails') if isinstance(data, dict) else data
+    emails = {}
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict) or item.get('id') is None:
+            continue
+        tasks = response_tasks(item)
+        if tasks is not None:
+            emails.setdefault(str(item['id']).strip(), []).extend(tasks)
+    return emails
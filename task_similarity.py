@@ -0,0 +1,70 @@
+import hashlib
+import re
+import struct
+from config import TASK_LSH_BANDS, TASK_LSH_ROWS
+from keyword_matcher import normalize_text
+
+# Mots vides ignorés : "Envoi du rapport" et "Envoyer le rapport" se rapprochent
+STOPWORDS = {
+    'le', 'la', 'les', 'l', 'un', 'une', 'des', 'du', 'de', 'd', 'et', 'a', 'au', 'aux', 'en', 'pour', 'sur',
+    'the', 'an', 'to', 'of', 'and', 'for', 'on',
+}
+SHINGLE_SIZE = 3
+
+_WORD_RE = re.compile(r'\w+')
+_NUMBER_RE = re.compile(r'\d+')
+
+
+def shingles(text):
+    """Trigrammes de caractères des mots normalisés (sans accents ni mots vides)"""
+    words = [w for w in _WORD_RE.findall(normalize_text(text)) if w not in STOPWORDS]
+    result = set()
+    for word in words:
+        padded = f' {word} '
+        result.update(padded[i:i + SHINGLE_SIZE] for i in range(len(padded) - SHINGLE_SIZE + 1))
+    return result
+
+
+def jaccard(a, b):
+    """Similarité de Jaccard entre deux ensembles de shingles"""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def numbers(text):
+    """Nombres d'un texte : "facture 1042" et "facture 1043" ne sont pas des doublons"""
+    return set(_NUMBER_RE.findall(text))
+
+
+class MinHashLSH:
+    """
+    Signatures MinHash découpées en bandes (LSH) : deux textes de similarité s
+    partagent au moins un bucket avec une probabilité 1 - (1 - s^rows)^bands.
+    """
+
+    def __init__(self, bands=TASK_LSH_BANDS, rows=TASK_LSH_ROWS):
+        self.bands = bands
+        self.rows = rows
+        self._unpack = struct.Struct(f'<{bands * rows}I').unpack
+
+    def signature(self, shingle_set):
+        # Une sortie SHAKE-128 par shingle fournit les bands * rows fonctions de hachage
+        size = self.bands * self.rows * 4
+        hashes = [self._unpack(hashlib.shake_128(s.encode('utf-8')).digest(size)) for s in shingle_set]
+        return [min(column) for column in zip(*hashes)]
+
+    def buckets(self, shingle_set):
+        """Un identifiant de bucket (entier signé 64 bits) par bande"""
+        if not shingle_set:
+            return []
+        signature = self.signature(shingle_set)
+        result = []
+        for band in range(self.bands):
+            rows = signature[band * self.rows:(band + 1) * self.rows]
+            digest = hashlib.blake2b(repr((band, rows)).encode('ascii'), digest_size=8).digest()
+            result.append(int.from_bytes(digest, 'big', signed=True))
+        return result
+
+
+lsh = MinHashLSH()